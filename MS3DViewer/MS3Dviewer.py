@@ -1,113 +1,136 @@
 # Standard library imports
-import socket
 import time
+_start_time = time.perf_counter()
 
-import subprocess
-import sys
+import socket
 
-import base64
+import importlib.metadata
+import importlib.util
+import math
 import os
+import re
+import sys
+import uuid
 
 
 
-def install_requirements(filename='requirements.txt'):
+def check_requirements(filename='requirements.txt'):
     """
-    Install dependencies listed in a requirements text file.
+    Checks that the packages listed in a requirements text file are installed, without running pip.
 
     Parameters:
     - filename (str): The name of the requirements text file. Default is 'requirements.txt'.
 
     Raises:
-    - CalledProcessError: If the installation process fails.
+    - ImportError: If packages are missing. The message contains the pip command that installs them.
 
     Example:
-    install_requirements('requirements.txt')
+    check_requirements('requirements.txt')
     """
     
     script_dir = os.path.dirname(os.path.abspath(__file__))
     requirements_path = os.path.join(script_dir, filename)
 
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", requirements_path])
-
-install_requirements()
+    missing = []
+    with open(requirements_path) as f:
+        for line in f:
+            package = re.split(r'[<>=!~;\[\s#]', line.strip(), maxsplit=1)[0]
+            if not package:
+                continue
+            try:
+                importlib.metadata.distribution(package)
+            except importlib.metadata.PackageNotFoundError:
+                missing.append(package)
+    if missing:
+        raise ImportError(f'Missing packages: {", ".join(missing)}. Install them with: pip install -r {requirements_path}')
+
+
+def lazy_import(name):
+    """
+    Returns a module that is only imported when one of its attributes is first used. Used for the modules that
+    pull in pandas, matplotlib, scipy and Bio.PDB, which are only needed once a workbook is loaded.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+check_requirements()
 
 # Third-party library imports
 
-from dash import Dash, dcc, html, ctx
+from dash import Dash, dcc, html, ctx, no_update
 from dash.dependencies import Input, Output, State
-from tqdm import tqdm
-from matplotlib.colors import LinearSegmentedColormap, Normalize
-import matplotlib.pyplot as plt
+from dash.exceptions import PreventUpdate
 
 # Custom module imports
-import parse_file
-from classes import Protein, Peptide
-from viewer import create_viewer
-import peptide_atlas
-import get_colors
-import info
+from render_cache import RenderCache
+from dataset_store import DatasetStore
+from structure_server import register_structure_route
+from viewer_assets import register_asset_route
+from data_api import API_ROUTE, register_data_api
+from metrics import STAGES, metrics, register_metrics_route, stage
+from profiling import profiled
+from upload_server import CHUNK_SIZE as UPLOAD_CHUNK_SIZE, UPLOAD_ROUTE, get_upload_path, register_upload_route
+classes = lazy_import('classes')
+viewer = lazy_import('viewer')
+atlas_export = lazy_import('atlas_export')
+ingest = lazy_import('ingest')
+shared_dataset = lazy_import('shared_dataset')
+peptide_atlas = lazy_import('peptide_atlas')
+get_colors = lazy_import('get_colors')
+info = lazy_import('info')
+
+ALL_SAMPLES = 'All Samples' # proteome_index.ALL_SAMPLES, repeated so the index is only imported with a dataset
 
 # ######################################################
-    ### Create class objects ###
-
-protein_list = []
-peptide_list = []
-file_path = ''
+    ### Loaded datasets ###
 
-def create_class_objs(workbook,protein_df,protein_index):
-    """
-    Creates instances of Protein and Peptide classes based on data from a workbook.
-
-    Parameters:
-    - workbook (Workbook): The workbook containing protein and peptide data.
-    - protein_df (DataFrame): DataFrame containing protein information.
-    - protein_index (list of int): List containing the starting index of each protein's data in the DataFrame,
-      used to locate and extract relevant peptide data.
+def load_dataset(file_path, dataset_id=None):
+    """Loads a workbook, see dataset.load_dataset. Imported here, so the app starts without pandas, openpyxl and Bio.PDB."""
+    from dataset import load_dataset
+    return load_dataset(file_path, dataset_id=dataset_id)
 
-    Returns:
-    - tuple: A tuple containing:
-        - list: List of Protein objects.
-        - list: List of Peptide objects.
+# Folder the loaded datasets and background job states are shared through when several worker processes serve
+# the app (see wsgi.py), or None when the app runs in one process
+shared_folder = None
 
-    Note:
-    - The Protein and Peptide classes must be defined. 
+def enable_shared_datasets(folder='shared_datasets'):
     """
-    global protein_list
-    global peptide_list
-
-    i=0
-
-    for index, row in protein_df.iterrows():
-        i+=1
-
-        protein = Protein(
-            accession=row['Accession'],
-            total_psms=row['# PSMs']     
-        )
-        protein_list.append(protein)
+    Makes every loaded dataset available to the other worker processes. Uploaded workbooks are saved once to folder
+    as memory-mapped columns, which the other workers open read-only instead of loading their own copy.
+    """
+    global shared_folder
+    shared_folder = folder
 
-        print(f'Protein {protein.accession} {i} of {len(protein_df)}')
+def attach_dataset(dataset_id):
+    """Opens a dataset saved by another worker process, see shared_dataset.open_dataset."""
+    if shared_folder is None:
+        raise KeyError(f'Dataset {dataset_id} is not in the store')
+    return shared_dataset.open_dataset(dataset_id, shared_folder)
 
+# Rendered atlas figures and viewer documents, keyed by dataset id and view parameters
+render_cache = RenderCache()
 
-        protein_peptides = []
-        peptide_df = parse_file.extract_peptide_df(workbook,protein.accession,protein_df,protein_index)
-        # Wrap the pandas iterrows with tqdm for the progress bar
-        for pep_index, pep_row in tqdm(peptide_df.iterrows(), total=peptide_df.shape[0], desc=f'Processing peptides for protein {protein.accession}'):
-            moddict = {}
-            for r in pep_row['Modifications']:
-                moddict[r[0]] = r[1:]  # Creating a dictionary of modifications for each peptide
+# The datasets of all sessions, keyed by the dataset id every session keeps in its 'dataset-id' store
+dataset_store = DatasetStore(loader=load_dataset, on_evict=render_cache.invalidate, attach=attach_dataset)
 
-            peptide = Peptide(protein=protein,  # Creating peptide objects of the class Protein
-                sequence=pep_row['Annotated Sequence'],
-                start_position=int(pep_row['Positions in Proteins'][0]), 
-                end_position=int(pep_row['Positions in Proteins'][1]),
-                modifications=moddict,
-                file_id = pep_row['File ID']
-                )
-            peptide_list.append(peptide)
-            protein_peptides.append(peptide)
-        protein.set_peptides(protein_peptides)
-    return protein_list, peptide_list
+def get_session_dataset(dataset_id):
+    """
+    Returns the dataset of a session from the dataset store. Callbacks are skipped when the session has no dataset,
+    e.g. before the first upload or after a server restart.
+    """
+    if dataset_id is None:
+        raise PreventUpdate
+    try:
+        return dataset_store.get(dataset_id)
+    except KeyError:
+        raise PreventUpdate
 
 
 
@@ -116,6 +139,11 @@ def create_class_objs(workbook,protein_df,protein_index):
 ### Creating the Dash app ###
 
 app = Dash(__name__)
+register_structure_route(app.server)
+register_asset_route(app.server)
+register_upload_route(app.server)
+register_data_api(app.server, dataset_store)
+register_metrics_route(app)
 
 
 def find_available_port(start_port=5050, max_tries=10):
@@ -166,10 +194,11 @@ def view_3d(v):
 
     Note:
     - This function generates an HTML page embedding a 3D viewer object using the provided viewer object.
-    - It assigns a unique identifier to the viewer object for JavaScript interaction.
+    - The page only loads local resources: the model and 3Dmol.js are served by the app itself.
     - JavaScript functions are embedded in the HTML page to interact with the viewer object.
     """
-    v.uniqueid = str(time.time_ns())
+    # _make_html assigns the unique id of the viewer, so it has to run before the id is used below
+    viewer_html = v._make_html()
     js_functions = """
     <script>
         function getViewerState() {
@@ -177,104 +206,225 @@ def view_3d(v):
         }
     </script>
     """
-    return '''<html style="overflow: hidden; height: 100%; width: 100%"> \
-                <head>
-            
-            <script src="http://code.jquery.com/jquery-2.1.3.min.js"></script>
-          
-            <script>
-             "use strict";
-             let myview
-             $(window).load(() => {
-                  document.getElementById("undefined").addEventListener("click", () => console.log( viewer_''' + v.uniqueid + '''.getView()))
-                 })
-            </script>
-        </head>
-     <body style="height: 100%; width: 100%">''' + v._make_html() + js_functions + '</body></html>'
-
-
-
-
-app.layout = html.Div(children=[
-    html.Div(id='upload-section',children=[
-        dcc.Upload(
-            id='upload-data',
-            children=html.Button('Upload File'),
-            multiple=False
-        )
-    ]),
-    html.Div(id='output-data-upload'),
-    html.Div(id='main-layout'),
-    html.Hr()
-])
+    # 3Dmol.js is loaded by the viewer itself, from the app's Assets folder (see viewer_assets.py)
+    return '''<html style="overflow: hidden; height: 100%; width: 100%">
+     <body style="height: 100%; width: 100%; margin: 0">''' + viewer_html + js_functions + '</body></html>'
 
 
-@app.callback(
+
+
+def serve_layout():
+    """
+    Builds the start page. The layout is served per page load, so every browser session gets its own session id.
+    """
+    return html.Div(children=[
+        dcc.Store(id='session-id',data=uuid.uuid4().hex),
+        dcc.Store(id='upload-id'),
+        dcc.Store(id='dataset-id'),
+        dcc.Store(id='ingest-job'),
+        dcc.Store(id='dataset-version'),
+        dcc.Interval(id='ingest-poll',interval=500,disabled=True),
+        html.Div(id='upload-section',children=[
+            html.Button('Upload File',id='upload-btn')
+        ]),
+        html.Div(id='output-data-upload'),
+        html.Label(id='ingest-status'),
+        html.Div(id='main-layout'),
+        html.Hr(),
+        html.Details(id='metrics-panel',children=[
+            html.Summary('Performance'),
+            html.Div(id='metrics-table'),
+            dcc.Interval(id='metrics-poll',interval=5000)
+        ])
+    ])
+
+app.layout = serve_layout
+
+
+# Uploads the chosen file to the upload route in chunks (see upload_server.py), so it is streamed to disk instead of
+# passing through the callback as one base64 string. An interrupted upload resumes from the bytes already received
+# when the same file is chosen again.
+app.clientside_callback(
+    """
+    async function(n_clicks, sessionId) {
+        var file = await new Promise(function(resolve) {
+            var input = document.createElement('input');
+            input.type = 'file';
+            input.onchange = function() { resolve(input.files[0]); };
+            input.oncancel = function() { resolve(null); };
+            input.click();
+        });
+        if (!file) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }
+        // The upload id only depends on the file, so choosing the same file again resumes its upload
+        var key = file.name + ':' + file.size + ':' + file.lastModified;
+        var hash = 0x811c9dc5;
+        for (var i = 0; i < key.length; i++) {
+            hash = Math.imul(hash ^ key.charCodeAt(i), 0x01000193) >>> 0;
+        }
+        var uploadId = hash.toString(16) + file.size.toString(16);
+        var url = '""" + UPLOAD_ROUTE + """/' + sessionId + '/' + uploadId;
+        var offset = null;
+        var retries = 0;
+        while (true) {
+            try {
+                if (offset === null) {
+                    offset = (await (await fetch(url)).json()).offset;
+                }
+                if (offset >= file.size) {
+                    break;
+                }
+                window.dash_clientside.set_props('output-data-upload', {
+                    children: 'Uploading ' + file.name + ': ' + Math.floor(100 * offset / file.size) + '%'
+                });
+                var chunk = file.slice(offset, offset + """ + str(UPLOAD_CHUNK_SIZE) + """);
+                offset = (await (await fetch(url + '?offset=' + offset, {method: 'PUT', body: chunk})).json()).offset;
+                retries = 0;
+            } catch (error) {
+                if (++retries > 5) {
+                    return ['Upload interrupted, choose the file again to resume.', window.dash_clientside.no_update];
+                }
+                await new Promise(function(resolve) { setTimeout(resolve, 1000 * retries); });
+                offset = null;
+            }
+        }
+        var response = await fetch(url + '/complete?name=' + encodeURIComponent(file.name) + '&size=' + file.size, {method: 'POST'});
+        var result = await response.json();
+        if (!response.ok) {
+            return ['Upload failed: ' + result.error, window.dash_clientside.no_update];
+        }
+        return ['File uploaded: ' + result.name + ' (SHA-256 ' + result.sha256 + ').', uploadId];
+    }
+    """,
     Output('output-data-upload', 'children'),
-    Input('upload-data', 'contents'),
-    State('upload-data', 'filename')
+    Output('upload-id', 'data'),
+    Input('upload-btn', 'n_clicks'),
+    State('session-id', 'data'),
+    prevent_initial_call = True
 )
-def save_upload(contents,filename):
+
+
+@app.callback(
+        Output('ingest-job','data'),
+        Output('ingest-poll','disabled'),
+        Output('ingest-status','children'),
+        Output('main-layout','children'),
+        Output('dataset-id','data'),
+        Input('upload-id', 'data'),
+        State('session-id','data'),
+        State('ingest-job','data'),
+        State('dataset-id','data')
+)
+def start_ingest(upload_id,session_id,previous_job_id,previous_dataset_id):
     """
-    Process the uploaded file contents and save it to a local directory.
-    
+    Queues the load of the uploaded workbook on a background worker and starts polling for it. The dataset the
+    session showed before is dropped from the store, and a load still running for the session is cancelled.
+
     Args:
-        contents (str): Base64 encoded contents of the file.
-        filename (str): Name of the file to be saved.
+        upload_id (str): Id of the finished upload of the workbook. Its path stays on the server, see
+            upload_server.get_upload_path.
+        session_id (str): Id of the browser session.
+        previous_job_id (str): The ingest job of the session, if any.
+        previous_dataset_id (str): Id of the dataset the session showed before, if any.
 
     Returns:
-        A layout component showing the main application layout if a file is uploaded,
-        otherwise a message indicating no file has been uploaded.
+        tuple: The ingest job id, the disabled state of the poll interval, a status message, the emptied main
+        layout and the emptied dataset id.
     """
-    global file_path
+    if upload_id is None:
+        return no_update, no_update, no_update, no_update, no_update
+    try:
+        file_path = get_upload_path(session_id, upload_id)
+    except ValueError as error:
+        return no_update, no_update, str(error), no_update, no_update
+    if previous_job_id is not None:
+        ingest.cancel_ingest(previous_job_id)
+    if previous_dataset_id is not None:
+        dataset_store.remove(previous_dataset_id)
+        if shared_folder is not None:
+            shared_dataset.remove_dataset(previous_dataset_id, shared_folder)
+    job_id = ingest.submit_ingest(file_path, dataset_store, shared_folder=shared_folder)
+    return job_id, False, 'Reading workbook...', None, None
 
-    if contents is not None:
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        file_path = os.path.join('uploaded_files', filename)
 
-        if not os.path.exists('uploaded_files'):
-            os.makedirs('uploaded_files')
+@app.callback(
+        Output('main-layout','children',allow_duplicate=True),
+        Output('dataset-id','data',allow_duplicate=True),
+        Output('upload-section','children'),
+        Output('ingest-poll','disabled',allow_duplicate=True),
+        Output('ingest-status','children',allow_duplicate=True),
+        Output('dataset-version','data'),
+        Input('ingest-poll','n_intervals'),
+        State('ingest-job','data'),
+        State('dataset-id','data'),
+        prevent_initial_call = True
+)
+def poll_ingest(n_intervals,job_id,dataset_id):
+    """
+    Reports the progress of the running ingest job. The main layout is shown as soon as the first protein is loaded,
+    and the other proteins are added to it once the whole workbook is loaded.
 
-        with open(file_path, 'wb') as f:
-            f.write(decoded)
-        
-        return html.Div([f"""File uploaded: {file_path}."""])
-    return html.Div(['No file uploaded.'])
+    Args:
+        n_intervals (int): Number of times the poll interval has fired.
+        job_id (str): The ingest job id.
+        dataset_id (str): Id of the dataset the main layout shows, or None if it is not shown yet.
+
+    Returns:
+        tuple: The main layout, the dataset id, the upload section, the disabled state of the poll interval,
+        a status message and the version of the dataset shown.
+    """
+    if job_id is None:
+        return no_update, no_update, no_update, True, no_update, no_update
+
+    status, result = ingest.get_ingest_status(job_id, shared_folder=shared_folder)
+    if status == 'failed':
+        return no_update, no_update, no_update, True, f'Loading failed: {result}', no_update
+    elif status == 'cancelled':
+        return no_update, no_update, no_update, True, 'Loading cancelled.', no_update
+    elif status == 'running':
+        if dataset_id is None and result.first_protein_ready:
+            dataset = get_session_dataset(result.partial_dataset_id)
+            return main_app_layout(dataset), dataset.dataset_id, no_update, no_update, result.describe(), 'partial'
+        return no_update, no_update, no_update, no_update, result.describe(), no_update
+
+    dataset = get_session_dataset(result.dataset_id)
+    main_layout = main_app_layout(dataset) if dataset_id is None else no_update
+    return main_layout, dataset.dataset_id, html.Div(['File Uploaded', html.Br(), f'Data API: {API_ROUTE}/datasets/{dataset.dataset_id}']), True, None, 'complete'
 
 
 @app.callback(
-        Output('main-layout','children'),
-        Output('upload-section','children'),
-        Input('output-data-upload', 'children')
+        Output('accession-dropdown','options'),
+        Input('dataset-version','data'),
+        State('dataset-id','data'),
+        prevent_initial_call = True
 )
-def get_main_layout(content):
-    if not content==html.Div(['No file uploaded.']) and not file_path=='':
-        return main_app_layout(file_path),html.Div('File Uploaded')
+def update_accession_options(version,dataset_id):
+    """
+    Lists all accession numbers in the accession dropdown once the whole workbook is loaded. While it loads,
+    the dropdown only holds the first protein.
+    """
+    if version != 'complete':
+        raise PreventUpdate
+    return get_session_dataset(dataset_id).accession_numbers
 
 
 
-def main_app_layout(file_path):
+@profiled()
+def main_app_layout(dataset):
     """
     Generate the main application layout based on the contents of the uploaded file.
     
     Args:
-        file_path (str): The path to the uploaded file processed for visualization.
+        dataset (Dataset): The dataset loaded from the uploaded file.
 
     Returns:
         An HTML component containing the visual layout elements for protein and peptide data visualization.
     """
     ## workbook ##
-    global protein_list
-    global peptide_list
-    global samples_in_file
-    workbook = parse_file.open_workbook(file_path)
-    protein_df, protein_index, accession_numbers = info.get_protein(workbook)
-
-
-    samples_in_file = info.get_samples_in_file(workbook)
-
-    protein_list,peptide_list= create_class_objs(workbook=workbook,protein_df=protein_df,protein_index=protein_index)
+    protein_list = dataset.protein_list
+    samples_in_file = dataset.samples_in_file
+    accession_numbers = dataset.accession_numbers
 
 
     mod_in_fst_protein = []
@@ -335,6 +485,8 @@ def main_app_layout(file_path):
                     # srcDoc = view_3d(create_viewer(protein_list[0],protein_list[0].peptides,nterm=False)),
                     id='molView', 
                     style={'width': '100%', 'height': '650px'}),
+                dcc.Store(id='viewer-colors'),
+                dcc.Store(id='viewer-scene'),
                 html.Div(id='color_bars')
             ],style={'width': '64%'}),
             
@@ -347,22 +499,72 @@ def main_app_layout(file_path):
         html.Button('Reset zoom',id='Zoom-reset',style = {'font-family': 'Georgia','font-size':'16px'}),
         html.Div(id='Click-data',style={'display':'none'}),
         html.Div([
-            dcc.Graph(figure= peptide_atlas.peptide_atlas(protein_list[0].peptides,nterm=False)[0],id='pepView', style={'width': '100%', 'height': '700px'})
-        ])
+            dcc.Graph(figure= peptide_atlas.lod_peptide_atlas(protein_list[0].peptides,nterm=False)[0],id='pepView', style={'width': '100%', 'height': '700px'}),
+            dcc.Store(id='atlas-window')
+        ]),
+        html.Div([
+            dcc.Dropdown(list(atlas_export.EXPORT_FORMATS),'Excel',id='atlas-export-format',clearable=False,style={'width':'200px'}),
+            html.Button('Export peptide atlas',id='atlas-export-btn',style = {'font-family': 'Georgia','font-size':'16px'}),
+            html.Label(id='atlas-export-status'),
+            dcc.Store(id='atlas-export-job'),
+            dcc.Interval(id='atlas-export-poll',interval=500,disabled=True),
+            dcc.Download(id='atlas-export-download')
+        ]),
+        html.Hr(),
+        html.H3('Export site table'),
+        dcc.Dropdown(['Parquet','CSV'],'Parquet',id='site-export-format',clearable=False,style={'width':'200px'}),
+        html.Button('Export sites',id='site-export-btn',style = {'font-family': 'Georgia','font-size':'16px'}),
+        html.Label(id='site-export-status'),
+        dcc.Store(id='site-export-job'),
+        dcc.Interval(id='site-export-poll',interval=500,disabled=True),
+        dcc.Download(id='site-export-download')
     ])
 
 
 
 
 
+@app.callback(
+    Output('atlas-window','data'),
+    Input('pepView','relayoutData'),
+    State('accession-dropdown','value'),
+    prevent_initial_call = True
+)
+def update_atlas_window(relayout_data,accession):
+    """
+    Keeps track of the residue range visible in the peptide atlas, so the atlas can be redrawn at the matching level of detail.
+
+    Args:
+        relayout_data (dict): The relayout event of the atlas graph.
+        accession (str): The accession number of the protein shown in the atlas.
+
+    Returns:
+        dict: The accession and the visible [first, last] position, or None as range when the atlas is zoomed out fully.
+    """
+    if relayout_data is None:
+        return no_update
+    if 'xaxis.range[0]' in relayout_data:
+        lo, hi = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        lo, hi = relayout_data['xaxis.range']
+    elif relayout_data.get('xaxis.autorange'):
+        return {'accession': accession, 'range': None}
+    else:
+        return no_update
+    return {'accession': accession, 'range': [math.floor(lo), math.ceil(hi)]}
+
+
 @app.callback(
     Output('pepView','figure'),
     Input('accession-dropdown','value'),
     Input('remove-met-check','value'),
     Input('show-nterm-check','value'),
-    Input('sample-dropdown','value')
+    Input('sample-dropdown','value'),
+    Input('atlas-window','data'),
+    State('dataset-id','data')
 )
-def update_peptide_atlas(accession,remove_m1,nterm,sample):
+@profiled()
+def update_peptide_atlas(accession,remove_m1,nterm,sample,atlas_window,dataset_id):
     """
     Update the peptide atlas visualization based on the selected accession number, sample, and modification options.
 
@@ -371,14 +573,38 @@ def update_peptide_atlas(accession,remove_m1,nterm,sample):
         remove_m1 (bool): Whether to remove the initial methionine (M1) from the sequence visualization.
         nterm (bool): Whether to show N-terminal modifications in the visualization.
         sample (str): The sample file ID used to filter the peptides. If 'All Samples' is selected, all peptides are shown.
+        atlas_window (dict): The visible range of the atlas, as stored by update_atlas_window.
+        dataset_id (str): Id of the session's dataset in the dataset store.
 
     Returns:
         A plotly graph object representing the updated peptide atlas visualization.
     """
-    
-    for protein in protein_list:
-        if accession == protein.accession:
-            s_protein = protein
+    dataset = get_session_dataset(dataset_id)
+    # The zoom window only applies to the protein it was recorded for
+    window = None
+    if atlas_window is not None and atlas_window['accession'] == accession and atlas_window['range'] is not None:
+        window = tuple(atlas_window['range'])
+
+    key = (dataset.dataset_id, 'atlas', accession, sample, bool(remove_m1), bool(nterm), window)
+    return render_cache.get_or_render(key, lambda: render_peptide_atlas(dataset,accession,remove_m1,nterm,sample,window))
+
+
+def render_peptide_atlas(dataset,accession,remove_m1,nterm,sample,window):
+    """
+    Builds the peptide atlas figure for update_peptide_atlas.
+
+    Args:
+        dataset (Dataset): The dataset of the session.
+        accession (str): The accession number of the protein to display.
+        remove_m1 (bool): Whether to remove the initial methionine (M1) from the sequence visualization.
+        nterm (bool): Whether to show N-terminal modifications in the visualization.
+        sample (str): The sample to show, or 'All Samples'.
+        window (tuple): The visible [first, last] position of the atlas, or None for the whole protein.
+
+    Returns:
+        A plotly graph object representing the peptide atlas.
+    """
+    s_protein = dataset.get_protein(accession)
     
     if sample == 'All Samples':
         peptides = s_protein.peptides
@@ -387,23 +613,20 @@ def update_peptide_atlas(accession,remove_m1,nterm,sample):
         peptides = s_protein.get_peptides_by_file_id(sample)
             
     range_max = len(s_protein.master_sequence) + 1
-    
-    if remove_m1:
-        pa, pg, grouped = peptide_atlas.peptide_atlas(peptides=peptides, gap=1, range_max=range_max,remove_m1=True,nterm=nterm)
-        pa = peptide_atlas.add_modification_legend(pa, grouped, s_protein, remove_m1=True,nterm=nterm)
-    else:
-        pa, pg, grouped= peptide_atlas.peptide_atlas(peptides=peptides, gap=1, range_max=range_max,remove_m1=False,nterm=nterm)
-        pa = peptide_atlas.add_modification_legend(pa, grouped, s_protein, remove_m1=False,nterm=nterm)
-    
+    coverage = dataset.proteome_index.residue_coverage(accession, sample)
+
+    with stage('atlas_build'):
+        pa, grouped = peptide_atlas.lod_peptide_atlas(peptides=peptides, gap=1, range_max=range_max, remove_m1=bool(remove_m1), nterm=nterm, window=window, coverage=coverage)
     return pa
 
 
 @app.callback(
         Output('modifications-container','children'),
         Input('accession-dropdown','value'),
-        Input('show-nterm-check','value')
+        Input('show-nterm-check','value'),
+        State('dataset-id','data')
 )
-def update_modifications_list(accession,nterm):
+def update_modifications_list(accession,nterm,dataset_id):
     """
     Dynamically updates the list of protein modifications available for the selected protein accession number,
     based on whether N-terminal modifications are to be shown.
@@ -411,6 +634,7 @@ def update_modifications_list(accession,nterm):
     Args:
         accession (str): The accession number of the protein for which modifications are to be listed.
         nterm (bool): Flag indicating whether N-terminal modifications should be included.
+        dataset_id (str): Id of the session's dataset in the dataset store.
 
     Returns:
         A Dash HTML component containing a checklist of modifications and an update button.
@@ -420,7 +644,7 @@ def update_modifications_list(accession,nterm):
         return []  # If no accession is selected, return an empty list
     else:
         # Use the selected accession to get modifications options for that protein
-        for protein in protein_list:
+        for protein in get_session_dataset(dataset_id).protein_list:
             if accession == protein.accession:
                 moddict_values = [value for value in protein.get_protein_modification_types(nterm=nterm).values()]
                 for v in moddict_values:
@@ -463,200 +687,376 @@ def update_modifications_list(accession,nterm):
 
 @app.callback(
     Output('molView', 'srcDoc'),
-    Output('view_text','children'),
-    Output('color_bars','children'),
-    Input('apply-modifications-btn', 'n_clicks'),
-    State('modification-input', 'value'),
     Input('accession-dropdown','value'),
-    Input('label-choice','value'),
     Input('remove-met-check','value'),
+    State('dataset-id','data')
+)
+@profiled()
+def update_viewer_page(accession,remove_m1,dataset_id):
+    """
+    Loads the structure of the selected protein in the viewer. The page only depends on the structure; colors,
+    styles, labels and zoom are posted to it by the clientside scene callback below.
+
+    Args:
+        accession (str): Accession number of the protein.
+        remove_m1 (bool): Whether to show the structure without the leader MET.
+        dataset_id (str): Id of the session's dataset in the dataset store.
+
+    Returns:
+        str: The source document of the viewer.
+    """
+    dataset = get_session_dataset(dataset_id)
+    def render():
+        with stage('viewer_build'):
+            return view_3d(viewer.create_viewer_page(dataset.get_protein(accession), remove_m1=bool(remove_m1)))
+    key = (dataset.dataset_id, 'viewer-page', accession, bool(remove_m1))
+    return render_cache.get_or_render(key, render)
+
+
+# Combines the viewer colors computed on the server with the purely visual settings and posts the scene to the viewer
+# page, which applies it in place without reloading the model or resetting the camera
+app.clientside_callback(
+    """
+    function(colors, style, size, residueStyle, residueSize, labels, zoom) {
+        if (!colors) {
+            return window.dash_clientside.no_update;
+        }
+        var range = null;
+        if (zoom) {
+            range = [];
+            for (var resi = zoom[0]; resi <= zoom[1]; resi++) {
+                range.push(resi);
+            }
+        }
+        var scene = Object.assign({}, colors, {
+            style: style, size: size, residue_style: residueStyle, residue_size: residueSize, labels: labels, zoom: range
+        });
+        window.ms3dViewerScene = scene;
+        var frame = document.getElementById('molView');
+        if (frame && frame.contentWindow) {
+            frame.contentWindow.postMessage({type: 'ms3d-scene', scene: scene}, '*');
+        }
+        return scene;
+    }
+    """,
+    Output('viewer-scene','data'),
+    Input('viewer-colors','data'),
     Input('vis_style_selector','value'),
-    Input('vis_color_selector','value'),
     Input('vis_size_selector','value'),
     Input('res_style_selector','value'),
     Input('res_size_selector','value'),
-    Input('Click-data','children'),
+    Input('label-choice','value'),
+    Input('Click-data','children')
+)
+
+
+# The view of the selected protein is computed in stages, each cached under only the inputs it depends on, so that
+# e.g. changing the backbone color scheme only recomputes the viewer colors and not the text and colorbars:
+#   selection (accession, sample) -> statistics (+ nterm) -> shown modifications (+ modifications)
+#   -> viewer colors (+ remove_m1, color scheme), info text (+ remove_m1) and colorbars
+
+def get_view_selection(dataset,accession,sample):
+    """
+    Returns the protein and the peptides shown for the selected sample, with the heading of the information text.
+    """
+    def select():
+        protein = dataset.get_protein(accession)
+        if sample == 'All Samples':
+            return protein, protein.peptides, "## Showing all samples"
+        return protein, protein.get_peptides_by_file_id(sample), f"""## Showing sample {sample}"""
+    key = (dataset.dataset_id, 'selection', accession, sample)
+    return render_cache.get_or_render(key, select)
+
+
+def get_view_statistics(dataset,accession,sample,nterm):
+    """
+    Returns the maximum site PSM count and peptide frequency of the protein, which set the top of the color scales.
+    Color scales are shared by all samples, so for a single sample the maxima are taken over every sample.
+    """
+    proteome_index = dataset.proteome_index
+    samples = [ALL_SAMPLES] if sample == 'All Samples' else dataset.samples_in_file
+    key = (dataset.dataset_id, 'statistics', accession, sample == 'All Samples', bool(nterm))
+    return render_cache.get_or_render(key, lambda: (proteome_index.max_site_psms(accession, samples, nterm), proteome_index.max_peptide_frequency(accession, samples)))
+
+
+def get_shown_modifications(dataset,selected_modifications,accession,sample,nterm):
+    """
+    Returns the selected modifications as a sorted tuple, or an empty tuple if none of them are found in the
+    peptides shown.
+    """
+    if not selected_modifications:
+        return ()
+    selected_modifications = tuple(sorted(selected_modifications))
+    def find():
+        protein, peptidelist, pfound = get_view_selection(dataset,accession,sample)
+        mpd = info.get_peptide_modification_dict(peptidelist,list(selected_modifications),nterm)
+        return selected_modifications if len(mpd.items()) > 0 else ()
+    key = (dataset.dataset_id, 'shown-modifications', accession, sample, bool(nterm), selected_modifications)
+    return render_cache.get_or_render(key, find)
+
+
+@app.callback(
+    Output('viewer-colors', 'data'),
+    Input('apply-modifications-btn', 'n_clicks'),
+    State('modification-input', 'value'),
+    Input('accession-dropdown','value'),
+    Input('remove-met-check','value'),
+    Input('vis_color_selector','value'),
     Input('sample-dropdown','value'),
-    Input('show-nterm-check','value')
+    Input('show-nterm-check','value'),
+    State('dataset-id','data')
 )
-def update_view(n_clicks,selected_modifications,accession,label_choice,remove_m1,visstyle_value,viscolor_value,vissize_value,resstyle_value,ressize_value,peptide_click,sample,nterm,mod_freq_color = 'YlOrRd'):  
+@profiled()
+def update_viewer_colors(n_clicks,selected_modifications,accession,remove_m1,viscolor_value,sample,nterm,dataset_id,mod_freq_color = 'YlOrRd'):
     """
-    Updates the molecular viewer and information tabs based on the user's selections including protein modifications,
-    visual styles, and other visualization settings.
+    Computes the viewer colors for the selected protein, sample, modifications and backbone color scheme. Styles,
+    labels and zoom are applied on the client.
 
     Args:
         n_clicks (int): Number of times the 'apply modifications' button was clicked.
         selected_modifications (list): List of selected modifications to display.
         accession (str): Accession number of the protein.
-        label_choice (str): User's choice for labeling the residues.
         remove_m1 (bool): Whether to remove the first methionine from the visualization.
-        visstyle_value (str): Style of visualization for the molecule (e.g., 'cartoon', 'stick').
         viscolor_value (str): Color scheme for the visualization.
-        vissize_value (float): Size of the backbone in the visualization.
-        resstyle_value (str): Style of visualization for the residues.
-        ressize_value (float): Size of the residues in the visualization.
-        peptide_click (list): Range of residues clicked for zooming.
         sample (str): Sample selection to filter the data.
         nterm (bool): Whether to include N-terminal modifications in the visualization.
+        dataset_id (str): Id of the session's dataset in the dataset store.
         mod_freq_color (str, optional): Color scheme for frequency of modifications (default 'YlOrRd').
 
     Returns:
-        tuple: Contains the updated source document for the molecular viewer and a div with visualization information.
+        dict: The viewer colors, see viewer.get_viewer_scene.
     """
-    visstyle_value = visstyle_value.lower()
-    resstyle_value = resstyle_value.lower()
-    
-    # For each protein in the protein list
-    for protein in protein_list:
-        protein:Protein
-        ## if the accession number of the protein is the chosen accession number, 
-            ### check if the selected modifications are empty or not
-        if protein.accession == accession:
-
-            if sample == 'All Samples':
-                pfound = "## Showing all samples"
-                peptidelist = protein.peptides
-
-                
-                max_psm = 0
-                psm_mod_counts = info.get_modification_counts(peptidelist,nterm)
-                pep_freq = get_colors.get_position_frequency(protein,peptidelist)
-                max_pep_freq = max(pep_freq)
-
-                for key, dict in psm_mod_counts.items():
-                        local_max = max(dict.values())
-                        if local_max > max_psm:
-                            max_psm = local_max
-
-
-
-            else:
-                pfound = f"""## Showing sample {sample}"""
-                peptidelist = protein.get_peptides_by_file_id(sample)
-                max_psm = 0
-                max_pep_freq = 0
-
-                for s in samples_in_file:
-                    samle_peps = protein.get_peptides_by_file_id(s)
-                    psm_mod_counts = info.get_modification_counts(samle_peps,nterm)
-                    pep_freq = get_colors.get_position_frequency(protein,samle_peps)
-
-                    for key, dict in psm_mod_counts.items():
-                        local_max = max(dict.values())
-                        if local_max > max_psm:
-                            max_psm = local_max
-                    if max(pep_freq)>max_pep_freq:
-                        max_pep_freq = max(pep_freq)
-
-            mpd =info.get_peptide_modification_dict(peptidelist,selected_modifications,nterm)
-
-            if not peptide_click == None:
-                zoomto = [x for x in range(peptide_click[0],peptide_click[1]+1)]
-            else:
-                zoomto = None
-            
-            # colorbars = (
-            #     html.Label('Peptide abundance colorbar:'),
-            #     dcc.Graph(figure = get_colors.create_color_fig1(protein,peptidelist,max_pep_freq)),
-            #     html.Label('Residue abundance colorbar:'),
-            #     dcc.Graph(figure = get_colors.create_modcolor_fig1(peptidelist,max_psm,selected_modifications))
-            # )
+    dataset = get_session_dataset(dataset_id)
+    modifications = get_shown_modifications(dataset,selected_modifications,accession,sample,nterm)
+    def render():
+        protein, peptidelist, pfound = get_view_selection(dataset,accession,sample)
+        max_psm, max_pep_freq = get_view_statistics(dataset,accession,sample,nterm)
+        with stage('viewer_build'):
+            return viewer.get_viewer_scene(protein, peptidelist, max_pepfreq_val=max_pep_freq, max_psm=max_psm, nterm=nterm, modifications=list(modifications), color=viscolor_value, remove_m1=bool(remove_m1), mod_freq_color=mod_freq_color)
+    key = (dataset.dataset_id, 'viewer-colors', accession, sample, bool(nterm), modifications, bool(remove_m1), viscolor_value, mod_freq_color)
+    return render_cache.get_or_render(key, render)
 
-            
 
-            ### If the selected modifications are None or the list is empty, set default markdown text, make sure selected modifications is a list, and create the viewer
-            if selected_modifications==None or selected_modifications==[] or len(mpd.items())==0:
-                text = html.Div([
-                            html.H1('Visualizer information'),
-                            dcc.Markdown(pfound),
-                            #dcc.Markdown(f"""#### Selected modification(s): No modifications have been selected""")
-                            dcc.Markdown(f"""#### No modifications have been selected or none of the selected modification types are found""")
-                                ])
-                selected_modifications=[] # make sure that the selected modifications is an empty list and not a None-value
-                
-                colorbars = (
-                    html.Label('Peptide abundance colorbar:'),
-                    dcc.Graph(figure = get_colors.create_color_fig1(protein,peptidelist,max_pep_freq))
-                )
-                #### If the first MET should be removed, create a viewer that has M1 removed
-                if remove_m1:
-                    viewer = create_viewer(protein, peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm,nterm=nterm, modifications=selected_modifications, color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1=True,residue_style=resstyle_value,residue_size=ressize_value ,visstyle = visstyle_value, zoomto=zoomto) # No modifications mapped, leader MET removed
-
-                #### Otherwise, create the viewer as is
-                else:
-                    viewer = create_viewer(protein, peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm,nterm=nterm,modifications=selected_modifications,color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1=False,residue_style=resstyle_value,residue_size=ressize_value,visstyle = visstyle_value, zoomto=zoomto) # No modifications mapped, leader MET present
-                
-                return view_3d(viewer), text,colorbars # Return the created viewer and the default text
+@app.callback(
+    Output('view_text','children'),
+    Input('apply-modifications-btn', 'n_clicks'),
+    State('modification-input', 'value'),
+    Input('accession-dropdown','value'),
+    Input('remove-met-check','value'),
+    Input('sample-dropdown','value'),
+    Input('show-nterm-check','value'),
+    State('dataset-id','data')
+)
+@profiled()
+def update_view_text(n_clicks,selected_modifications,accession,remove_m1,sample,nterm,dataset_id):
+    """
+    Writes the information text about the modifications shown for the selected protein and sample.
+
+    Args:
+        See update_viewer_colors.
+
+    Returns:
+        Div: The information text.
+    """
+    dataset = get_session_dataset(dataset_id)
+    modifications = get_shown_modifications(dataset,selected_modifications,accession,sample,nterm)
+    def render():
+        protein, peptidelist, pfound = get_view_selection(dataset,accession,sample)
+        if len(modifications) == 0:
+            return html.Div([
+                html.H1('Visualizer information'),
+                dcc.Markdown(pfound),
+                dcc.Markdown(f"""#### No modifications have been selected or none of the selected modification types are found""")
+            ])
+        new_text = info.get_modinfo_text(list(modifications),protein,peptidelist,nterm=nterm,remove_m1=bool(remove_m1))
+        return html.Div([
+            html.H1('Visualizer information'),
+            dcc.Markdown(pfound),
+            dcc.Markdown(new_text,style={'overflowY':'scroll','height':'500px'})
+        ])
+    key = (dataset.dataset_id, 'info-text', accession, sample, bool(nterm), modifications, bool(remove_m1))
+    return render_cache.get_or_render(key, render)
+
+
+@app.callback(
+    Output('color_bars','children'),
+    Input('apply-modifications-btn', 'n_clicks'),
+    State('modification-input', 'value'),
+    Input('accession-dropdown','value'),
+    Input('sample-dropdown','value'),
+    Input('show-nterm-check','value'),
+    State('dataset-id','data')
+)
+@profiled()
+def update_color_bars(n_clicks,selected_modifications,accession,sample,nterm,dataset_id):
+    """
+    Draws the peptide abundance colorbar, and the residue abundance colorbar when modifications are shown.
+
+    Args:
+        See update_viewer_colors.
+
+    Returns:
+        tuple: The labels and graphs of the colorbars.
+    """
+    dataset = get_session_dataset(dataset_id)
+    modifications = get_shown_modifications(dataset,selected_modifications,accession,sample,nterm)
+    def render():
+        protein, peptidelist, pfound = get_view_selection(dataset,accession,sample)
+        max_psm, max_pep_freq = get_view_statistics(dataset,accession,sample,nterm)
+        colorbars = (
+            html.Label('Peptide abundance colorbar:'),
+            dcc.Graph(figure = get_colors.create_color_fig1(protein,peptidelist,max_pep_freq))
+        )
+        if len(modifications) > 0:
+            colorbars += (
+                html.Label('Residue abundance colorbar:'),
+                dcc.Graph(figure = get_colors.create_modcolor_fig1(peptidelist,max_psm,list(modifications)))
+            )
+        return colorbars
+    key = (dataset.dataset_id, 'colorbars', accession, sample, bool(nterm), modifications)
+    return render_cache.get_or_render(key, render)
+
+
+@app.callback(
+    Output('atlas-export-job','data'),
+    Output('atlas-export-poll','disabled'),
+    Output('atlas-export-status','children'),
+    Input('atlas-export-btn','n_clicks'),
+    State('accession-dropdown','value'),
+    State('sample-dropdown','value'),
+    State('remove-met-check','value'),
+    State('show-nterm-check','value'),
+    State('atlas-export-format','value'),
+    State('session-id','data'),
+    State('dataset-id','data'),
+    prevent_initial_call = True
+)
+def start_atlas_export(n_clicks,accession,sample,remove_m1,nterm,export_format,session_id,dataset_id):
+    """
+    Queues the export of the peptide atlas table shown for the selected protein and sample on the background worker,
+    and starts polling for it.
+
+    Args:
+        n_clicks (int): Number of times the export button was clicked.
+        accession (str): The accession number of the protein shown in the atlas.
+        sample (str): The sample shown in the atlas, or 'All Samples'.
+        remove_m1 (bool): Whether the leader MET is removed.
+        nterm (bool): Whether N-terminal modifications are shown.
+        export_format (str): 'Excel', 'CSV' or 'Parquet'.
+        session_id (str): Identifier of the browser session.
+        dataset_id (str): Id of the session's dataset in the dataset store.
+
+    Returns:
+        tuple: The export job id, the disabled state of the poll interval and a status message.
+    """
+    protein = get_session_dataset(dataset_id).get_protein(accession)
+    if sample == 'All Samples':
+        peptides = protein.peptides
+    else:
+        peptides = protein.get_peptides_by_file_id(sample)
+    if len(peptides) == 0:
+        return None, True, 'No peptides to export.'
+
+    try:
+        job_id = atlas_export.submit_atlas_export(peptides,nterm=nterm,remove_m1=bool(remove_m1),session_id=session_id,sample=sample,file_format=export_format,shared_folder=shared_folder)
+    except ValueError as error:
+        return None, True, f'Export failed: {error}'
+    return job_id, False, 'Exporting peptide atlas...'
+
+
+@app.callback(
+    Output('atlas-export-download','data'),
+    Output('atlas-export-poll','disabled',allow_duplicate=True),
+    Output('atlas-export-status','children',allow_duplicate=True),
+    Input('atlas-export-poll','n_intervals'),
+    State('atlas-export-job','data'),
+    prevent_initial_call = True
+)
+def poll_atlas_export(n_intervals,job_id):
+    """
+    Checks the running atlas export and sends the file to the browser once it has been written.
+
+    Args:
+        n_intervals (int): Number of times the poll interval has fired.
+        job_id (str): The export job id.
+
+    Returns:
+        tuple: The file to download, the disabled state of the poll interval and a status message.
+    """
+    if job_id is None:
+        return no_update, True, no_update
+
+    status, result = atlas_export.get_export_status(job_id, shared_folder=shared_folder)
+    if status == 'running':
+        return no_update, no_update, no_update
+    elif status == 'failed':
+        return no_update, True, f'Export failed: {result}'
+    return dcc.send_file(result), True, f'Peptide atlas exported to {result}.'
+
+
+@app.callback(
+    Output('site-export-job','data'),
+    Output('site-export-poll','disabled'),
+    Output('site-export-status','children'),
+    Input('site-export-btn','n_clicks'),
+    State('site-export-format','value'),
+    State('show-nterm-check','value'),
+    State('session-id','data'),
+    State('dataset-id','data'),
+    prevent_initial_call = True
+)
+def export_sites(n_clicks,export_format,nterm,session_id,dataset_id):
+    """
+    Queues the export of the site table of the whole dataset to the session's folder in 'exports' on the background
+    worker, and starts polling for it.
+
+    Args:
+        n_clicks (int): Number of times the export button was clicked.
+        export_format (str): 'Parquet' or 'CSV'.
+        nterm (bool): Whether N-terminal modifications are included in the table.
+        session_id (str): Identifier of the browser session.
+        dataset_id (str): Id of the session's dataset in the dataset store.
+
+    Returns:
+        tuple: The export job id, the disabled state of the poll interval and a status message.
+    """
+    dataset = get_session_dataset(dataset_id)
+    try:
+        job_id = atlas_export.submit_site_export(dataset,nterm=bool(nterm),session_id=session_id,file_format=export_format.lower(),shared_folder=shared_folder)
+    except ValueError as error:
+        return None, True, f'Export failed: {error}'
+    return job_id, False, 'Exporting site table...'
+
+
+@app.callback(
+    Output('site-export-download','data'),
+    Output('site-export-poll','disabled',allow_duplicate=True),
+    Output('site-export-status','children',allow_duplicate=True),
+    Input('site-export-poll','n_intervals'),
+    State('site-export-job','data'),
+    prevent_initial_call = True
+)
+def poll_site_export(n_intervals,job_id):
+    """
+    Checks the running site table export and sends the file to the browser once it has been written.
+
+    Args:
+        n_intervals (int): Number of times the poll interval has fired.
+        job_id (str): The export job id.
+
+    Returns:
+        tuple: The file to download, the disabled state of the poll interval and a status message.
+    """
+    if job_id is None:
+        return no_update, True, no_update
+
+    status, result = atlas_export.get_export_status(job_id, shared_folder=shared_folder)
+    if status == 'running':
+        return no_update, no_update, no_update
+    elif status == 'failed':
+        return no_update, True, f'Export failed: {result}'
+    return dcc.send_file(result), True, f'Site table exported to {result}.'
 
-        
-            ### If the selected modifications is not empty and not None    
-            else:
-                merged_mods = info.get_peptide_modification_dict(protein.peptides,selected_modifications,nterm=nterm)    
-                merged_mods1 = info.get_peptide_modification_dict(peptidelist,selected_modifications,nterm=nterm) 
-                #### If M1 SHOULD be removed
-                colorbars = (
-                    html.Label('Peptide abundance colorbar:'),
-                    dcc.Graph(figure = get_colors.create_color_fig1(protein,peptidelist,max_pep_freq)),
-                    html.Label('Residue abundance colorbar:'),
-                    dcc.Graph(figure = get_colors.create_modcolor_fig1(peptidelist,max_psm,selected_modifications))
-                )
-                if remove_m1:
-
-                    new_text = info.get_modinfo_text(selected_modifications,protein,peptidelist,nterm=nterm,remove_m1=True)                                           
-                        
-                    ##### If only one modification is selected, create the markdown with the new text, DO NOT show frequency plot (since there is only one), and create the viewer without M1
-                    if len(selected_modifications)==1:
-                        updated_text = html.Div([
-                            html.H1('Visualizer information'),
-                            dcc.Markdown(pfound),
-                            #dcc.Markdown(f"""#### Selected modification(s): {'ation, '.join(selected_modifications)}ation"""),
-                            dcc.Markdown(new_text,style={'overflowY':'scroll','height':'500px'})#dash_dangerously_set_inner_html.DangerouslySetInnerHTML(new_text))
-                            ])
-            
-                        viewer = create_viewer(protein, peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm, nterm=nterm,modifications=selected_modifications, color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1 = True,residue_style=resstyle_value,residue_size=ressize_value,visstyle = visstyle_value, zoomto=zoomto) # Only one modification is selected, leader MET is removed
-                        
-                        return view_3d(viewer), updated_text,colorbars # Return the viewer without M1 and the updated text for the modifications shown
-                        
-                    ##### If more than one modification is selected, create the markdown with the new text, SHOW the frequency plot, and and create the viewer without M1
-                    else:
-                        updated_text = html.Div([
-                            html.H1('Visualizer information'),
-                            dcc.Markdown(pfound),
-                            #dcc.Markdown(f"""#### Selected modification(s): {'ation, '.join(selected_modifications)}ation"""),
-                            dcc.Markdown(new_text,style={'overflowY':'scroll','height':'500px'})#dash_dangerously_set_inner_html.DangerouslySetInnerHTML(new_text))
-                            ])
-                        viewer = create_viewer(protein, peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm, nterm=nterm, modifications=selected_modifications,color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1=True,residue_style=resstyle_value,residue_size=ressize_value,visstyle = visstyle_value, zoomto=zoomto) # More than 1 modification is selected, leader MET is removed
-                        return view_3d(viewer), updated_text,colorbars # Return the viewer without M1 and the updated text for the modifications shown
-                
-                #### If M1 should NOT be removed
-                else:
-                    new_text = info.get_modinfo_text(selected_modifications,protein,peptidelist,nterm=nterm,remove_m1=False)
-                    
-                    ##### If only one modification is selected, update the text, DO NOT create the frequency plot, create the viewer with M1
-                    if len(selected_modifications)==1:
-                        updated_text = html.Div([
-                            html.H1('Visualizer information'),
-                            dcc.Markdown(pfound),
-                            #dcc.Markdown(f"""#### Selected modification(s): {'ation, '.join(selected_modifications)}ation"""),
-                            dcc.Markdown(new_text,style={'overflowY':'scroll','height':'500px'})#dash_dangerously_set_inner_html.DangerouslySetInnerHTML(new_text))
-                        ])
-
-
-                       
-                        viewer = create_viewer(protein,peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm, nterm=nterm, modifications=selected_modifications, color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1 = False,residue_style=resstyle_value,residue_size=ressize_value,visstyle = visstyle_value, zoomto=zoomto) # Only one modification is selected, leader MET is present
-                        return view_3d(viewer), updated_text,colorbars # Return the viewer M1 and the updated text for the modifications shown
-                        
-                    ##### If more than one modification is selected, update the text, create the frequency plot and the viewer with M1
-                    else:
-                        updated_text = html.Div([
-                            html.H1('Visualizer information'),
-                            dcc.Markdown(pfound),
-                            #dcc.Markdown(f"""#### Selected modification(s): {'ation, '.join(selected_modifications)}ation"""),
-                            dcc.Markdown(new_text,style={'overflowY':'scroll','height':'500px'})#dash_dangerously_set_inner_html.DangerouslySetInnerHTML(new_text))
-                            ])
-                        viewer = create_viewer(protein,peptidelist,max_pepfreq_val=max_pep_freq, max_psm=max_psm, nterm=nterm, modifications=selected_modifications, color = viscolor_value, vis_size=vissize_value, labels=label_choice,remove_m1=False,residue_style=resstyle_value,residue_size=ressize_value,visstyle = visstyle_value, zoomto=zoomto) # More than 1 modification is selected, leader MET is present
-                        return view_3d(viewer), updated_text,colorbars # Return the viewer with M1 and the updated text for the modifications shown
-            
 # @app.callback(
 #     Output('met-test-label','children'),
 #     Input('remove-met-check','value')
@@ -696,10 +1096,41 @@ def get_click_data(clickData,n_clicks):
     
     elif ctx.triggered_id == 'Zoom-reset':
         return None
-    
-    
+
+
+@app.callback(
+    Output('metrics-table','children'),
+    Input('metrics-poll','n_intervals'),
+    Input('metrics-panel','open')
+)
+def update_metrics_panel(n_intervals,is_open):
+    """
+    Shows the timings of the callbacks and pipeline stages of this server process (see metrics.py), with the mean
+    and 90th percentile of their recent calls. The table is only refreshed while the panel is open.
+
+    Args:
+        n_intervals (int): Number of times the metrics poll interval has fired.
+        is_open (bool): Whether the performance panel is open.
+
+    Returns:
+        html.Table: One row per callback and stage.
+    """
+    if not is_open:
+        raise PreventUpdate
+    header = ['Kind', 'Name', 'Calls', 'Recent mean (ms)', 'Recent p90 (ms)', 'Total (s)', 'Last payload (kB)']
+    rows = []
+    for timing in metrics.snapshot():
+        name = STAGES.get(timing['name'], timing['name']) if timing['kind'] == 'stage' else timing['name']
+        values = [timing['kind'], name, timing['count'], f"{timing['recent_mean'] * 1000:.1f}", f"{timing['recent_p90'] * 1000:.1f}",
+                  f"{timing['seconds']:.2f}", f"{timing['last_bytes'] / 1024:.1f}" if timing['kind'] == 'callback' else '']
+        rows.append(html.Tr([html.Td(value, style={'padding': '2px 8px'}) for value in values]))
+    return html.Table([html.Tr([html.Th(column, style={'padding': '2px 8px'}) for column in header])] + rows,
+                      style={'font-family': 'Georgia', 'font-size': '14px'})
+
+
 
 if __name__ == '__main__':
     # port = find_available_port(8051)
     # print(f"Using port: {port}")
+    print(f'MS3DViewer started in {time.perf_counter() - _start_time:.2f} s')
     app.run(host='0.0.0.0',port=8051)
\ No newline at end of file
@@ -0,0 +1,174 @@
+# Standard library imports
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom module imports
+from classes import Peptide
+from peptide_atlas import group_peptides
+from shared_dataset import read_job_status, write_job_status
+from site_export import export_site_table
+
+EXPORT_FORMATS = {'Excel': 'xlsx', 'CSV': 'csv', 'Parquet': 'parquet'}
+EXPORT_FOLDER = 'exports'
+
+# Session ids come from the browser, so only the hexadecimal ids the app hands out are used in a path, as in
+# upload_server.py
+_SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{1,64}')
+
+# Exports, of an atlas or of the site table of a whole dataset, run one at a time on a background thread, so the
+# Dash callbacks return immediately
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='atlas-export')
+_jobs = {}
+
+
+def _check_session_id(session_id):
+    if not isinstance(session_id, str) or not _SESSION_ID_PATTERN.fullmatch(session_id):
+        raise ValueError('Session ids must be hexadecimal')
+
+
+def get_export_path(session_id, accession, sample, file_format, export_folder=EXPORT_FOLDER):
+    """
+    Returns the path an atlas export is written to. Every session gets its own folder, so concurrent
+    sessions never overwrite each other's files.
+
+    Raises:
+    - ValueError: If session_id is not hexadecimal.
+
+    Example:
+    >>> get_export_path('3f2a', 'P68431', 'All Samples', 'CSV')
+    'exports/3f2a/peptide_atlas_P68431_All_Samples.csv'
+    """
+    _check_session_id(session_id)
+    safe_sample = re.sub(r'[^A-Za-z0-9]+', '_', sample).strip('_')
+    return os.path.join(export_folder, session_id, f'peptide_atlas_{accession}_{safe_sample}.{EXPORT_FORMATS[file_format]}')
+
+
+def get_site_export_path(session_id, workbook_path, file_format, export_folder=EXPORT_FOLDER):
+    """
+    Returns the path the site table of a dataset is written to, named after its workbook.
+
+    Raises:
+    - ValueError: If session_id is not hexadecimal.
+
+    Example:
+    >>> get_site_export_path('3f2a', 'uploaded_files/3f2a/histones.xlsx', 'parquet')
+    'exports/3f2a/histones_sites.parquet'
+    """
+    _check_session_id(session_id)
+    name = os.path.splitext(os.path.basename(workbook_path))[0]
+    return os.path.join(export_folder, session_id, f'{name}_sites.{file_format}')
+
+
+def write_atlas_table(grouped, path, file_format):
+    """
+    Writes the grouped peptide table of an atlas to Excel, CSV or Parquet. The list and dictionary columns
+    are written as text, as in the Excel file the atlas used to write.
+
+    Parameters:
+    - grouped (DataFrame): The grouped peptides, as returned by peptide_atlas.group_peptides.
+    - path (str): Path of the file to write.
+    - file_format (str): 'Excel', 'CSV' or 'Parquet'.
+    """
+    table = grouped.copy()
+    for column in ['Position range', 'Modifications', 'Modification position']:
+        table[column] = table[column].astype(str)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if file_format == 'Excel':
+        table.to_excel(path, index=False)
+    elif file_format == 'CSV':
+        table.to_csv(path, index=False)
+    elif file_format == 'Parquet':
+        table.to_parquet(path, index=False)
+    else:
+        raise ValueError(f'Export format must be one of {list(EXPORT_FORMATS)}, not {file_format}')
+    return path
+
+
+def _run_export(export, path, job_id, shared_folder):
+    try:
+        export()
+    except Exception as error:
+        if shared_folder is not None:
+            write_job_status(job_id, {'status': 'failed', 'result': str(error)}, shared_folder)
+        raise
+    if shared_folder is not None:
+        write_job_status(job_id, {'status': 'done', 'result': path}, shared_folder)
+    return path
+
+
+def _submit(export, path, shared_folder):
+    job_id = uuid.uuid4().hex
+    if shared_folder is not None:
+        write_job_status(job_id, {'status': 'running', 'result': None}, shared_folder)
+    _jobs[job_id] = _executor.submit(_run_export, export, path, job_id, shared_folder)
+    return job_id
+
+
+def submit_atlas_export(peptides:list[Peptide], nterm, remove_m1, session_id, sample, file_format='Excel', shared_folder=None):
+    """
+    Queues the export of the peptide atlas table of one protein on the background worker.
+
+    Parameters:
+    - peptides (list of Peptide): The peptides shown in the atlas.
+    - nterm (bool): Whether N-terminal modifications are included.
+    - remove_m1 (bool): Whether positions are shifted to match a structure without the leader MET.
+    - session_id (str): Identifier of the browser session, used for the export folder.
+    - sample (str): The sample shown in the atlas, used in the file name.
+    - file_format (str): 'Excel', 'CSV' or 'Parquet'.
+    - shared_folder (str): Folder the job status is written to, so other worker processes can report it, or None
+      when the app runs in one process.
+
+    Returns:
+    - str: The job id to pass to get_export_status.
+
+    Raises:
+    - ValueError: If session_id is not hexadecimal.
+    """
+    path = get_export_path(session_id, peptides[0].protein_accession, sample, file_format)
+    return _submit(lambda: write_atlas_table(group_peptides(peptides, nterm, remove_m1=remove_m1), path, file_format), path, shared_folder)
+
+
+def submit_site_export(dataset, nterm, session_id, file_format='parquet', shared_folder=None):
+    """
+    Queues the export of the site table of a whole dataset on the background worker, see site_export.export_site_table.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - nterm (bool): Whether N-terminal modifications are included.
+    - session_id (str): Identifier of the browser session, used for the export folder.
+    - file_format (str): 'parquet' or 'csv'.
+    - shared_folder (str): Folder the job status is written to, as for submit_atlas_export.
+
+    Returns:
+    - str: The job id to pass to get_export_status.
+
+    Raises:
+    - ValueError: If session_id is not hexadecimal.
+    """
+    path = get_site_export_path(session_id, dataset.file_path, file_format)
+    return _submit(lambda: export_site_table(dataset, path, file_format=file_format, nterm=nterm), path, shared_folder)
+
+
+def get_export_status(job_id, shared_folder=None):
+    """
+    Returns the state of an export job as a tuple (status, result), where status is 'running', 'done' or 'failed'
+    and result is the written path for 'done' and the error message for 'failed'. Finished jobs are forgotten
+    once their status has been returned. Jobs running in another worker process are read from the status they
+    write to shared_folder.
+    """
+    future = _jobs.get(job_id)
+    if future is None and shared_folder is not None:
+        status = read_job_status(job_id, shared_folder)
+        if status is not None:
+            return status['status'], status['result']
+    if future is None:
+        return 'failed', 'Unknown export job'
+    if not future.done():
+        return 'running', None
+    del _jobs[job_id]
+    if future.exception() is not None:
+        return 'failed', str(future.exception())
+    return 'done', future.result()
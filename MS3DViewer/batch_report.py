@@ -0,0 +1,190 @@
+# Standard library imports
+import argparse
+import html
+import importlib.util
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-party library imports
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+# Custom module imports
+import peptide_atlas
+import viewer
+from dataset import load_dataset
+from proteome_index import ALL_SAMPLES
+from shared_dataset import open_dataset, save_dataset
+from site_export import get_protein_site_table
+from viewer_assets import VIEWER_SCRIPT, check_viewer_assets
+
+PROTEIN_FOLDER = 'proteins'
+
+# Set in every worker process by _init_worker
+_dataset = None
+_options = None
+
+
+def get_viewer_page(view):
+    """Returns a standalone HTML page with a py3Dmol viewer, like MS3Dviewer.view_3d."""
+    return ('<html style="overflow: hidden; height: 100%; width: 100%">\n'
+            '<body style="height: 100%; width: 100%; margin: 0">' + view._make_html() + '</body></html>')
+
+
+def write_protein_report(dataset, accession, output_folder, nterm=True, remove_m1=False, png=False, viewer_script_url=VIEWER_SCRIPT):
+    """
+    Writes the report files of one protein to output_folder: the peptide atlas as HTML (and PNG), a standalone 3D
+    viewer page with all modification sites and the site table as CSV.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - accession (str): Accession number of the protein.
+    - output_folder (str): Folder the files are written to. The atlas pages expect plotly.min.js in it.
+    - nterm (bool): Whether N-terminal modifications are shown.
+    - remove_m1 (bool): Whether positions, in the site table too, are shifted to match a structure without the leader MET.
+    - png (bool): Whether the atlas is also written as PNG, which requires kaleido.
+    - viewer_script_url (str): Where the viewer page loads 3Dmol.js from, by default the copy write_report puts next to it.
+
+    Returns:
+    - dict: A summary of the protein for the index page.
+    """
+    protein = dataset.get_protein(accession)
+    peptides = protein.peptides
+    index = dataset.proteome_index
+    # Only this protein's row of the index is read, coverage_fraction would go over every protein again
+    coverage = index.residue_coverage(accession)
+    summary = {'Accession': accession, 'Peptides': len(peptides), 'PSMs': protein.total_psms,
+               'Coverage': float((coverage > 0).sum() / max(len(coverage), 1))}
+
+    if len(peptides) > 0:
+        # The whole protein is drawn with individual peptides, since the page can not ask for another window
+        range_max = len(protein.master_sequence) + 1
+        atlas, grouped = peptide_atlas.lod_peptide_atlas(peptides, nterm, range_max=range_max, remove_m1=remove_m1,
+                                                         coverage=coverage, max_residues=range_max)
+        atlas.write_html(os.path.join(output_folder, f'{accession}_atlas.html'), include_plotlyjs='directory')
+        if png:
+            atlas.write_image(os.path.join(output_folder, f'{accession}_atlas.png'), width=1800, height=700)
+
+    modifications = protein.get_protein_modification_types(nterm)[accession]
+    view = viewer.create_viewer(protein, peptides, nterm, max_pepfreq_val=index.max_peptide_frequency(accession, [ALL_SAMPLES]),
+                                max_psm=index.max_site_psms(accession, [ALL_SAMPLES], nterm), modifications=modifications,
+                                remove_m1=remove_m1, viewer_script_url=viewer_script_url)
+    with open(os.path.join(output_folder, f'{accession}_viewer.html'), 'w') as f:
+        f.write(get_viewer_page(view))
+
+    sites = get_protein_site_table(dataset, accession, nterm=nterm)
+    if remove_m1:
+        # Numbered like the atlas and the viewer, where a site on the removed leader MET has no position
+        sites = sites.assign(Position=sites['Position (M1 removed)']).drop(columns='Position (M1 removed)')
+        sites = sites.dropna(subset=['Position'])
+    sites.to_csv(os.path.join(output_folder, f'{accession}_sites.csv'), index=False)
+    summary['Modified sites'] = len(sites)
+    summary['Modifications'] = ', '.join(modifications)
+    return summary
+
+
+def _init_worker(shared_folder, dataset_id, options):
+    global _dataset, _options
+    _dataset = open_dataset(dataset_id, shared_folder)
+    _options = options
+
+
+def _report_protein(accession):
+    try:
+        return write_protein_report(_dataset, accession, **_options)
+    except Exception as error:
+        # One protein failing, e.g. because its structure is missing, does not stop the report
+        return {'Accession': accession, 'Error': str(error)}
+
+
+def write_index_page(summaries, output_folder, workbook):
+    """Writes index.html and index.csv, with one row per protein and links to its report files."""
+    table = pd.DataFrame(summaries)
+    table.to_csv(os.path.join(output_folder, 'index.csv'), index=False)
+
+    links = []
+    for summary in summaries:
+        if 'Error' in summary:
+            links.append(html.escape(summary['Error']))
+            continue
+        accession = summary['Accession']
+        pages = [(f'{accession}_atlas.html', 'Atlas'), (f'{accession}_viewer.html', '3D view'), (f'{accession}_sites.csv', 'Sites')]
+        links.append(' | '.join(f'<a href="{PROTEIN_FOLDER}/{page}">{label}</a>' for page, label in pages
+                                if os.path.exists(os.path.join(output_folder, PROTEIN_FOLDER, page))))
+    table = table.drop(columns=['Error'], errors='ignore')
+    table['Report'] = links
+    if 'Coverage' in table:
+        table['Coverage'] = table['Coverage'].map(lambda value: f'{value:.1%}' if pd.notna(value) else '')
+
+    with open(os.path.join(output_folder, 'index.html'), 'w') as f:
+        f.write(f'<html><head><meta charset="utf-8"><title>MS3DViewer report: {html.escape(os.path.basename(workbook))}</title>'
+                '<style>body {font-family: Georgia} table {border-collapse: collapse} td, th {padding: 4px 8px}</style></head>'
+                f'<body><h1>MS3DViewer report</h1><p>{html.escape(workbook)}: {len(summaries)} proteins</p>'
+                + table.to_html(index=False, escape=False, na_rep='') + '</body></html>')
+
+
+def write_report(dataset, output_folder, workers=None, nterm=True, remove_m1=False, png=False):
+    """
+    Writes the report of every protein of a dataset and the index page, spreading the proteins over a pool of
+    worker processes. The dataset is saved once as memory-mapped files (see shared_dataset.py), which every worker
+    opens read-only, so it is neither loaded nor copied per worker.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - output_folder (str): Folder the report is written to.
+    - workers (int): Number of worker processes. Defaults to the number of CPUs.
+    - nterm, remove_m1, png: As for write_protein_report.
+
+    Returns:
+    - list: The summary of every protein, as on the index page.
+    """
+    if png and importlib.util.find_spec('kaleido') is None:
+        raise ImportError('PNG export of the atlas requires kaleido, install it or leave out --png')
+    viewer_script = check_viewer_assets()
+
+    protein_folder = os.path.join(output_folder, PROTEIN_FOLDER)
+    os.makedirs(protein_folder, exist_ok=True)
+    with open(os.path.join(protein_folder, 'plotly.min.js'), 'w', encoding='utf-8') as f:
+        f.write(get_plotlyjs())
+    # The viewer pages load the copy of 3Dmol.js next to them, see viewer_assets.py
+    if viewer_script is not None:
+        shutil.copy(viewer_script, protein_folder)
+
+    options = {'output_folder': protein_folder, 'nterm': nterm, 'remove_m1': remove_m1, 'png': png, 'viewer_script_url': VIEWER_SCRIPT}
+    accessions = dataset.accession_numbers
+    workers = workers or os.cpu_count() or 1
+    summaries = []
+    with tempfile.TemporaryDirectory(prefix='ms3dviewer-') as shared_folder:
+        save_dataset(dataset, shared_folder)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared_folder, dataset.dataset_id, options)) as executor:
+            chunksize = max(1, len(accessions) // (workers * 8))
+            for i, summary in enumerate(executor.map(_report_protein, accessions, chunksize=chunksize)):
+                print(f'Report {summary["Accession"]} {i + 1} of {len(accessions)}')
+                summaries.append(summary)
+
+    write_index_page(summaries, output_folder, dataset.file_path)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the peptide atlas, 3D view and site table of every protein of a Proteome Discoverer workbook.')
+    parser.add_argument('workbook', help='Path to the workbook (.xlsx)')
+    parser.add_argument('-o', '--output', default='report', help='Output folder')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes, the number of CPUs by default')
+    parser.add_argument('--png', action='store_true', help='Also write the atlas as PNG (requires kaleido)')
+    parser.add_argument('--remove-m1', action='store_true', help='Show the structures without the leader MET')
+    parser.add_argument('--no-nterm', action='store_true', help='Leave out N-terminal modifications')
+    args = parser.parse_args(argv)
+
+    dataset = load_dataset(args.workbook)
+    summaries = write_report(dataset, args.output, workers=args.workers, nterm=not args.no_nterm, remove_m1=args.remove_m1, png=args.png)
+    failed = [summary for summary in summaries if 'Error' in summary]
+    print(f'Wrote the report of {len(summaries) - len(failed)} proteins to {os.path.join(args.output, "index.html")}')
+    for summary in failed:
+        print(f'Could not report {summary["Accession"]}: {summary["Error"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Standard library imports
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Custom module imports
+import get_colors
+import info
+import parse_file
+import peptide_atlas
+import url_processing
+import viewer
+from dataset import Dataset, create_class_objs
+from proteome_index import ALL_SAMPLES
+from synthetic_data import StructureServer, create_structure_files, create_workbook, get_structure_filename
+
+RESULTS_FILE = 'benchmark_results.jsonl'
+DEFAULT_SCALES = ['5x200', '10x500']
+
+
+def parse_scale(text):
+    """
+    Parses a scale given as '<proteins>x<PSMs per protein>'.
+
+    Example:
+    >>> parse_scale('50x500')
+    (50, 500)
+    """
+    try:
+        n_proteins, peptides_per_protein = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Scale {text} is not of the form <proteins>x<PSMs per protein>, e.g. 50x500')
+    return n_proteins, peptides_per_protein
+
+
+def get_commit():
+    """Returns the git commit the benchmark runs on, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_call(func, repeat, setup=None):
+    """
+    Calls func repeat times and returns the wall time of every call in seconds. setup is called before every call,
+    untimed. The output of the functions, e.g. the progress bars of the loading functions, is discarded.
+    """
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def get_benchmarks(workbook_path, work_folder):
+    """
+    Returns the benchmarks of one workbook as a list of (name, func, setup). Functions working on one protein are
+    timed on the protein with the most PSMs, the one a user waits longest for; the others run over all proteins.
+    The workbook is loaded once here, with its structures fetched from the server url_processing points at.
+    """
+    def load():
+        with open(workbook_path, 'rb') as f:
+            worksheet = parse_file.open_workbook(f)
+        protein_df, protein_index = parse_file.extract_protein_df(worksheet)
+        return worksheet, protein_df, protein_index
+
+    def remove_structures():
+        # The structures are fetched again in every run, so the fetch from the stand-in server is part of the timing
+        for accession in protein_df['Accession']:
+            path = os.path.join(work_folder, get_structure_filename(accession))
+            if os.path.exists(path):
+                os.remove(path)
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        worksheet, protein_df, protein_index = load()
+        protein_list, peptide_list = create_class_objs(worksheet, protein_df, protein_index)
+        loaded = Dataset(workbook_path, protein_list, peptide_list, info.get_samples_in_file(worksheet), list(protein_df['Accession']))
+    index = loaded.proteome_index
+    protein = max(protein_list, key=lambda protein: len(protein.peptides))
+    max_frequencies = {p.accession: index.max_peptide_frequency(p.accession, [ALL_SAMPLES]) for p in protein_list}
+    modifications = {p.accession: p.get_protein_modification_types(True)[p.accession] for p in protein_list}
+    max_psm = index.max_site_psms(protein.accession, [ALL_SAMPLES], True)
+
+    def extract_peptides():
+        for accession in protein_df['Accession']:
+            parse_file.extract_peptide_df(worksheet, accession, protein_df, protein_index)
+
+    def peptide_abundance_colors():
+        for p in protein_list:
+            get_colors.get_peptide_abundance_color(p, p.peptides, max_frequencies[p.accession])
+
+    def modification_dicts():
+        for p in protein_list:
+            info.get_peptide_modification_dict(p.peptides, modifications[p.accession], True)
+
+    def modification_texts():
+        for p in protein_list:
+            info.get_modinfo_text(modifications[p.accession], p, p.peptides, True)
+
+    return [
+        ('parse_file.open_workbook', load, None),
+        ('parse_file.extract_protein_df', lambda: parse_file.extract_protein_df(worksheet), None),
+        ('parse_file.extract_peptide_df', extract_peptides, None),
+        ('dataset.create_class_objs', lambda: create_class_objs(worksheet, protein_df, protein_index), remove_structures),
+        ('get_colors.get_peptide_abundance_color', peptide_abundance_colors, None),
+        ('get_colors.create_color_fig1', lambda: get_colors.create_color_fig1(protein, protein.peptides, max_frequencies[protein.accession]), None),
+        ('info.get_peptide_modification_dict', modification_dicts, None),
+        ('info.get_modinfo_text', modification_texts, None),
+        ('peptide_atlas.peptide_atlas', lambda: peptide_atlas.peptide_atlas(protein.peptides, True, range_max=len(protein.master_sequence) + 1), None),
+        ('peptide_atlas.lod_peptide_atlas', lambda: peptide_atlas.lod_peptide_atlas(protein.peptides, True, range_max=len(protein.master_sequence) + 1,
+                                                                                    coverage=index.residue_coverage(protein.accession)), None),
+        ('viewer.create_viewer', lambda: viewer.create_viewer(protein, protein.peptides, True, max_pepfreq_val=max_frequencies[protein.accession],
+                                                              max_psm=max_psm, modifications=modifications[protein.accession]), None),
+    ]
+
+
+def run_scale(n_proteins, peptides_per_protein, n_samples=6, mod_density=0.1, repeat=3, seed=0, only=None):
+    """
+    Runs the benchmarks on a synthetic workbook of the given scale, with its structures served by a local stand-in
+    for the AlphaFold server.
+
+    Parameters:
+    - n_proteins (int): Number of proteins of the workbook.
+    - peptides_per_protein (int): Number of PSMs per protein.
+    - n_samples (int): Number of samples.
+    - mod_density (float): Probability that a residue is modified, see synthetic_data.create_workbook.
+    - repeat (int): Number of timed runs of every benchmark.
+    - seed (int): Seed of the synthetic workbook.
+    - only (list of str): Names of the benchmarks to run, all if None.
+
+    Returns:
+    - list: One result dict per benchmark, with the scale and the min, median, mean and max wall time in seconds.
+    """
+    scale = {'proteins': n_proteins, 'peptides_per_protein': peptides_per_protein, 'samples': n_samples, 'mod_density': mod_density}
+    results = []
+    previous_folder = os.getcwd()
+    previous_url = url_processing.ALPHAFOLD_URL
+    with tempfile.TemporaryDirectory(prefix='ms3dviewer-benchmark-') as folder:
+        workbook_path = os.path.join(folder, 'synthetic.xlsx')
+        accessions = create_workbook(workbook_path, n_proteins, peptides_per_protein, n_samples, mod_density, seed=seed)
+        create_structure_files(accessions, os.path.join(folder, 'structures'))
+        work_folder = os.path.join(folder, 'work')
+        os.makedirs(work_folder)
+        try:
+            # url_processing.retrieve_fromURL saves the structures to the current folder
+            os.chdir(work_folder)
+            with StructureServer(os.path.join(folder, 'structures')) as server:
+                url_processing.ALPHAFOLD_URL = server.url
+                for name, func, setup in get_benchmarks(workbook_path, work_folder):
+                    if only is not None and name not in only:
+                        continue
+                    seconds = time_call(func, repeat, setup)
+                    results.append(dict(scale, benchmark=name, repeat=repeat, min=min(seconds), median=statistics.median(seconds),
+                                        mean=statistics.mean(seconds), max=max(seconds)))
+        finally:
+            url_processing.ALPHAFOLD_URL = previous_url
+            os.chdir(previous_folder)
+    return results
+
+
+def write_results(results, path=RESULTS_FILE):
+    """
+    Appends the results to a JSON Lines file, one line per benchmark and scale, with the date, commit and Python
+    version of the run, so results of different runs can be compared over time.
+    """
+    run = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': get_commit(),
+           'python': platform.python_version(), 'platform': platform.platform()}
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(dict(run, **result)) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the loading and rendering functions of MS3DViewer on synthetic workbooks of increasing size.')
+    parser.add_argument('-s', '--scale', type=parse_scale, action='append',
+                        help=f'Workbook size as <proteins>x<PSMs per protein>, can be given several times (default: {" ".join(DEFAULT_SCALES)})')
+    parser.add_argument('--samples', type=int, default=6, help='Number of samples of the workbooks')
+    parser.add_argument('--mod-density', type=float, default=0.1, help='Probability that a residue is modified')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of timed runs of every benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic workbooks')
+    parser.add_argument('-b', '--benchmark', action='append', help='Only run the benchmark with this name, can be given several times')
+    parser.add_argument('-o', '--output', default=RESULTS_FILE, help='JSON Lines file the results are appended to')
+    args = parser.parse_args(argv)
+
+    for n_proteins, peptides_per_protein in args.scale or [parse_scale(scale) for scale in DEFAULT_SCALES]:
+        print(f'{n_proteins} proteins x {peptides_per_protein} PSMs, {args.samples} samples, modification density {args.mod_density}')
+        results = run_scale(n_proteins, peptides_per_protein, args.samples, args.mod_density, args.repeat, args.seed, args.benchmark)
+        for result in results:
+            print(f'  {result["benchmark"]:<42} median {result["median"] * 1000:9.1f} ms   min {result["min"] * 1000:9.1f} ms')
+        write_results(results, args.output)
+    print(f'Results appended to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
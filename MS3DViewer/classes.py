@@ -7,6 +7,7 @@ from Bio.PDB import PDBParser, Polypeptide
 
 # Custom imports
 import url_processing
+from metrics import stage
 
 
 
@@ -25,13 +26,14 @@ class Protein:
         peptides (list): List of Peptide objects associated with this Protein.
     """
         
-    def __init__(self, accession,total_psms):
+    def __init__(self, accession,total_psms,pdb_file=None,master_sequence=None):
         self._accession = accession
         self._total_psms = total_psms
         
-        self._pdb_file = self.get_pdb_file()
+        # The structure is only retrieved and parsed when it is not given, e.g. by a saved dataset
+        self._pdb_file = pdb_file if pdb_file is not None else self.get_pdb_file()
         self._peptides:list[Peptide] = [] # List of peptide objects
-        self._master_sequence = self.get_master_sequence()
+        self._master_sequence = master_sequence if master_sequence is not None else self.get_master_sequence()
         
 
     def __repr__(self) -> str:
@@ -59,6 +61,10 @@ class Protein:
     @property
     def peptides(self):
         return self._peptides
+
+    @property
+    def peptides_loaded(self) -> bool:
+        return True
     
     @property
     def master_sequence(self):
@@ -68,13 +74,15 @@ class Protein:
         self._peptides = peptidelist
 
     def get_pdb_file(self):
-        pdb_file = url_processing.retrieve_fromURL(url_processing.create_url(self.accession))
+        with stage('structure_fetch'):
+            pdb_file = url_processing.retrieve_fromURL(url_processing.create_url(self.accession))
         return pdb_file
     
     def get_master_sequence(self):
-        structure = pdbparser.get_structure(self.accession,self.pdb_file)
-        for pp in ppb.build_peptides(structure):
-            sequence = pp.get_sequence()
+        with stage('sequence_parse'):
+            structure = pdbparser.get_structure(self.accession,self.pdb_file)
+            for pp in ppb.build_peptides(structure):
+                sequence = pp.get_sequence()
         master_sequence = sequence
         return master_sequence
     
@@ -0,0 +1,308 @@
+# Standard library imports
+import base64
+import gzip
+import hashlib
+import json
+
+# Third-party library imports
+import numpy as np
+from flask import Response, request
+
+# Custom module imports
+from proteome_index import ALL_SAMPLES
+
+API_ROUTE = '/api'
+ENCODINGS = ['list', 'rle', 'base64']
+TABLE_FORMATS = ['json', 'csv']
+SITE_COLUMNS = ['Accession', 'Residue', 'Position', 'Modification', 'PSMs', 'Covering peptides']
+
+# Set by register_data_api
+_store = None
+
+
+class BadRequest(ValueError):
+    """Raised for query arguments the API can not answer, and returned to the client with status 400."""
+
+
+class NotFound(KeyError):
+    """Raised for datasets and accessions that are not loaded, and returned to the client with status 404."""
+
+
+def _get_flag(name):
+    value = request.args.get(name, 'false').lower()
+    if value not in ('true', 'false', '1', '0'):
+        raise BadRequest(f'{name} must be true or false, not {value}')
+    return value in ('true', '1')
+
+
+def _get_choice(name, choices):
+    value = request.args.get(name, choices[0])
+    if value not in choices:
+        raise BadRequest(f'{name} must be one of {choices}, not {value}')
+    return value
+
+
+def _get_sample(dataset):
+    sample = request.args.get('sample', ALL_SAMPLES)
+    if sample != ALL_SAMPLES and sample not in dataset.samples_in_file:
+        raise BadRequest(f'Sample {sample} is not in the dataset')
+    return sample
+
+
+def _get_modifications():
+    """Returns the modification types of the 'mods' argument (comma-separated), or None for all types."""
+    mods = request.args.get('mods')
+    if not mods:
+        return None
+    return [mod.strip() for mod in mods.split(',') if mod.strip()]
+
+
+def _get_dataset(dataset_id):
+    try:
+        return _store.get(dataset_id)
+    except KeyError:
+        raise NotFound(f'Dataset {dataset_id} is not loaded')
+
+
+def _get_protein(dataset, accession):
+    try:
+        return dataset.get_protein(accession)
+    except KeyError:
+        raise NotFound(f'Accession {accession} is not in the dataset')
+
+
+def make_response(body, mimetype):
+    """
+    Returns a response that is gzip-compressed when the client accepts it and carries an ETag, so clients can
+    revalidate their copy and get a 304 without a body when the data has not changed.
+    """
+    data = body.encode('utf-8')
+    etag = hashlib.sha1(data).hexdigest()
+    gzipped = 'gzip' in request.accept_encodings and len(data) > 1024
+    response = Response(gzip.compress(data, compresslevel=6) if gzipped else data, mimetype=mimetype)
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    # Datasets are replaced under the same id while they load, so clients revalidate with the ETag every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _json_response(payload):
+    return make_response(json.dumps(payload, separators=(',', ':')), 'application/json')
+
+
+def _table_response(table, file_format):
+    if file_format == 'csv':
+        return make_response(table.to_csv(index=False), 'text/csv')
+    return make_response(table.to_json(orient='records'), 'application/json')
+
+
+def encode_values(values, encoding):
+    """
+    Encodes a list of integers for the API.
+
+    - 'list': the values as a JSON list.
+    - 'rle': run-length pairs [value, count], compact for coverage arrays with long runs.
+    - 'base64': the values as little-endian 32-bit integers, base64-encoded.
+
+    Example:
+    >>> encode_values([0, 0, 0, 2, 2, 1], 'rle')
+    [[0, 3], [2, 2], [1, 1]]
+    """
+    values = [int(value) for value in values]
+    if encoding == 'rle':
+        runs = []
+        for value in values:
+            if runs and runs[-1][0] == value:
+                runs[-1][1] += 1
+            else:
+                runs.append([value, 1])
+        return runs
+    if encoding == 'base64':
+        import numpy as np
+        return base64.b64encode(np.asarray(values, dtype='<i4').tobytes()).decode('ascii')
+    return values
+
+
+def _error_response(message, status):
+    response = _json_response({'error': message})
+    response.status_code = status
+    return response
+
+
+def _handle_errors(view):
+    def wrapped(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        except BadRequest as error:
+            return _error_response(str(error), 400)
+        except NotFound as error:
+            return _error_response(error.args[0], 404)
+    wrapped.__name__ = view.__name__
+    wrapped.__doc__ = view.__doc__
+    return wrapped
+
+
+@_handle_errors
+def list_datasets():
+    """GET /api/datasets: the datasets in memory in this process."""
+    summaries = []
+    for dataset_id in _store.dataset_ids():
+        try:
+            summaries.append(get_dataset_summary(_store.get(dataset_id)))
+        except KeyError:
+            # Removed since the ids were listed
+            continue
+    return _json_response(summaries)
+
+
+def get_dataset_summary(dataset):
+    return {'dataset_id': dataset.dataset_id, 'file_name': dataset.file_path.replace('\\', '/').split('/')[-1],
+            'proteins': len(dataset.accession_numbers), 'samples': dataset.samples_in_file}
+
+
+@_handle_errors
+def get_dataset(dataset_id):
+    """GET /api/datasets/<dataset_id>: samples and modification types of a dataset."""
+    dataset = _get_dataset(dataset_id)
+    summary = get_dataset_summary(dataset)
+    summary['modification_types'] = dataset.proteome_index.modification_types(nterm=True)
+    return _json_response(summary)
+
+
+@_handle_errors
+def list_proteins(dataset_id):
+    """GET /api/datasets/<dataset_id>/proteins?sample=: accession, length, PSMs, peptides and coverage of every protein."""
+    dataset = _get_dataset(dataset_id)
+    sample = _get_sample(dataset)
+    coverage = dataset.proteome_index.coverage_fraction(sample)
+    proteins = []
+    for protein in dataset.protein_list:
+        proteins.append({'accession': protein.accession, 'length': len(protein.master_sequence), 'psms': int(protein.total_psms),
+                         'coverage': round(float(coverage.loc[protein.accession]), 4)})
+    return _json_response(proteins)
+
+
+@_handle_errors
+def get_protein_coverage(dataset_id, accession):
+    """
+    GET /api/datasets/<dataset_id>/proteins/<accession>/coverage?sample=&remove_m1=&encoding=: the number of
+    peptides covering every residue, from residue 1 (residue 2 with remove_m1).
+    """
+    dataset = _get_dataset(dataset_id)
+    protein = _get_protein(dataset, accession)
+    sample = _get_sample(dataset)
+    remove_m1 = _get_flag('remove_m1')
+    encoding = _get_choice('encoding', ENCODINGS)
+    coverage = dataset.proteome_index.residue_coverage(protein.accession, sample)
+    if remove_m1:
+        coverage = coverage[1:]
+    return _json_response({'accession': protein.accession, 'sample': sample, 'remove_m1': remove_m1,
+                           'encoding': encoding, 'coverage': encode_values(coverage, encoding)})
+
+
+def _filter_sites(table, sample, modifications, remove_m1):
+    """Keeps the PSM column of one sample and the selected modification types, and shifts positions for remove_m1."""
+    if modifications is not None:
+        table = table[table['Modification'].isin(modifications)]
+    table = table.rename(columns={f'PSMs: {sample}': 'PSMs'})[SITE_COLUMNS]
+    table = table[table['PSMs'] > 0]
+    if remove_m1:
+        # A site on the removed Met has no position in the shifted numbering
+        table = table.assign(Position=table['Position'] - 1)
+        table = table[table['Position'] >= 1]
+    return table.reset_index(drop=True)
+
+
+@_handle_errors
+def get_protein_sites(dataset_id, accession):
+    """
+    GET /api/datasets/<dataset_id>/proteins/<accession>/sites?sample=&mods=&nterm=&remove_m1=&format=: the modified
+    residues of a protein with their PSM count in the sample and the number of covering peptides.
+    """
+    from site_export import get_protein_site_table
+    dataset = _get_dataset(dataset_id)
+    protein = _get_protein(dataset, accession)
+    sample = _get_sample(dataset)
+    file_format = _get_choice('format', TABLE_FORMATS)
+    table = get_protein_site_table(dataset, protein.accession, nterm=_get_flag('nterm'))
+    return _table_response(_filter_sites(table, sample, _get_modifications(), _get_flag('remove_m1')), file_format)
+
+
+@_handle_errors
+def get_sites(dataset_id):
+    """
+    GET /api/datasets/<dataset_id>/sites?sample=&mods=&nterm=&remove_m1=&format=: the modified residues of all
+    proteins with their PSM count in the sample and the number of covering peptides, the columns of the sites of one
+    protein, read from the proteome index in one go. Meant for pulling the sites of thousands of proteins in one
+    request rather than one request per protein.
+    """
+    dataset = _get_dataset(dataset_id)
+    sample = _get_sample(dataset)
+    file_format = _get_choice('format', TABLE_FORMATS)
+    index = dataset.proteome_index
+    table = index.site_table(sample, _get_modifications(), nterm=_get_flag('nterm'))
+    table = table.rename(columns={'PSM Count': 'PSMs'})
+    if len(table) == 0:
+        return _table_response(table.reindex(columns=SITE_COLUMNS), file_format)
+    # Residues and covering peptides are looked up for all sites at once, as site_export.get_protein_site_table
+    # does per protein: from the master sequence and the coverage of all samples
+    sequences = {accession: str(dataset.get_protein(accession).master_sequence) for accession in table['Accession'].unique()}
+    rows = table['Accession'].map({accession: row for row, accession in enumerate(index.accessions)}).to_numpy(dtype=np.int64)
+    positions = table['Position'].to_numpy(dtype=np.int64)
+    table['Residue'] = [sequences[accession][p - 1] if p <= len(sequences[accession]) else ''
+                        for accession, p in zip(table['Accession'], positions)]
+    covering = np.asarray(index.coverage_matrix()[rows, positions - 1]).ravel().astype(np.int64)
+    table['Covering peptides'] = np.where(positions <= index.lengths[rows], covering, 0)
+    table = table[SITE_COLUMNS]
+    if _get_flag('remove_m1'):
+        table = table.assign(Position=table['Position'] - 1)
+        table = table[table['Position'] >= 1].reset_index(drop=True)
+    return _table_response(table, file_format)
+
+
+@_handle_errors
+def get_protein_atlas(dataset_id, accession):
+    """
+    GET /api/datasets/<dataset_id>/proteins/<accession>/atlas?sample=&nterm=&remove_m1=&format=: the rows of the
+    peptide atlas, one per distinct peptide, with the atlas row it is drawn in.
+    """
+    from peptide_atlas import assign_rows, group_peptides
+    dataset = _get_dataset(dataset_id)
+    protein = _get_protein(dataset, accession)
+    sample = _get_sample(dataset)
+    file_format = _get_choice('format', TABLE_FORMATS)
+    peptides = protein.peptides if sample == ALL_SAMPLES else protein.get_peptides_by_file_id(sample)
+    grouped = group_peptides(peptides, _get_flag('nterm'), remove_m1=_get_flag('remove_m1'))
+    rows = grouped[['Sequence', 'Start position', 'End position', 'Count']].copy()
+    rows.insert(0, 'Row', assign_rows(grouped['Start position'], grouped['End position']) if len(grouped) > 0 else [])
+    # Nested values do not fit a CSV cell, so they are written there as JSON text
+    positions = list(grouped['Modification position'])
+    rows['Modifications'] = positions if file_format == 'json' else [json.dumps(value) for value in positions]
+    return _table_response(rows, file_format)
+
+
+def register_data_api(server, store):
+    """
+    Adds the read-only data API to the Flask server of the Dash app.
+
+    Parameters:
+    - server (Flask): The server of the Dash app.
+    - store (DatasetStore): The store the datasets are read from.
+    """
+    global _store
+    _store = store
+    routes = [
+        ('/datasets', list_datasets),
+        ('/datasets/<dataset_id>', get_dataset),
+        ('/datasets/<dataset_id>/proteins', list_proteins),
+        ('/datasets/<dataset_id>/sites', get_sites),
+        ('/datasets/<dataset_id>/proteins/<accession>/coverage', get_protein_coverage),
+        ('/datasets/<dataset_id>/proteins/<accession>/sites', get_protein_sites),
+        ('/datasets/<dataset_id>/proteins/<accession>/atlas', get_protein_atlas),
+    ]
+    for route, view in routes:
+        server.add_url_rule(f'{API_ROUTE}{route}', f'api_{view.__name__}', view)
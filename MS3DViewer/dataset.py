@@ -0,0 +1,217 @@
+# Standard library imports
+import sys
+import uuid
+
+# Third-party library imports
+from tqdm import tqdm
+
+# Custom module imports
+import parse_file
+import info
+from classes import Protein, Peptide
+from metrics import stage
+from profiling import profiled
+from proteome_index import ProteomeIndex
+
+
+class Dataset:
+    """
+    Represents everything loaded from one Proteome Discoverer workbook.
+
+    Attributes:
+        dataset_id (str): Unique identifier of this load of the workbook.
+        file_path (str): Path to the workbook the dataset was loaded from.
+        protein_list (list): List of Protein objects, in workbook order.
+        peptide_list (list): List of all Peptide objects, collected from the proteins if not given.
+        samples_in_file (list): Sample names found in the workbook.
+        accession_numbers (list): Accession numbers of the proteins, in workbook order.
+        proteome_index (ProteomeIndex): Proteome-wide coverage and site matrices.
+    """
+
+    def __init__(self, file_path, protein_list, peptide_list, samples_in_file, accession_numbers, dataset_id=None, proteome_index=None):
+        self._dataset_id = dataset_id if dataset_id is not None else uuid.uuid4().hex
+        self._file_path = file_path
+        self._protein_list:list[Protein] = protein_list
+        self._peptide_list:list[Peptide] = peptide_list
+        self._samples_in_file = samples_in_file
+        self._accession_numbers = accession_numbers
+        self._proteome_index = proteome_index if proteome_index is not None else ProteomeIndex(protein_list, samples_in_file)
+
+    def __repr__(self) -> str:
+        return f"Dataset(file_path={self._file_path}, proteins={len(self._protein_list)}, peptides={len(self.peptide_list)})"
+
+    @property
+    def dataset_id(self):
+        return self._dataset_id
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def protein_list(self):
+        return self._protein_list
+
+    @property
+    def peptide_list(self):
+        if self._peptide_list is None:
+            self._peptide_list = [peptide for protein in self._protein_list for peptide in protein.peptides]
+        return self._peptide_list
+
+    @property
+    def samples_in_file(self):
+        return self._samples_in_file
+
+    @property
+    def accession_numbers(self):
+        return self._accession_numbers
+
+    @property
+    def proteome_index(self):
+        return self._proteome_index
+
+    def memory_size(self):
+        """
+        Estimates the memory used by the dataset in bytes: the proteome index matrices plus the Protein and Peptide
+        objects with their sequences and modification dictionaries. Memory-mapped matrices and peptides that are not
+        loaded yet are not counted, since they are not held by this process.
+        """
+        size = 0 if self._proteome_index.memory_mapped else self._proteome_index.nbytes
+        loaded_peptides = []
+        for protein in self._protein_list:
+            size += sys.getsizeof(protein) + sys.getsizeof(protein.__dict__) + sys.getsizeof(str(protein.master_sequence))
+            if protein.peptides_loaded:
+                loaded_peptides += protein.peptides
+        for peptide in loaded_peptides:
+            size += sys.getsizeof(peptide) + sys.getsizeof(peptide.__dict__) + sys.getsizeof(peptide.sequence) + sys.getsizeof(peptide.position_range)
+            size += sys.getsizeof(peptide.modifications) + sum(sys.getsizeof(value) for value in peptide.modifications.values())
+        return size
+
+    def get_protein(self, accession) -> Protein:
+        for protein in self._protein_list:
+            if protein.accession == accession:
+                return protein
+        raise KeyError(f'Accession {accession} is not in the dataset')
+
+
+def create_class_objs(workbook,protein_df,protein_index,progress=None):
+    """
+    Creates instances of Protein and Peptide classes based on data from a workbook.
+
+    Parameters:
+    - workbook (Workbook): The workbook containing protein and peptide data.
+    - protein_df (DataFrame): DataFrame containing protein information.
+    - protein_index (list of int): List containing the starting index of each protein's data in the DataFrame,
+      used to locate and extract relevant peptide data.
+    - progress (callable): Called as progress(protein_list, peptide_list) after every protein, with the objects
+      created so far.
+
+    Returns:
+    - tuple: A tuple containing:
+        - list: List of Protein objects.
+        - list: List of Peptide objects.
+
+    Note:
+    - The Protein and Peptide classes must be defined.
+    """
+    protein_list = []
+    peptide_list = []
+
+    i=0
+
+    for index, row in protein_df.iterrows():
+        i+=1
+
+        protein = Protein(
+            accession=row['Accession'],
+            total_psms=row['# PSMs']
+        )
+        protein_list.append(protein)
+
+        print(f'Protein {protein.accession} {i} of {len(protein_df)}')
+
+
+        protein_peptides = []
+        with stage('peptide_extraction'):
+            peptide_df = parse_file.extract_peptide_df(workbook,protein.accession,protein_df,protein_index)
+            # Wrap the pandas iterrows with tqdm for the progress bar
+            for pep_index, pep_row in tqdm(peptide_df.iterrows(), total=peptide_df.shape[0], desc=f'Processing peptides for protein {protein.accession}'):
+                moddict = {}
+                for r in pep_row['Modifications']:
+                    moddict[r[0]] = r[1:]  # Creating a dictionary of modifications for each peptide
+
+                peptide = Peptide(protein=protein,  # Creating peptide objects of the class Protein
+                    sequence=pep_row['Annotated Sequence'],
+                    start_position=int(pep_row['Positions in Proteins'][0]),
+                    end_position=int(pep_row['Positions in Proteins'][1]),
+                    modifications=moddict,
+                    file_id = pep_row['File ID']
+                    )
+                peptide_list.append(peptide)
+                protein_peptides.append(peptide)
+        protein.set_peptides(protein_peptides)
+        if progress is not None:
+            progress(protein_list, peptide_list)
+    return protein_list, peptide_list
+
+
+def get_partial_dataset_id(dataset_id):
+    """
+    Returns the id of the dataset holding only the first protein of a workbook, see load_dataset. It differs from the
+    id of the full dataset, so an id always names the same data, in every worker process and every cache keyed by it.
+
+    Example:
+    >>> get_partial_dataset_id('9c41e0d2')
+    '9c41e0d2first'
+    """
+    return f'{dataset_id}first'
+
+
+@profiled()
+def load_dataset(file_path, dataset_id=None, progress=None, on_first_protein=None):
+    """
+    Loads a workbook into a Dataset: parses the proteins and peptides, retrieves the structures and
+    builds the proteome index.
+
+    Parameters:
+    - file_path (str): Path to the Proteome Discoverer workbook.
+    - dataset_id (str): Id to give the dataset, e.g. when it is loaded again. A new id is made if None.
+    - progress (callable): Called as progress(stage, done, total) while loading, where stage is 'parse' (reading the
+      workbook), 'structures' (creating the proteins, which retrieves their structures) or 'index' (building the
+      proteome index).
+    - on_first_protein (callable): Called with a Dataset holding only the first protein as soon as that protein is
+      loaded, so it can be shown while the others load. Its id is given by get_partial_dataset_id.
+
+    Returns:
+    - Dataset: The loaded dataset.
+
+    Example:
+    >>> dataset = load_dataset('uploaded_files/experiment.xlsx')
+    >>> print(dataset)
+    Dataset(file_path=uploaded_files/experiment.xlsx, proteins=5, peptides=1166)
+    """
+    if dataset_id is None:
+        dataset_id = uuid.uuid4().hex
+    if progress is None:
+        progress = lambda stage, done, total: None
+
+    progress('parse', 0, 1)
+    with stage('workbook_load'):
+        with open(file_path, 'rb') as f:
+            workbook = parse_file.open_workbook(f)
+        protein_df, protein_index, accession_numbers = info.get_protein(workbook)
+        samples_in_file = info.get_samples_in_file(workbook)
+
+    def protein_loaded(protein_list, peptide_list):
+        progress('structures', len(protein_list), len(protein_df))
+        if on_first_protein is not None and len(protein_list) == 1 and len(protein_df) > 1:
+            on_first_protein(Dataset(file_path, list(protein_list), list(peptide_list), samples_in_file, accession_numbers[:1],
+                                     dataset_id=get_partial_dataset_id(dataset_id)))
+
+    progress('structures', 0, len(protein_df))
+    protein_list, peptide_list = create_class_objs(workbook=workbook,protein_df=protein_df,protein_index=protein_index,progress=protein_loaded)
+    progress('index', 0, 1)
+    with stage('index_build'):
+        dataset = Dataset(file_path, protein_list, peptide_list, samples_in_file, accession_numbers, dataset_id=dataset_id)
+    progress('index', 1, 1)
+    return dataset
@@ -0,0 +1,137 @@
+# Standard library imports
+import threading
+from collections import OrderedDict
+
+
+class DatasetStore:
+    """
+    Keeps the datasets of all browser sessions in memory, keyed by dataset id, so one server process can serve
+    several users with different workbooks at the same time.
+
+    The store is bounded by number of datasets and by their estimated memory size. When a new dataset does not fit,
+    the least recently used datasets are dropped. The workbook path of a dropped dataset is remembered, so it is
+    loaded again, under the same id, the next time its session asks for it.
+
+    When several worker processes serve the app, a dataset loaded by one worker is opened by the others through
+    the attach callable, e.g. from the memory-mapped files written by shared_dataset.save_dataset.
+
+    Attributes:
+        max_datasets (int): Maximum number of datasets kept in memory.
+        max_bytes (int): Maximum total estimated size of the datasets kept in memory.
+        size_bytes (int): Total estimated size of the datasets in memory.
+    """
+
+    def __init__(self, loader, max_datasets=8, max_bytes=4 * 1024 * 1024 * 1024, on_evict=None, attach=None):
+        """
+        Parameters:
+        - loader (callable): Called as loader(file_path, dataset_id=...) to load a dropped dataset again.
+        - max_datasets (int): Maximum number of datasets kept in memory.
+        - max_bytes (int): Maximum total estimated size of the datasets kept in memory.
+        - on_evict (callable): Called with the dataset id of every dataset that is dropped or replaced, e.g. to clear caches.
+        - attach (callable): Called as attach(dataset_id) to open a dataset this process has not loaded itself, or
+          has dropped. Raises KeyError if there is no such dataset.
+        """
+        self._loader = loader
+        self._max_datasets = max_datasets
+        self._max_bytes = max_bytes
+        self._on_evict = on_evict
+        self._attach = attach
+        self._datasets = OrderedDict() # dataset id -> (dataset, size)
+        self._file_paths = {} # dataset id -> workbook path, also for dropped datasets
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"DatasetStore(datasets={len(self._datasets)}, bytes={self._bytes})"
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def __contains__(self, dataset_id):
+        return dataset_id in self._datasets
+
+    @property
+    def max_datasets(self):
+        return self._max_datasets
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def add(self, dataset):
+        """Adds a loaded dataset, dropping the least recently used ones if needed, and returns its id."""
+        size = dataset.memory_size()
+        evicted = []
+        with self._lock:
+            if dataset.dataset_id in self._datasets:
+                # A dataset replaced by a newer version, e.g. the full dataset after its first protein
+                self._bytes -= self._datasets.pop(dataset.dataset_id)[1]
+                replaced = [dataset.dataset_id]
+            else:
+                replaced = []
+            self._datasets[dataset.dataset_id] = (dataset, size)
+            self._file_paths[dataset.dataset_id] = dataset.file_path
+            self._bytes += size
+            # The new dataset itself is always kept, even when it is larger than max_bytes on its own
+            while len(self._datasets) > 1 and (len(self._datasets) > self._max_datasets or self._bytes > self._max_bytes):
+                evicted_id, (evicted_dataset, evicted_size) = self._datasets.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted.append(evicted_id)
+        for evicted_id in evicted:
+            print(f'Dropped dataset {evicted_id} from memory')
+        if self._on_evict is not None:
+            for evicted_id in replaced + evicted:
+                self._on_evict(evicted_id)
+        return dataset.dataset_id
+
+    def get(self, dataset_id):
+        """
+        Returns the dataset with the given id and marks it as recently used. A dropped dataset is attached or loaded
+        again.
+
+        Raises:
+        - KeyError: If the id was never added to the store and cannot be attached.
+        """
+        with self._lock:
+            if dataset_id in self._datasets:
+                self._datasets.move_to_end(dataset_id)
+                return self._datasets[dataset_id][0]
+            if dataset_id not in self._file_paths and self._attach is None:
+                raise KeyError(f'Dataset {dataset_id} is not in the store')
+
+        # Loading can take a while, so it happens outside the store lock, one dataset at a time
+        with self._load_lock:
+            with self._lock:
+                if dataset_id in self._datasets:
+                    return self._datasets[dataset_id][0]
+                file_path = self._file_paths.get(dataset_id)
+            dataset = None
+            if self._attach is not None:
+                try:
+                    dataset = self._attach(dataset_id)
+                except KeyError:
+                    if file_path is None:
+                        raise
+            if dataset is None:
+                dataset = self._loader(file_path, dataset_id=dataset_id)
+            self.add(dataset)
+        return self.get(dataset_id)
+
+    def dataset_ids(self):
+        """Returns the ids of the datasets in memory, least recently used first."""
+        with self._lock:
+            return list(self._datasets)
+
+    def remove(self, dataset_id):
+        """Drops a dataset and forgets its workbook path."""
+        with self._lock:
+            if dataset_id in self._datasets:
+                self._bytes -= self._datasets.pop(dataset_id)[1]
+            self._file_paths.pop(dataset_id, None)
+        if self._on_evict is not None:
+            self._on_evict(dataset_id)
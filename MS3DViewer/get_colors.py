@@ -61,6 +61,26 @@ def get_peptide_abundance_color(protein:Protein, peptide_list, max_peptide_freq,
                 freq_list.append(p)
     return colors,freqpos_list, freq_list
 
+def get_peptide_abundance_selections(freqpos_list, remove_m1=False):
+    """Returns the residue selection of every run of equal peptide frequency, as ends in freqpos_list."""
+    selection_list = []
+    if remove_m1:
+        freqpos = []
+        for pos in freqpos_list:
+            new_pos = pos-1
+            freqpos.append(new_pos)
+    else:
+        freqpos = freqpos_list
+
+    for i, p in enumerate(freqpos):
+        if i == 0:
+            selection = f"chain A and :{1}-{(freqpos[i]) + 1}"
+            selection_list.append(selection)
+        if i != 0:
+            selection = f"chain A and :{freqpos[i-1] + 2}-{freqpos[i] + 1}"
+            selection_list.append(selection)
+    return selection_list
+
 def set_peptide_abundance_color(colors, viewer,freqpos_list,freq_list,pepstyle = 'cartoon', remove_m1=False,size=0.8):
     selection_list = []
 
@@ -85,22 +105,7 @@ def set_peptide_abundance_color(colors, viewer,freqpos_list,freq_list,pepstyle =
 
         
     # else:
-    if remove_m1:
-        freqpos = []
-        for pos in freqpos_list:
-            new_pos = pos-1
-            freqpos.append(new_pos)
-    else:
-        freqpos = freqpos_list
-
-    for i, p in enumerate(freqpos):
-        if i == 0:
-            selection = f"chain A and :{1}-{(freqpos[i]) + 1}"
-            selection_list.append(selection)
-        if i != 0:
-            selection = f"chain A and :{freqpos[i-1] + 2}-{freqpos[i] + 1}"
-            selection_list.append(selection)
-    
+    selection_list = get_peptide_abundance_selections(freqpos_list, remove_m1=remove_m1)
 
     for i, f in enumerate(freq_list):
         viewer.setStyle({'resi': selection_list[i]}, {pepstyle: {'color': colors[f],'radius':size}})
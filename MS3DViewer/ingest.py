@@ -0,0 +1,206 @@
+# Standard library imports
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom module imports
+from dataset import get_partial_dataset_id, load_dataset
+from shared_dataset import read_job_status, remove_dataset, remove_job_status, save_dataset, write_job_status
+
+# Stages reported by dataset.load_dataset, in order, with the text shown while they run
+INGEST_STAGES = {
+    'parse': 'Reading workbook',
+    'structures': 'Loading proteins and structures',
+    'index': 'Building proteome index',
+}
+
+# Uploaded workbooks are loaded on background threads, so the Dash callbacks return immediately
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ingest')
+_jobs = {}
+
+# Finished jobs are kept this long (in seconds), so every poll that overlaps the end of a job sees its final status
+JOB_TTL = 600
+
+
+class IngestJob:
+    """
+    Represents the background load of one uploaded workbook and the progress it has made.
+
+    Attributes:
+        file_path (str): Path to the workbook being loaded.
+        dataset_id (str): Id the dataset gets in the dataset store.
+        partial_dataset_id (str): Id of the dataset with only the first protein, see dataset.get_partial_dataset_id.
+        stage (str): The stage currently running, one of INGEST_STAGES.
+        done (int): Number of steps of the stage finished.
+        total (int): Number of steps of the stage.
+        first_protein_ready (bool): Whether the dataset with the first protein is already in the store, and in the
+            shared folder when there is one.
+        cancelled (bool): Whether the result is no longer wanted, e.g. because another file was uploaded.
+        finished (float): time.monotonic() when the job ended, or None while it runs.
+        shared_folder (str): Folder the dataset and the job status are written to when several worker processes
+            serve the app, or None.
+        store (DatasetStore): The store the dataset is added to.
+    """
+
+    def __init__(self, file_path, dataset_id, job_id=None, shared_folder=None, store=None):
+        self.file_path = file_path
+        self.dataset_id = dataset_id
+        self.partial_dataset_id = get_partial_dataset_id(dataset_id)
+        self.job_id = job_id
+        self.shared_folder = shared_folder
+        self.store = store
+        self.stage = 'parse'
+        self.done = 0
+        self.total = 1
+        self.first_protein_ready = False
+        self.cancelled = False
+        self.finished = None
+        self.future = None
+
+    def __repr__(self) -> str:
+        return f"IngestJob(dataset_id={self.dataset_id}, stage={self.stage}, done={self.done}, total={self.total})"
+
+    def report(self, stage, done, total):
+        self.stage = stage
+        self.done = done
+        self.total = total
+        if not self.cancelled:
+            self.write_status('running')
+
+    def write_status(self, status, error=None):
+        """Writes the progress to the shared folder, so worker processes not running the job can report it."""
+        if self.shared_folder is not None:
+            write_job_status(self.job_id, {'status': status, 'error': error, 'file_path': self.file_path, 'dataset_id': self.dataset_id,
+                                           'stage': self.stage, 'done': self.done, 'total': self.total,
+                                           'first_protein_ready': self.first_protein_ready}, self.shared_folder)
+
+    @classmethod
+    def from_status(cls, job_id, status):
+        """Creates a job from the status written by another worker process, see write_status."""
+        job = cls(status['file_path'], status['dataset_id'], job_id=job_id)
+        job.stage, job.done, job.total = status['stage'], status['done'], status['total']
+        job.first_protein_ready = status['first_protein_ready']
+        return job
+
+    def describe(self):
+        """
+        Returns the progress of the job as text.
+
+        Example:
+        >>> job.describe()
+        'Loading proteins and structures (2 of 5)...'
+        """
+        if self.stage == 'structures':
+            return f'{INGEST_STAGES[self.stage]} ({self.done} of {self.total})...'
+        return f'{INGEST_STAGES[self.stage]}...'
+
+
+def _remove_partial_dataset(job):
+    job.store.remove(job.partial_dataset_id)
+    if job.shared_folder is not None:
+        remove_dataset(job.partial_dataset_id, job.shared_folder)
+
+
+def _ingest(job):
+    store = job.store
+
+    def first_protein_loaded(partial_dataset):
+        if not job.cancelled:
+            # Saved like the full dataset, so every worker process can show it while the others load
+            if job.shared_folder is not None:
+                save_dataset(partial_dataset, job.shared_folder)
+            store.add(partial_dataset)
+            job.first_protein_ready = True
+            job.write_status('running')
+
+    try:
+        dataset = load_dataset(job.file_path, dataset_id=job.dataset_id, progress=job.report, on_first_protein=first_protein_loaded)
+        if job.cancelled:
+            _remove_partial_dataset(job)
+            job.write_status('cancelled')
+            return dataset.dataset_id
+        if job.shared_folder is not None:
+            save_dataset(dataset, job.shared_folder)
+        store.add(dataset)
+    except Exception as error:
+        job.write_status('failed', str(error))
+        raise
+    finally:
+        job.finished = time.monotonic()
+    job.write_status('done')
+    return dataset.dataset_id
+
+
+def _forget_finished_jobs():
+    """
+    Drops the jobs that ended more than JOB_TTL seconds ago, with the status they wrote to the shared folder and
+    their dataset with the first protein, which pages have stopped using by then.
+    """
+    now = time.monotonic()
+    for job_id, job in list(_jobs.items()):
+        if job.finished is not None and now - job.finished > JOB_TTL:
+            _jobs.pop(job_id, None)
+            _remove_partial_dataset(job)
+            if job.shared_folder is not None:
+                remove_job_status(job_id, job.shared_folder)
+
+
+def submit_ingest(file_path, store, dataset_id=None, shared_folder=None):
+    """
+    Queues the load of an uploaded workbook on a background worker. The dataset is added to the store under
+    dataset_id once it is loaded; a dataset with only the first protein is added under its own id (see
+    IngestJob.partial_dataset_id) as soon as that protein is loaded.
+
+    Parameters:
+    - file_path (str): Path to the uploaded workbook.
+    - store (DatasetStore): The store the dataset is added to.
+    - dataset_id (str): Id to give the dataset. A new id is made if None.
+    - shared_folder (str): Folder to save the dataset and the job status to, so other worker processes can open
+      them, or None when the app runs in one process.
+
+    Returns:
+    - str: The job id to pass to get_ingest_status.
+    """
+    _forget_finished_jobs()
+    job_id = uuid.uuid4().hex
+    job = IngestJob(file_path, dataset_id if dataset_id is not None else uuid.uuid4().hex, job_id=job_id, shared_folder=shared_folder, store=store)
+    _jobs[job_id] = job
+    job.future = _executor.submit(_ingest, job)
+    return job_id
+
+
+def cancel_ingest(job_id):
+    """
+    Marks a job as no longer wanted, so its dataset is not kept in the store. The load itself runs to the end, and
+    the job reports 'cancelled' from now on.
+    """
+    job = _jobs.get(job_id)
+    if job is not None:
+        job.cancelled = True
+        job.write_status('cancelled')
+
+
+def get_ingest_status(job_id, shared_folder=None):
+    """
+    Returns the state of an ingest job as a tuple (status, result), where status is 'running', 'done', 'cancelled'
+    or 'failed' and result is the IngestJob, or the error message for 'failed'. Finished jobs are forgotten
+    JOB_TTL seconds after they end. Jobs running in another worker process are read from the status they write
+    to shared_folder.
+    """
+    _forget_finished_jobs()
+    job = _jobs.get(job_id)
+    if job is None and shared_folder is not None:
+        status = read_job_status(job_id, shared_folder)
+        if status is not None:
+            if status['status'] == 'failed':
+                return 'failed', status['error']
+            return status['status'], IngestJob.from_status(job_id, status)
+    if job is None:
+        return 'failed', 'Unknown ingest job'
+    if job.cancelled:
+        return 'cancelled', job
+    if not job.future.done():
+        return 'running', job
+    if job.future.exception() is not None:
+        return 'failed', str(job.future.exception())
+    return 'done', job
@@ -0,0 +1,181 @@
+# Standard library imports
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_ROUTE = '/metrics'
+WINDOW = 200 # recent timings kept per callback and stage for the rolling panel and the quantiles
+QUANTILES = [0.5, 0.9, 0.99]
+
+# Stages of loading and showing a workbook, in pipeline order, with the text shown in the performance panel
+STAGES = {
+    'workbook_load': 'Workbook load',
+    'peptide_extraction': 'Peptide extraction',
+    'structure_fetch': 'Structure fetch',
+    'sequence_parse': 'Sequence parse',
+    'index_build': 'Proteome index build',
+    'atlas_build': 'Atlas build',
+    'viewer_build': 'Viewer build',
+}
+
+
+class Timing:
+    """
+    Call count, total wall time and total payload size of one callback or stage, and its most recent timings.
+
+    Attributes:
+        count (int): Number of calls recorded.
+        seconds (float): Total wall time of the calls.
+        bytes (int): Total payload size of the calls, e.g. the size of the callback responses.
+        recent (deque): (seconds, bytes) of the last WINDOW calls.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def __repr__(self) -> str:
+        return f"Timing(count={self.count}, seconds={self.seconds:.3f}, bytes={self.bytes})"
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+        self.recent.append((seconds, size))
+
+    def quantile(self, q):
+        """Returns the q-quantile of the recent wall times, or 0 if nothing was recorded."""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(seconds for seconds, _ in self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """
+    Thread-safe registry of the timings of the Dash callbacks and the pipeline stages of this process.
+
+    Timings are kept per kind ('callback' or 'stage') and name. Every worker process keeps its own registry, so
+    when several workers serve the app each one reports the requests it handled.
+    """
+
+    def __init__(self):
+        self._timings = {} # (kind, name) -> Timing
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Metrics(timings={len(self._timings)})"
+
+    def record(self, kind, name, seconds, size=0):
+        with self._lock:
+            timing = self._timings.get((kind, name))
+            if timing is None:
+                timing = self._timings[(kind, name)] = Timing()
+            timing.add(seconds, size)
+
+    @contextmanager
+    def timed(self, kind, name):
+        """
+        Records the wall time of the block under kind and name, also when it raises.
+
+        Example:
+        >>> with metrics.timed('stage', 'atlas_build'):
+        ...     figure = build_atlas()
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Returns the recorded timings as a list of dicts, one per callback and stage, sorted by kind and name, with
+        the totals and the mean and 90th percentile of the recent calls.
+        """
+        with self._lock:
+            items = sorted(self._timings.items())
+            rows = []
+            for (kind, name), timing in items:
+                recent = [seconds for seconds, _ in timing.recent]
+                rows.append({'kind': kind, 'name': name, 'count': timing.count, 'seconds': timing.seconds,
+                             'bytes': timing.bytes, 'recent_mean': sum(recent) / len(recent) if recent else 0.0,
+                             'recent_p90': timing.quantile(0.9), 'last_bytes': timing.recent[-1][1] if timing.recent else 0})
+        return rows
+
+    def render_prometheus(self):
+        """Returns the timings in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind in ['callback', 'stage']:
+                timings = sorted((name, timing) for (timing_kind, name), timing in self._timings.items() if timing_kind == kind)
+                metric = f'ms3dviewer_{kind}_seconds'
+                lines.append(f'# HELP {metric} Wall time of the {kind}s, with quantiles over the last {WINDOW} calls.')
+                lines.append(f'# TYPE {metric} summary')
+                for name, timing in timings:
+                    for q in QUANTILES:
+                        lines.append(f'{metric}{{{kind}="{name}",quantile="{q}"}} {timing.quantile(q):.6f}')
+                    lines.append(f'{metric}_sum{{{kind}="{name}"}} {timing.seconds:.6f}')
+                    lines.append(f'{metric}_count{{{kind}="{name}"}} {timing.count}')
+            timings = sorted((name, timing) for (kind, name), timing in self._timings.items() if kind == 'callback')
+            metric = 'ms3dviewer_callback_response_bytes_total'
+            lines.append(f'# HELP {metric} Total size of the callback responses.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, timing in timings:
+                lines.append(f'{metric}{{callback="{name}"}} {timing.bytes}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._timings.clear()
+
+
+# The registry of this process, filled by the request hooks of register_metrics_route and by stage()
+metrics = Metrics()
+
+
+def stage(name):
+    """
+    Times a pipeline stage, one of STAGES.
+
+    Example:
+    >>> with stage('structure_fetch'):
+    ...     pdb_file = retrieve_fromURL(url)
+    """
+    return metrics.timed('stage', name)
+
+
+def get_callback_name(app, output):
+    """Returns the name of the function of the callback with the given output, or the output if it is not found."""
+    callback = app.callback_map.get(output, {}).get('callback')
+    return getattr(callback, '__name__', output)
+
+
+def register_metrics_route(app):
+    """
+    Times every Dash callback request of the app, with the size of its response, and adds the metrics route to
+    its Flask server, which serves the timings in the Prometheus text format.
+    """
+    # Imported here, so the loading pipeline can time its stages without depending on Flask
+    from flask import Response, g, request
+    server = app.server
+
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    def record_callback(response):
+        if 'metrics_start' in g and request.path.endswith('/_dash-update-component'):
+            body = request.get_json(silent=True) or {}
+            size = response.calculate_content_length() or 0
+            metrics.record('callback', get_callback_name(app, body.get('output', '')), time.perf_counter() - g.metrics_start, size)
+        return response
+
+    def serve_metrics():
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    server.before_request(start_timer)
+    server.after_request(record_callback)
+    server.add_url_rule(METRICS_ROUTE, 'serve_metrics', serve_metrics)
@@ -10,7 +10,7 @@ def open_workbook(file_path=''):
     does not exist. Continues to prompt until a valid file path is provided.
     
     Parameters:
-    - file_path (str): Path to the Excel file. If empty, the function will prompt for it.
+    - file_path (str or file): Path to the Excel file, or the file opened in binary mode. If empty, the function will prompt for it.
     
     Returns:
     - openpyxl.worksheet.worksheet.Worksheet: Worksheet object for the 'Proteins' sheet.
@@ -24,6 +24,9 @@ def open_workbook(file_path=''):
     - This function requires the 'openpyxl' module and 'os' module to be imported.
     - It is assumed that the 'Proteins' sheet exists in the Excel workbook.
     """
+    if hasattr(file_path, 'read'):
+        return openpyxl.load_workbook(filename=file_path)['Proteins']
+
     if file_path is None or file_path == '':
         file_path = input("Please provide the filepath below:\n")
     
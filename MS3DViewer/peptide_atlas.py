@@ -1,80 +1,124 @@
 
+import heapq
+import math
+import numpy as np
 import pandas as pd
 import plotly.express as px
-import ast
+from plotly import graph_objects as go
 
 from symbol_assignation import symbol_assignation
 import get_colors
 from classes import Peptide
 
-def peptide_atlas(peptides:list[Peptide],nterm,gap:int=1,range_max = None,remove_m1=False):
-    if remove_m1:
-        data = {
-            "Sequence": [peptide.sequence for peptide in peptides],
-            "Proteins": [peptide.protein_accession for peptide in peptides],
-            "Start position": [peptide.start_position-1 for peptide in peptides],
-            "End position":[peptide.end_position-1 for peptide in peptides],
-            "Position range":[peptide.get_position_range(remove_M1=True) for peptide in peptides],
-            "Modifications":[peptide.modifications for peptide in peptides],
-            "Modification position": [peptide.get_modified_modification_dict(nterm) for peptide in peptides]
-            }
-        sequence = peptides[0].protein.master_sequence[1:]
+ATLAS_LAYOUTS = ['heap', 'first-fit']
+ATLAS_RENDERERS = ['webgl', 'svg']
+LOD_MAX_RESIDUES = 1000 # widest window drawn with individual peptides and residue letters
+LOD_MAX_BINS = 500 # number of coverage bins in the zoomed-out overview
+
+
+def assign_rows(starts, ends, gap:int=1, layout='heap'):
+    """
+    Assigns every peptide to a row of the atlas, so that peptides sharing a row are at least `gap` residues apart.
+
+    Parameters:
+    - starts (list of int): Start positions of the peptides, sorted in ascending order.
+    - ends (list of int): End positions of the peptides, in the same order as starts.
+    - gap (int): Minimum distance between the end of one peptide and the start of the next one in the same row.
+    - layout (str): 'heap' keeps a min-heap of row end positions and places each peptide in the row that ends first,
+      which runs in O(n log n) and uses the fewest rows. 'first-fit' places each peptide in the first row it fits in,
+      scanning all rows, which is O(n x rows).
+
+    Returns:
+    - list of int: The row of each peptide.
+
+    Example:
+    >>> assign_rows([1, 3, 8], [5, 9, 12], gap=1)
+    [0, 1, 0]
+    """
+    rows = []
+    if layout == 'heap':
+        row_ends = [] # (end position, row) of the last peptide in each row
+        for s,e in zip(starts,ends):
+            if row_ends and s >= row_ends[0][0]+gap:
+                row = heapq.heappop(row_ends)[1]
+            else:
+                row = len(row_ends) # every open row is in the heap, so this is a new row
+            rows.append(row)
+            heapq.heappush(row_ends,(e,row))
+
+    elif layout == 'first-fit':
+        trace_ends = [-gap]
+        for s,e in zip(starts,ends):
+            traced = False
+            for t in range(len(trace_ends)):
+                if s >= trace_ends[t]+gap:
+                    rows.append(t)
+                    trace_ends[t] = e
+                    traced = True
+                    break
+            if not traced:
+                rows.append(len(trace_ends))
+                trace_ends.append(e)
     else:
-        data = {
-            "Sequence": [peptide.sequence for peptide in peptides],
-            "Proteins": [peptide.protein_accession for peptide in peptides],
-            "Start position": [peptide.start_position for peptide in peptides],
-            "End position":[peptide.end_position for peptide in peptides],
-            "Position range":[peptide.get_position_range() for peptide in peptides],
-            "Modifications":[peptide.modifications for peptide in peptides],
-            "Modification position": [peptide.get_modified_modification_dict(nterm) for peptide in peptides]
-            }
-        sequence = peptides[0].protein.master_sequence
-
-    pg = pd.DataFrame(data).sort_values(['Start position', 'End position'])
-
-    grouppg = pg
-    # Convert columns containing lists or dictionaries to strings
-    grouppg['Position range'] = grouppg['Position range'].astype(str)
-    grouppg['Modifications'] = grouppg['Modifications'].astype(str)
-    grouppg['Modification position'] = grouppg['Modification position'].astype(str)
-
-    # Define a function to safely convert string back to original type
-    def convert_to_original(data):
-        try:
-            return ast.literal_eval(data)
-        except (ValueError, SyntaxError):
-            return data  # Return as is if conversion is not possible
-
-
-    # Group by all columns and count the occurrences
-    grouped = grouppg.groupby(list(grouppg.columns)).size().reset_index(name='Count')
-
-    grouped['Position range'] = grouped['Position range'].apply(convert_to_original)
-    grouped['Modifications'] = grouped['Modifications'].apply(convert_to_original)
-    grouped['Modification position'] = grouped['Modification position'].apply(convert_to_original)
-
-    grouped = grouped.sort_values(['Start position', 'End position'])
-
-    grouped.to_excel('peptide_atlas.xlsx',index=False)
-
-    
-    trace_ends, traces = [-gap], []
-    for s,e in zip(grouped["Start position"],grouped["End position"]):
-        traced = False
-        for t in range(len(trace_ends)):
-            if s >= trace_ends[t]+gap:
-                traces.append(t)
-                trace_ends[t] = e
-                traced = True
-                break
-        if not traced:
-            traces.append(len(trace_ends))
-            trace_ends.append(e)
-    grouped.insert(0,"Trace",traces)
-    grouped.insert(0,"Index",grouped.index)
-
-
+        raise ValueError(f'Atlas layout must be one of {ATLAS_LAYOUTS}, not {layout}')
+    return rows
+
+
+def get_modification_signature(modifications):
+    """
+    Returns a hashable signature of a peptide's modification dictionary, independent of the order of the modifications.
+
+    Example:
+    >>> get_modification_signature({'Methyl': ['K2'], 'Acetyl': ['K9']})
+    (('Acetyl', ('K9',)), ('Methyl', ('K2',)))
+    """
+    return tuple(sorted((modification, tuple(positions)) for modification, positions in modifications.items()))
+
+
+def group_peptides(peptides:list[Peptide],nterm,remove_m1=False):
+    """
+    Groups identical peptides and counts them. Peptides are identical when they share start and end position,
+    sequence and modifications, and the grouping is done on those values as a tuple key.
+
+    Parameters:
+    - peptides (list of Peptide): The peptides to group.
+    - nterm (bool): Whether N-terminal modifications are included in 'Modification position'.
+    - remove_m1 (bool): Whether positions are shifted by one to match a structure without the leader MET.
+
+    Returns:
+    - DataFrame: One row per distinct peptide with its 'Count', sorted by start and end position.
+    """
+    shift = 1 if remove_m1 else 0
+
+    # Count the peptides on (start, end, sequence, modifications) and keep the first peptide of each group
+    counts = {}
+    representatives = {}
+    for peptide in peptides:
+        key = (peptide.start_position, peptide.end_position, peptide.sequence, get_modification_signature(peptide.modifications))
+        if key in counts:
+            counts[key] += 1
+        else:
+            counts[key] = 1
+            representatives[key] = peptide
+    keys = sorted(counts, key=lambda key: (key[0], key[1]))
+
+    grouped = pd.DataFrame({
+        "Sequence": [key[2] for key in keys],
+        "Proteins": [representatives[key].protein_accession for key in keys],
+        "Start position": [key[0]-shift for key in keys],
+        "End position": [key[1]-shift for key in keys],
+        "Position range": [representatives[key].get_position_range(remove_M1=remove_m1) for key in keys],
+        "Modifications": [representatives[key].modifications for key in keys],
+        "Modification position": [representatives[key].get_modified_modification_dict(nterm) for key in keys],
+        "Count": [counts[key] for key in keys],
+        })
+    return grouped
+
+
+def create_line_atlas(grouped, range_max=None):
+    """
+    Draws the atlas with Plotly Express, one SVG line trace per distinct peptide and one point per residue.
+    """
     x_v = [x for x in grouped['Position range']]
     y_v = [y for y in grouped["Trace"]]
     ps = [s for s in grouped['Start position']]
@@ -128,44 +172,213 @@ def peptide_atlas(peptides:list[Peptide],nterm,gap:int=1,range_max = None,remove
                  title=f"Peptides identified for {grouped.Proteins.iloc[0]}",
                  hover_data = {'Residue':True,'y_values':False,'Start position':True,'End position':True,'pep_index':False,'PSM Count':True})\
     .update_traces(line_width=5,showlegend=False).update_yaxes(visible=False).update_xaxes(showgrid=True,title_text = '')
-
-    
-    ticktext = []
-    for letter in sequence:
-        ticktext.append(letter)
-    tickvals = list(range(1,len(sequence)+1))
-    pa.update_xaxes(ticktext=ticktext,tickvals=tickvals,side='top')
+    return pa
+
+
+def create_webgl_atlas(grouped, range_max=None):
+    """
+    Draws the atlas with WebGL line traces, one per PSM count color instead of one per peptide. The peptides of a
+    color are segments of the same trace, separated by gaps, and every segment point carries the peptide start, end
+    and PSM count as custom data, so the number of traces does not grow with the number of peptides.
+    """
+    colors = get_colors.get_mod_freq_colors(freq_vals=list(grouped['Count']),c_color='viridis_r',isdict=False)
+    max_row = grouped['Trace'].max()
+
+    pa = go.Figure()
+    for count, peptides in grouped.groupby('Count', sort=True):
+        starts = peptides['Start position'].to_numpy(dtype=float)
+        ends = peptides['End position'].to_numpy(dtype=float)
+        rows = peptides['Trace'].to_numpy(dtype=float)
+        gaps = np.full(len(starts), np.nan)
+
+        # Start, middle and end point of each peptide, followed by a gap that breaks the line
+        x = np.column_stack([starts, np.floor((starts + ends) / 2), ends, gaps]).ravel()
+        y = np.column_stack([rows, rows, rows, gaps]).ravel()
+        customdata = np.repeat(np.column_stack([starts, ends, np.full(len(starts), count)]), 4, axis=0)
+        pa.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            customdata=customdata,
+            mode='lines',
+            line=dict(color=colors[count], width=5),
+            showlegend=False,
+            hovertemplate="Residue=%{x}<br>Start position=%{customdata[0]}<br>End position=%{customdata[1]}<br>PSM Count=%{customdata[2]}<extra></extra>",
+        ))
 
     pa.update_layout(
-        title_font=dict(family='Georgia',size = 18),
+        template="ggplot2",
+        height=100+30*(max_row+3),
+        title=f"Peptides identified for {grouped.Proteins.iloc[0]}",
     )
-    return pa, pg, grouped
+    pa.update_xaxes(range=[0,grouped['End position'].max() if range_max is None else range_max],showgrid=True,title_text = '')
+    pa.update_yaxes(range=[-0.5,(max_row+0.5)],visible=False)
+    return pa
 
 
+def peptide_atlas(peptides:list[Peptide],nterm,gap:int=1,range_max = None,remove_m1=False,layout='heap',render='webgl',window=None):
+    if remove_m1:
+        sequence = peptides[0].protein.master_sequence[1:]
+    else:
+        sequence = peptides[0].protein.master_sequence
 
+    grouped = group_peptides(peptides,nterm,remove_m1=remove_m1)
+
+    traces = assign_rows(grouped["Start position"],grouped["End position"],gap=gap,layout=layout)
+    grouped.insert(0,"Trace",traces)
+    grouped.insert(0,"Index",grouped.index)
+
+    if render == 'webgl':
+        pa = create_webgl_atlas(grouped, range_max=range_max)
+    elif render == 'svg':
+        pa = create_line_atlas(grouped, range_max=range_max)
+    else:
+        raise ValueError(f'Atlas renderer must be one of {ATLAS_RENDERERS}, not {render}')
+
+    if window is None:
+        ticktext = []
+        for letter in sequence:
+            ticktext.append(letter)
+        tickvals = list(range(1,len(sequence)+1))
+    else:
+        # Only label the residues of the visible window, and half a window on each side for panning
+        lo, hi = window
+        pad = (hi-lo)//2
+        tickvals = list(range(max(1,lo-pad),min(len(sequence),hi+pad)+1))
+        ticktext = [sequence[val-1] for val in tickvals]
+        pa.update_xaxes(range=[lo,hi])
+    pa.update_xaxes(ticktext=ticktext,tickvals=tickvals,side='top')
+
+    pa.update_layout(
+        title_font=dict(family='Georgia',size = 18),
+    )
+    return pa, grouped
+
+
+
+
+def create_coverage_overview(coverage, accession, window=None, remove_m1=False, max_bins=LOD_MAX_BINS):
+    """
+    Draws the zoomed-out level of the atlas: the mean number of peptides covering the residues of each bin, with at
+    most max_bins bins over the visible window. Each bar carries its first and last residue as custom data, so
+    clicking it zooms the 3D viewer to that region like clicking a peptide does.
+
+    Parameters:
+    - coverage (list of int): Number of peptides covering each residue, as returned by get_colors.get_position_frequency.
+    - accession (str): Accession number of the protein, used in the title.
+    - window (tuple of int): First and last visible position. The whole protein is shown if None.
+    - remove_m1 (bool): Whether positions are shifted by one to match a structure without the leader MET.
+    - max_bins (int): Maximum number of bins.
+
+    Returns:
+    - Figure: The coverage overview.
+    """
+    coverage = np.asarray(coverage, dtype=float)
+    positions = np.arange(1, len(coverage)+1) - (1 if remove_m1 else 0)
+    lo, hi = window if window is not None else (max(1, positions[0]), positions[-1])
+    in_window = (positions >= lo) & (positions <= hi)
+
+    bin_size = max(1, math.ceil((hi-lo+1)/max_bins))
+    bins = (positions[in_window]-lo)//bin_size
+    mean_coverage = np.bincount(bins, weights=coverage[in_window])/np.maximum(np.bincount(bins), 1)
+    starts = lo + np.arange(len(mean_coverage))*bin_size
+    ends = np.minimum(starts+bin_size-1, hi)
+
+    pa = go.Figure(go.Bar(
+        x=(starts+ends)/2,
+        y=mean_coverage,
+        width=bin_size,
+        customdata=np.column_stack([starts, ends]),
+        marker=dict(color=mean_coverage, colorscale='viridis_r', line=dict(width=0)),
+        hovertemplate="Residues %{customdata[0]}-%{customdata[1]}<br>Mean peptide count=%{y:.1f}<extra></extra>",
+    ))
+    pa.update_layout(
+        template="ggplot2",
+        height=400,
+        title=f"Peptide coverage for {accession} (zoom in to see individual peptides)",
+        title_font=dict(family='Georgia',size = 18),
+        bargap=0,
+    )
+    pa.update_xaxes(range=[lo, hi], side='top', showgrid=True, title_text='')
+    pa.update_yaxes(title_text='Peptides per residue')
+    return pa
+
+
+def lod_peptide_atlas(peptides:list[Peptide],nterm,window=None,coverage=None,gap:int=1,range_max=None,remove_m1=False,layout='heap',render='webgl',max_residues=LOD_MAX_RESIDUES):
+    """
+    Level-of-detail peptide atlas. When the visible window spans more than max_residues residues, an aggregated
+    coverage overview is drawn instead of the peptides. Otherwise the peptides overlapping the window (and half a
+    window on each side) are drawn with their modifications, and residue letters are only set for that range.
+
+    Parameters:
+    - peptides (list of Peptide): The peptides of the protein to show.
+    - nterm (bool): Whether N-terminal modifications are shown.
+    - window (tuple of int): First and last visible position. The whole protein is shown if None.
+    - coverage (list of int): Number of peptides covering each residue. Computed from the peptides if None.
+    - gap, range_max, remove_m1, layout, render: As for peptide_atlas.
+    - max_residues (int): Widest window drawn with individual peptides.
+
+    Returns:
+    - tuple: The figure and the grouped peptides shown, or None when the overview is shown.
+    """
+    protein = peptides[0].protein
+    shift = 1 if remove_m1 else 0
+    length = len(protein.master_sequence) - shift
+    lo, hi = window if window is not None else (0, range_max if range_max is not None else length)
+
+    if hi - lo > max_residues:
+        if coverage is None:
+            coverage = get_colors.get_position_frequency(protein, peptides)
+        return create_coverage_overview(coverage, protein.accession, window=window, remove_m1=remove_m1), None
+
+    pad = (hi-lo)//2
+    visible = [peptide for peptide in peptides if peptide.start_position-shift <= hi+pad and peptide.end_position-shift >= lo-pad]
+    if len(visible) == 0:
+        if coverage is None:
+            coverage = get_colors.get_position_frequency(protein, peptides)
+        return create_coverage_overview(coverage, protein.accession, window=(lo, hi), remove_m1=remove_m1), None
+
+    pa, grouped = peptide_atlas(visible, nterm, gap=gap, range_max=range_max, remove_m1=remove_m1, layout=layout, render=render, window=window)
+    pa = add_modification_legend(pa, grouped, protein, nterm, remove_m1=remove_m1, render=render)
+    return pa, grouped
+
+
+def get_modification_table(pg):
+    """
+    Explodes the 'Modification position' dictionaries of the grouped peptides into one table with a row per
+    modified position, so the markers of every modification type can be sliced from it.
+
+    Parameters:
+    - pg (DataFrame): The grouped peptides of an atlas, with the 'Trace' column assigned.
+
+    Returns:
+    - DataFrame: Columns 'Modification' (categorical), 'Position', 'Trace', 'Start position' and 'End position',
+      in the order of the peptides in pg.
+    """
+    sites = pg['Modification position'].map(
+        lambda modifications: [(modification, position) for modification, positions in modifications.items() for position in positions]
+    ).explode().dropna()
+    table = pd.DataFrame(sites.tolist(), index=sites.index, columns=['Modification', 'Position'])
+    table = table.join(pg[['Trace', 'Start position', 'End position']])
+    return table.astype({'Modification': 'category', 'Position': 'int64'})
+
+
+def get_modification_scatter_values(pg,mod_of_interest,modification_table=None):
+    if modification_table is None:
+        modification_table = get_modification_table(pg)
+    sites = modification_table[modification_table['Modification'] == mod_of_interest]
+    return list(sites['Position']),list(sites['Trace']),list(sites['Start position']),list(sites['End position'])
+
+
+def add_modification_legend(pa, pg, protein,nterm, remove_m1=False, render='webgl'):
+    # Draw the modification markers with WebGL too when the atlas is drawn with WebGL
+    scatter = go.Scattergl if render == 'webgl' else go.Scatter
+    shift = 1 if remove_m1 else 0
+
+    # One pass over the peptides, every marker trace is a slice of this table
+    modification_table = get_modification_table(pg)
+    sites_by_modification = dict(list(modification_table.groupby('Modification', observed=True, sort=False)))
+    no_sites = modification_table.iloc[0:0]
 
-def get_modification_scatter_values(pg,mod_of_interest):
-    x_values = []
-    y_values = []
-    start = []
-    end = []
-
-    for index,row in pg.iterrows():
-        modifications = row["Modification position"]
-        for modification,positions in modifications.items():
-            if modification == mod_of_interest:
-                for position in positions:
-                    x_values.append(position)
-                    trace_value = pg.at[index,'Trace']
-                    y_values.append(trace_value)
-                    peptide_start = pg.at[index,'Start position']
-                    peptide_end = pg.at[index,'End position']
-                    start.append(peptide_start)
-                    end.append(peptide_end)
-    return x_values,y_values,start,end
-
-
-def add_modification_legend(pa, pg, protein,nterm, remove_m1=False):
     for modis in protein.get_protein_modification_types(nterm).values():
         for modi in modis:
             if modi=='Phospho':
@@ -174,52 +387,26 @@ def add_modification_legend(pa, pg, protein,nterm, remove_m1=False):
                 modification=f'{modi}ation'
             #symbol depending on modification
             symbol,color,linecolor,size = symbol_assignation(modi)
-                
-            x_val, y_val, start, end = get_modification_scatter_values(pg, modi)
-            custom_data = [(s, e) for s, e in zip(start, end)]
-            if remove_m1:
-                new_x = [x-1 for x in x_val]
-                pa.add_scatter(
-                    showlegend=True, 
-                    x=new_x, 
-                    y=y_val,
-                    customdata = custom_data, 
-                    mode='markers', 
-                    legendgroup=modi,
-                    name=modi, 
-                    marker=dict(
-                        color=color,
-                        size=size,
-                        symbol=symbol,
-                        line=dict(
-                            color=linecolor,
-                            width = 2
-                        )
-                    ),
-                    hovertemplate=f"<b>{modification}</b><br>" +"Position in protein: %{x}%{x:,.0f}<br>"+"<extra></extra>",
-                )
-                #color_index = (color_index + 1) % len(colors)
 
-            else:
-                pa.add_scatter(
-                    showlegend=True, 
-                    x=x_val, 
-                    y=y_val,
-                    customdata = custom_data,
-                    mode='markers', 
-                    legendgroup=modi, 
-                    name=modi, 
-                    marker=dict(
-                        color=color,
-                        size=size,
-                        symbol=symbol,
-                        line=dict(
-                            color=linecolor,
-                            width = 2
-                        )
-                    ),
-                    hovertemplate=f"<b>{modification}</b><br>" +"Position in protein: %{x:,.0f}<br>"+"<extra></extra>",
-                )
-                #color_index = (color_index + 1) % len(colors)
+            sites = sites_by_modification.get(modi, no_sites)
+            pa.add_trace(scatter(
+                showlegend=True, 
+                x=sites['Position'].to_numpy()-shift, 
+                y=sites['Trace'].to_numpy(),
+                customdata = sites[['Start position', 'End position']].to_numpy(),
+                mode='markers', 
+                legendgroup=modi, 
+                name=modi, 
+                marker=dict(
+                    color=color,
+                    size=size,
+                    symbol=symbol,
+                    line=dict(
+                        color=linecolor,
+                        width = 2
+                    )
+                ),
+                hovertemplate=f"<b>{modification}</b><br>" +"Position in protein: %{x:,.0f}<br>"+"<extra></extra>",
+            ))
     pa.update_layout(legend_title_text = 'Modifications',legend_title_font=dict(family='Georgia',size = 18),legend_font=dict(family='Georgia',size = 14))
-    return pa
\ No newline at end of file
+    return pa
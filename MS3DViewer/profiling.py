@@ -0,0 +1,141 @@
+# Standard library imports
+import cProfile
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+PROFILE_FOLDER = 'profiles'
+
+# Profiling is configured by these environment variables, or by calling configure, e.g. from wsgi.py:
+#   MS3DVIEWER_PROFILE              comma-separated names of the functions to profile, or 'all'; profiling is off if unset
+#   MS3DVIEWER_PROFILE_DIR          folder the profiles are written to
+#   MS3DVIEWER_PROFILE_RATE         fraction of the calls that are profiled, so profiling can stay on under real load
+#   MS3DVIEWER_PROFILE_MIN_SECONDS  profiles of calls faster than this are not kept
+_config = {'targets': set(), 'folder': PROFILE_FOLDER, 'rate': 1.0, 'min_seconds': 0.0}
+
+# cProfile can only profile one call at a time, so calls arriving while another one is profiled run unprofiled
+_lock = threading.Lock()
+
+
+def configure(targets=None, folder=None, rate=None, min_seconds=None):
+    """
+    Sets which functions are profiled and where their profiles are written. Arguments left as None are read from
+    the environment variables above.
+
+    Parameters:
+    - targets (list of str): Names of the functions to profile, as given to profiled, or ['all']. Empty turns
+      profiling off.
+    - folder (str): Folder the profiles are written to.
+    - rate (float): Fraction of the calls that are profiled, between 0 and 1.
+    - min_seconds (float): Profiles of calls that take less than this are not written.
+    """
+    if targets is None:
+        targets = [name.strip() for name in os.environ.get('MS3DVIEWER_PROFILE', '').split(',') if name.strip()]
+    _config['targets'] = set(targets)
+    _config['folder'] = folder if folder is not None else os.environ.get('MS3DVIEWER_PROFILE_DIR', PROFILE_FOLDER)
+    _config['rate'] = float(rate if rate is not None else os.environ.get('MS3DVIEWER_PROFILE_RATE', 1.0))
+    _config['min_seconds'] = float(min_seconds if min_seconds is not None else os.environ.get('MS3DVIEWER_PROFILE_MIN_SECONDS', 0.0))
+
+
+def is_enabled(name):
+    targets = _config['targets']
+    return 'all' in targets or name in targets
+
+
+def get_parameters(func, args, kwargs):
+    """
+    Returns the arguments of a call by parameter name, keeping only values that can be written as JSON, e.g. the
+    accession and view settings of a callback. A Dataset is recorded by its dataset id.
+
+    Example:
+    >>> get_parameters(update_peptide_atlas, ('P02769', [], ['nterm'], 'All Samples', None, '9c41e0d2'), {})
+    {'accession': 'P02769', 'remove_m1': [], 'nterm': ['nterm'], 'sample': 'All Samples', 'atlas_window': None, 'dataset_id': '9c41e0d2'}
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+    except TypeError:
+        return {}
+    parameters = {}
+    for name, value in bound.arguments.items():
+        if hasattr(value, 'dataset_id'):
+            value = value.dataset_id
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        parameters[name] = value
+    return parameters
+
+
+def get_profile_path(name, parameters, folder):
+    """
+    Returns the path of the profile of one call, tagged with the time, the function and the accession, file or
+    dataset of the call.
+
+    Example:
+    >>> get_profile_path('update_peptide_atlas', {'accession': 'P02769'}, 'profiles')
+    'profiles/20240307-221405-update_peptide_atlas-P02769-3f2a9c41.prof'
+    """
+    tag = (parameters.get('accession') or os.path.basename(str(parameters.get('file_path', '')))
+           or parameters.get('dataset_id') or parameters.get('dataset') or 'none')
+    tag = re.sub(r'[^A-Za-z0-9_.-]', '_', str(tag))[:64]
+    return os.path.join(folder, f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{tag}-{uuid.uuid4().hex[:8]}.prof')
+
+
+def write_profile(profiler, name, parameters, seconds):
+    """Writes the profile of one call as a pstats file, next to a JSON file with its parameters and wall time."""
+    folder = _config['folder']
+    os.makedirs(folder, exist_ok=True)
+    path = get_profile_path(name, parameters, folder)
+    profiler.dump_stats(path)
+    with open(path[:-len('.prof')] + '.json', 'w') as f:
+        json.dump({'function': name, 'parameters': parameters, 'seconds': seconds, 'pid': os.getpid(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S')}, f)
+    return path
+
+
+def profiled(name=None):
+    """
+    Decorator that profiles calls of the function with cProfile when profiling is enabled for it, see configure.
+    Each profiled call is written to its own .prof file, which can be read with pstats or snakeviz. When profiling
+    is off the function is called directly.
+
+    Example:
+    >>> @profiled()
+    ... def update_peptide_atlas(accession, remove_m1, nterm, sample, atlas_window, dataset_id):
+    ...     ...
+    """
+    def decorator(func):
+        profile_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled(profile_name) or random.random() >= _config['rate'] or not _lock.acquire(blocking=False):
+                return func(*args, **kwargs)
+            try:
+                profiler = cProfile.Profile()
+                start = time.perf_counter()
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    seconds = time.perf_counter() - start
+                    if seconds >= _config['min_seconds']:
+                        try:
+                            write_profile(profiler, profile_name, get_parameters(func, args, kwargs), seconds)
+                        except OSError as error:
+                            print(f'Could not write the profile of {profile_name}: {error}')
+            finally:
+                _lock.release()
+        return wrapper
+    return decorator
+
+
+configure()
@@ -0,0 +1,317 @@
+# Standard library imports
+import json
+import os
+
+# Third-party library imports
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Custom module imports
+from classes import Protein, Peptide
+
+ALL_SAMPLES = 'All Samples'
+
+
+class ProteomeIndex:
+    """
+    Proteome-wide sparse matrices of residue coverage and modification-site PSM counts, built once
+    from the loaded Protein objects so dataset-wide questions can be answered without looping over proteins.
+
+    Every matrix has one row per protein (in load order) and one column per residue position, where
+    column 0 is residue 1. Coverage matrices hold the number of peptides covering each residue, site
+    matrices hold the number of PSMs carrying a modification type at each residue.
+
+    Attributes:
+        accessions (list): Accession numbers of the indexed proteins, in row order.
+        samples (list): Sample names the matrices are split by, 'All Samples' included.
+        lengths (ndarray): Length of the master sequence of each protein.
+        memory_mapped (bool): Whether the matrices are memory-mapped from files written by save.
+    """
+
+    def __init__(self, protein_list:list[Protein], samples_in_file):
+        self._memory_mapped = False
+        self._accessions = [protein.accession for protein in protein_list]
+        self._rows = {accession: row for row, accession in enumerate(self._accessions)}
+        self._lengths = np.array([len(protein.master_sequence) for protein in protein_list], dtype=np.int64)
+        self._samples = [ALL_SAMPLES] + list(samples_in_file)
+
+        pep_rows, pep_starts, pep_ends, pep_files = [], [], [], []
+        site_peps, site_positions, site_mods = [], [], []
+        for row, protein in enumerate(protein_list):
+            for peptide in protein.peptides:
+                peptide:Peptide
+                # N-Term sites are kept under their own '<mod>|N-Term' type and filtered at query time
+                for modification, positions in peptide.get_modified_modification_dict(nterm=True).items():
+                    for position in positions:
+                        site_peps.append(len(pep_rows))
+                        site_positions.append(position)
+                        site_mods.append(modification)
+                pep_rows.append(row)
+                pep_starts.append(peptide.start_position)
+                pep_ends.append(peptide.end_position)
+                pep_files.append(peptide.file_id)
+
+        self._pep_rows = np.array(pep_rows, dtype=np.int64)
+        self._pep_starts = np.array(pep_starts, dtype=np.int64)
+        self._pep_ends = np.array(pep_ends, dtype=np.int64)
+        self._width = int(max(self._lengths.max(initial=0), self._pep_ends.max(initial=0)))
+
+        # Peptides belong to a sample when their file ID is part of the sample name, as in Protein.get_peptides_by_file_id
+        file_codes, file_ids = pd.factorize(pd.Series(pep_files, dtype=object))
+        self._sample_masks = {ALL_SAMPLES: np.ones(len(pep_rows), dtype=bool)}
+        for sample in samples_in_file:
+            codes_in_sample = [code for code, file_id in enumerate(file_ids) if file_id in sample]
+            self._sample_masks[sample] = np.isin(file_codes, codes_in_sample)
+
+        mod_codes, self._mod_types = pd.factorize(pd.Series(site_mods, dtype=object))
+        self._mod_types = list(self._mod_types)
+        site_peps = np.array(site_peps, dtype=np.int64)
+        site_rows = self._pep_rows[site_peps]
+        site_cols = np.array(site_positions, dtype=np.int64) - 1
+
+        self._coverage = {}
+        self._sites = {}
+        for sample, mask in self._sample_masks.items():
+            self._coverage[sample] = self._coverage_matrix(mask)
+            site_mask = mask[site_peps]
+            for code, modification in enumerate(self._mod_types):
+                selected = site_mask & (mod_codes == code)
+                self._sites[(sample, modification)] = sparse.csr_matrix(
+                    (np.ones(selected.sum(), dtype=np.int64), (site_rows[selected], site_cols[selected])),
+                    shape=self.shape
+                )
+
+    def __repr__(self) -> str:
+        return f"ProteomeIndex(proteins={len(self._accessions)}, samples={len(self._samples)}, mod_types={len(self._mod_types)})"
+
+    @property
+    def accessions(self):
+        return self._accessions
+
+    @property
+    def samples(self):
+        return self._samples
+
+    @property
+    def lengths(self):
+        return self._lengths
+
+    @property
+    def shape(self):
+        return (len(self._accessions), self._width)
+
+    @property
+    def memory_mapped(self):
+        return self._memory_mapped
+
+    @property
+    def nbytes(self):
+        """Memory used by the coverage and site matrices, in bytes."""
+        matrices = list(self._coverage.values()) + list(self._sites.values())
+        return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+
+    def save(self, folder):
+        """
+        Writes the matrices to folder as .npy files, one per CSR array, so they can be memory-mapped by load.
+        """
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, 'lengths.npy'), self._lengths)
+        matrices = [('coverage', sample, None, matrix) for sample, matrix in self._coverage.items()]
+        matrices += [('sites', sample, modification, matrix) for (sample, modification), matrix in self._sites.items()]
+        meta = {'accessions': self._accessions, 'samples': self._samples, 'mod_types': self._mod_types,
+                'width': self._width, 'matrices': []}
+        for number, (kind, sample, modification, matrix) in enumerate(matrices):
+            for array in ['data', 'indices', 'indptr']:
+                np.save(os.path.join(folder, f'{number}_{array}.npy'), getattr(matrix, array))
+            meta['matrices'].append([kind, sample, modification])
+        with open(os.path.join(folder, 'index.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Reads an index written by save. The matrices are memory-mapped read-only by default, so processes loading
+        the same index share its pages instead of each holding a copy.
+        """
+        with open(os.path.join(folder, 'index.json')) as f:
+            meta = json.load(f)
+        index = cls.__new__(cls)
+        index._memory_mapped = mmap_mode is not None
+        index._accessions = meta['accessions']
+        index._rows = {accession: row for row, accession in enumerate(index._accessions)}
+        index._lengths = np.load(os.path.join(folder, 'lengths.npy'), mmap_mode=mmap_mode)
+        index._samples = meta['samples']
+        index._mod_types = meta['mod_types']
+        index._width = meta['width']
+        index._coverage = {}
+        index._sites = {}
+        for number, (kind, sample, modification) in enumerate(meta['matrices']):
+            data, indices, indptr = [np.load(os.path.join(folder, f'{number}_{array}.npy'), mmap_mode=mmap_mode)
+                                     for array in ['data', 'indices', 'indptr']]
+            matrix = sparse.csr_matrix((data, indices, indptr), shape=index.shape, copy=False)
+            if kind == 'coverage':
+                index._coverage[sample] = matrix
+            else:
+                index._sites[(sample, modification)] = matrix
+        return index
+
+    def _coverage_matrix(self, mask):
+        """
+        Builds the peptide coverage matrix for the peptides selected by mask in one vectorized pass.
+
+        Every peptide contributes a +1 event at its start and a -1 event after its end. Sorting the events by
+        (protein, position) and taking the cumulative sum gives the coverage level of every run between two
+        events, and the runs are then expanded to one entry per covered residue.
+        """
+        rows = np.concatenate([self._pep_rows[mask], self._pep_rows[mask]])
+        cols = np.concatenate([self._pep_starts[mask], self._pep_ends[mask] + 1])
+        deltas = np.concatenate([np.ones(mask.sum(), dtype=np.int64), -np.ones(mask.sum(), dtype=np.int64)])
+
+        order = np.lexsort((cols, rows))
+        rows, cols, deltas = rows[order], cols[order], deltas[order]
+        levels = np.cumsum(deltas)
+
+        run_lengths = np.diff(cols)
+        keep = (rows[1:] == rows[:-1]) & (run_lengths > 0) & (levels[:-1] > 0)
+        run_rows, run_starts, run_levels = rows[:-1][keep], cols[:-1][keep], levels[:-1][keep]
+        run_lengths = run_lengths[keep]
+
+        offsets = np.repeat(np.cumsum(run_lengths) - run_lengths, run_lengths)
+        positions = np.repeat(run_starts, run_lengths) + np.arange(run_lengths.sum()) - offsets
+        return sparse.csr_matrix(
+            (np.repeat(run_levels, run_lengths), (np.repeat(run_rows, run_lengths), positions - 1)),
+            shape=self.shape
+        )
+
+    def _row(self, accession):
+        if accession not in self._rows:
+            raise KeyError(f'Accession {accession} is not in the proteome index')
+        return self._rows[accession]
+
+    @staticmethod
+    def _row_entries(matrix, row):
+        """
+        Returns the column indices and values stored in one row of a CSR matrix, read from indptr without building
+        the row as a matrix or a dense array. The indices are sorted, as the matrices are built in canonical form.
+        """
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def modification_types(self, nterm:bool=False):
+        """Returns the modification types found in the dataset, with the '|N-Term' types only if nterm is set."""
+        return [mod for mod in self._mod_types if nterm or not mod.endswith('|N-Term')]
+
+    def coverage_matrix(self, sample=ALL_SAMPLES):
+        """Returns the (protein x position) matrix of peptide counts per residue for a sample."""
+        return self._coverage[sample]
+
+    def site_matrix(self, sample=ALL_SAMPLES, modifications=None, nterm:bool=False):
+        """
+        Returns the (protein x position) matrix of modification PSM counts for a sample.
+
+        Parameters:
+        - sample (str): Sample name, or 'All Samples'.
+        - modifications (list of str): Modification types to sum over. All types are used if None.
+        - nterm (bool): Whether '|N-Term' modification types are included.
+        """
+        if modifications is None:
+            modifications = self.modification_types(nterm)
+        matrix = sparse.csr_matrix(self.shape, dtype=np.int64)
+        for modification in modifications:
+            if (sample, modification) in self._sites:
+                matrix = matrix + self._sites[(sample, modification)]
+        return matrix
+
+    def residue_coverage(self, accession, sample=ALL_SAMPLES):
+        """Returns the number of peptides covering each residue of a protein, like get_colors.get_position_frequency."""
+        row = self._row(accession)
+        columns, counts = self._row_entries(self._coverage[sample], row)
+        coverage = np.zeros(self._lengths[row], dtype=np.int64)
+        inside = columns < len(coverage)
+        coverage[columns[inside]] = counts[inside]
+        return coverage
+
+    def coverage_fraction(self, sample=ALL_SAMPLES):
+        """Returns a Series with the fraction of each protein's residues covered by at least one peptide."""
+        covered = np.asarray((self._coverage[sample] > 0).sum(axis=1)).ravel()
+        return pd.Series(covered / np.maximum(self._lengths, 1), index=self._accessions, name='Coverage')
+
+    def proteins_with_coverage(self, min_fraction, sample=ALL_SAMPLES):
+        """
+        Returns the accessions of the proteins with a coverage above min_fraction in a sample.
+
+        Example:
+        >>> index.proteins_with_coverage(0.8, '[S2] F2: Sample, DTT')
+        ['P68431', 'P62805']
+        """
+        fraction = self.coverage_fraction(sample)
+        return list(fraction.index[fraction > min_fraction])
+
+    def site_counts(self, accession, sample=ALL_SAMPLES, modifications=None, nterm:bool=False):
+        """Returns {position: PSM count} for a protein, like info.get_peptide_modification_dict."""
+        row = self.site_matrix(sample, modifications, nterm)[self._row(accession)]
+        return {int(col) + 1: int(count) for col, count in zip(row.indices, row.data)}
+
+    def site_table(self, sample=ALL_SAMPLES, modifications=None, nterm:bool=False):
+        """
+        Returns a long DataFrame with one row per modified site: accession, position, modification and PSM count.
+        """
+        if modifications is None:
+            modifications = self.modification_types(nterm)
+        tables = []
+        for modification in modifications:
+            if (sample, modification) not in self._sites:
+                continue
+            coo = self._sites[(sample, modification)].tocoo()
+            tables.append(pd.DataFrame({
+                'Accession': np.array(self._accessions, dtype=object)[coo.row],
+                'Position': coo.col + 1,
+                'Modification': modification,
+                'PSM Count': coo.data,
+            }))
+        if not tables:
+            return pd.DataFrame(columns=['Accession', 'Position', 'Modification', 'PSM Count'])
+        return pd.concat(tables, ignore_index=True).sort_values(['Accession', 'Position'], ignore_index=True)
+
+    def protein_site_counts(self, accession, nterm:bool=False):
+        """
+        Returns a DataFrame with one row per modified site of a protein (Position, Modification) and one
+        PSM count column per sample, 'All Samples' included.
+        """
+        row = self._row(accession)
+        tables = []
+        for modification in self.modification_types(nterm):
+            positions, _ = self._row_entries(self._sites[(ALL_SAMPLES, modification)], row)
+            if len(positions) == 0:
+                continue
+            table = pd.DataFrame({'Position': positions + 1, 'Modification': modification})
+            for sample in self._samples:
+                # The sites of a sample are a subset of the sites of all samples
+                columns, counts = self._row_entries(self._sites[(sample, modification)], row)
+                values = np.zeros(len(positions), dtype=np.int64)
+                values[np.searchsorted(positions, columns)] = counts
+                table[sample] = values
+            tables.append(table)
+        if not tables:
+            return pd.DataFrame(columns=['Position', 'Modification'] + self._samples)
+        return pd.concat(tables, ignore_index=True).sort_values(['Position', 'Modification'], ignore_index=True)
+
+    def modified_site_summary(self, sample=ALL_SAMPLES, nterm:bool=False):
+        """Returns a DataFrame with the number of modified sites per protein (rows) and modification type (columns)."""
+        summary = {
+            modification: np.asarray((self._sites[(sample, modification)] > 0).sum(axis=1)).ravel()
+            for modification in self.modification_types(nterm)
+        }
+        return pd.DataFrame(summary, index=self._accessions)
+
+    def max_peptide_frequency(self, accession, samples):
+        """Returns the highest number of peptides covering one residue of a protein, over the given samples."""
+        row = self._row(accession)
+        return max([int(self._coverage[sample][row].max()) for sample in samples], default=0)
+
+    def max_site_psms(self, accession, samples, nterm:bool=False):
+        """Returns the highest PSM count of a single modification type at one residue, over the given samples."""
+        row = self._row(accession)
+        return max([int(self._sites[(sample, modification)][row].max())
+                    for sample in samples for modification in self.modification_types(nterm)], default=0)
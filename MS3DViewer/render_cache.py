@@ -0,0 +1,121 @@
+# Standard library imports
+import sys
+import threading
+from collections import OrderedDict
+
+# Third-party library imports
+import numpy as np
+from plotly.basedatatypes import BaseFigure
+
+NUMBER_SIZE = 8 # bytes counted per number, about the length of a coordinate or count in the JSON Dash sends
+
+
+def estimate_size(value):
+    """
+    Estimates the memory used by a rendered value without serializing it: strings count their length, arrays their
+    nbytes and numbers NUMBER_SIZE, summed over the traces and layout of Plotly figures, the props of Dash components
+    and the items of containers. Other objects, e.g. Peptide objects in intermediate results, count their shallow size.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (bool, int, float, np.number)) or value is None:
+        return NUMBER_SIZE
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, BaseFigure):
+        # The trace and layout dicts the figure holds, rather than to_dict, which deep-copies them
+        return estimate_size(value._data) + estimate_size(value._layout)
+    if hasattr(value, 'to_plotly_json'):
+        # Dash components, whose props are returned as a shallow dict
+        return estimate_size(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class RenderCache:
+    """
+    Server-side LRU cache of rendered figures and viewer documents, keyed by the parameters of the view.
+
+    Keys are tuples whose first element is the dataset id, so all entries of a dataset can be dropped when it is
+    replaced. The cache is bounded both by number of entries and by the estimated size of the cached values, and
+    the least recently used entries are evicted first.
+
+    Attributes:
+        max_entries (int): Maximum number of cached values.
+        max_bytes (int): Maximum total estimated size of the cached values.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found in the cache.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"RenderCache(entries={len(self._entries)}, bytes={self._bytes}, hits={self.hits}, misses={self.misses})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        """Returns the cached value for key, or None, and marks the entry as recently used."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, size=None):
+        """Caches value under key, evicting the least recently used entries until the cache is within its bounds."""
+        if size is None:
+            size = estimate_size(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def get_or_render(self, key, render):
+        """Returns the cached value for key, or calls render() and caches its result."""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, dataset_id):
+        """Drops every entry of a dataset."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == dataset_id]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
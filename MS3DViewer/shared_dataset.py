@@ -0,0 +1,205 @@
+# Standard library imports
+import json
+import os
+import shutil
+import tempfile
+
+# Third-party library imports
+import numpy as np
+from Bio.Seq import Seq
+
+# Custom module imports
+from classes import Protein, Peptide
+from dataset import Dataset
+from proteome_index import ProteomeIndex
+
+SHARED_FOLDER = 'shared_datasets'
+JOB_FOLDER = 'jobs'
+
+
+class PeptideTable:
+    """
+    Read-only columnar table of the peptides of a saved dataset, memory-mapped from its .npy files. Worker processes
+    opening the same dataset share the pages of these files instead of each holding a copy of the peptides.
+
+    Peptides are stored in protein order, so the peptides of protein row i are the rows
+    protein_offsets[i] to protein_offsets[i + 1].
+    """
+
+    COLUMNS = ['protein_offsets', 'starts', 'ends', 'file_codes', 'sequences', 'sequences_offsets',
+               'modifications', 'modifications_offsets']
+
+    def __init__(self, folder, file_ids, mmap_mode='r'):
+        self._file_ids = file_ids
+        self._columns = {column: np.load(os.path.join(folder, f'{column}.npy'), mmap_mode=mmap_mode) for column in self.COLUMNS}
+
+    def __repr__(self) -> str:
+        return f"PeptideTable(peptides={len(self._columns['starts'])})"
+
+    def __len__(self):
+        return len(self._columns['starts'])
+
+    def _text(self, column, row):
+        offsets = self._columns[f'{column}_offsets']
+        return self._columns[column][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def get_peptides(self, protein, protein_row):
+        """Creates the Peptide objects of one protein from the table."""
+        columns = self._columns
+        peptides = []
+        for row in range(int(columns['protein_offsets'][protein_row]), int(columns['protein_offsets'][protein_row + 1])):
+            peptides.append(Peptide(protein=protein,
+                sequence=self._text('sequences', row),
+                start_position=int(columns['starts'][row]),
+                end_position=int(columns['ends'][row]),
+                modifications=json.loads(self._text('modifications', row)),
+                file_id=self._file_ids[columns['file_codes'][row]]
+                ))
+        return peptides
+
+
+class SharedProtein(Protein):
+    """
+    A Protein of a saved dataset. Its Peptide objects are created from the memory-mapped peptide table the first
+    time they are used, so a worker process only holds the peptides of the proteins it has shown.
+    """
+
+    def __init__(self, accession, total_psms, pdb_file, master_sequence, peptide_table, row):
+        super().__init__(accession, total_psms, pdb_file=pdb_file, master_sequence=master_sequence)
+        self._peptide_table = peptide_table
+        self._row = row
+        self._peptides = None
+
+    @property
+    def peptides(self):
+        if self._peptides is None:
+            self._peptides = self._peptide_table.get_peptides(self, self._row)
+        return self._peptides
+
+    @property
+    def peptides_loaded(self) -> bool:
+        return self._peptides is not None
+
+
+def _save_text_column(folder, name, texts):
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+    np.save(os.path.join(folder, f'{name}.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(folder, f'{name}_offsets.npy'), offsets)
+
+
+def get_dataset_folder(dataset_id, shared_folder=SHARED_FOLDER):
+    """
+    Returns the folder a dataset is saved to.
+
+    Example:
+    >>> get_dataset_folder('9c41e0d2')
+    'shared_datasets/9c41e0d2'
+    """
+    if not dataset_id.isalnum():
+        raise ValueError(f'Dataset id {dataset_id} must be alphanumeric')
+    return os.path.join(shared_folder, dataset_id)
+
+
+def save_dataset(dataset:Dataset, shared_folder=SHARED_FOLDER):
+    """
+    Writes a loaded dataset to the shared folder as memory-mappable columns: the peptide table, the proteome index
+    matrices and a small JSON file with the proteins and samples. The dataset is written to a temporary folder
+    first and then renamed, so other processes never see a half-written dataset.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - shared_folder (str): Folder holding the saved datasets.
+
+    Returns:
+    - str: The folder the dataset was saved to.
+    """
+    folder = get_dataset_folder(dataset.dataset_id, shared_folder)
+    if os.path.exists(folder):
+        return folder
+    os.makedirs(shared_folder, exist_ok=True)
+    temp_folder = tempfile.mkdtemp(prefix=f'.{dataset.dataset_id}-', dir=shared_folder)
+
+    peptides = [peptide for protein in dataset.protein_list for peptide in protein.peptides]
+    file_ids = list(dict.fromkeys(peptide.file_id for peptide in peptides))
+    file_codes = {file_id: code for code, file_id in enumerate(file_ids)}
+    np.save(os.path.join(temp_folder, 'protein_offsets.npy'), np.cumsum([0] + [len(protein.peptides) for protein in dataset.protein_list], dtype=np.int64))
+    np.save(os.path.join(temp_folder, 'starts.npy'), np.array([peptide.start_position for peptide in peptides], dtype=np.int64))
+    np.save(os.path.join(temp_folder, 'ends.npy'), np.array([peptide.end_position for peptide in peptides], dtype=np.int64))
+    np.save(os.path.join(temp_folder, 'file_codes.npy'), np.array([file_codes[peptide.file_id] for peptide in peptides], dtype=np.int32))
+    _save_text_column(temp_folder, 'sequences', [peptide.sequence for peptide in peptides])
+    _save_text_column(temp_folder, 'modifications', [json.dumps(peptide.modifications) for peptide in peptides])
+    dataset.proteome_index.save(os.path.join(temp_folder, 'index'))
+
+    meta = {
+        'file_path': dataset.file_path,
+        'samples_in_file': dataset.samples_in_file,
+        'accession_numbers': dataset.accession_numbers,
+        'file_ids': file_ids,
+        'proteins': [{'accession': protein.accession, 'total_psms': int(protein.total_psms), 'pdb_file': protein.pdb_file,
+                      'master_sequence': str(protein.master_sequence)} for protein in dataset.protein_list],
+    }
+    with open(os.path.join(temp_folder, 'dataset.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.rename(temp_folder, folder)
+    except OSError:
+        # Saved by another process in the meantime
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    return folder
+
+
+def open_dataset(dataset_id, shared_folder=SHARED_FOLDER):
+    """
+    Opens a dataset saved by save_dataset, memory-mapping its peptide table and proteome index read-only.
+
+    Raises:
+    - KeyError: If the dataset is not in the shared folder.
+    """
+    folder = get_dataset_folder(dataset_id, shared_folder)
+    if not os.path.exists(os.path.join(folder, 'dataset.json')):
+        raise KeyError(f'Dataset {dataset_id} is not in {shared_folder}')
+    with open(os.path.join(folder, 'dataset.json')) as f:
+        meta = json.load(f)
+
+    peptide_table = PeptideTable(folder, meta['file_ids'])
+    protein_list = [SharedProtein(protein['accession'], protein['total_psms'], protein['pdb_file'], Seq(protein['master_sequence']), peptide_table, row)
+                    for row, protein in enumerate(meta['proteins'])]
+    proteome_index = ProteomeIndex.load(os.path.join(folder, 'index'))
+    return Dataset(meta['file_path'], protein_list, None, meta['samples_in_file'], meta['accession_numbers'],
+                   dataset_id=dataset_id, proteome_index=proteome_index)
+
+
+def remove_dataset(dataset_id, shared_folder=SHARED_FOLDER):
+    """Deletes a saved dataset. Processes that still have it open keep reading their mapped copy."""
+    shutil.rmtree(get_dataset_folder(dataset_id, shared_folder), ignore_errors=True)
+
+
+def write_job_status(job_id, status, shared_folder=SHARED_FOLDER):
+    """
+    Writes the status of a background job as JSON, so worker processes other than the one running the job can
+    report it.
+    """
+    folder = os.path.join(shared_folder, JOB_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{job_id}.json')
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(status, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def remove_job_status(job_id, shared_folder=SHARED_FOLDER):
+    """Deletes the status written by write_job_status, once the job is forgotten."""
+    path = os.path.join(shared_folder, JOB_FOLDER, f'{job_id}.json')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def read_job_status(job_id, shared_folder=SHARED_FOLDER):
+    """Returns the status written by write_job_status, or None if the job is unknown."""
+    path = os.path.join(shared_folder, JOB_FOLDER, f'{job_id}.json')
+    if not job_id.isalnum() or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
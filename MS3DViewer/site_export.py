@@ -0,0 +1,139 @@
+# Standard library imports
+import argparse
+import os
+
+# Third-party library imports
+import pandas as pd
+
+# Custom module imports
+from dataset import Dataset, load_dataset
+from proteome_index import ALL_SAMPLES
+
+EXPORT_FORMATS = ['parquet', 'csv']
+
+
+def get_site_table_columns(samples_in_file):
+    """Returns the column names of the site table for the given samples."""
+    return (['Accession', 'Residue', 'Position', 'Position (M1 removed)', 'Modification']
+            + [f'PSMs: {sample}' for sample in [ALL_SAMPLES] + list(samples_in_file)]
+            + ['Covering peptides'])
+
+
+def get_protein_site_table(dataset:Dataset, accession, nterm:bool=True):
+    """
+    Builds the site table of one protein: one row per modified residue and modification type, with the PSM count
+    in every sample and the number of peptides covering the residue.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - accession (str): Accession number of the protein.
+    - nterm (bool): Whether N-terminal modifications are included as '<modification>|N-Term' types.
+
+    Returns:
+    - DataFrame: The site table of the protein, with the columns given by get_site_table_columns.
+    """
+    index = dataset.proteome_index
+    protein = dataset.get_protein(accession)
+    sites = index.protein_site_counts(accession, nterm=nterm)
+    sequence = str(protein.master_sequence)
+    coverage = index.residue_coverage(accession)
+
+    positions = sites['Position'].astype(int)
+    table = pd.DataFrame({
+        'Accession': accession,
+        'Residue': [sequence[p - 1] if p <= len(sequence) else '' for p in positions],
+        'Position': positions,
+        # A site on residue 1, the removed leader MET, has no position once it is removed
+        'Position (M1 removed)': (positions - 1).where(positions > 1).astype('Int64'),
+        'Modification': sites['Modification'],
+    })
+    for sample in index.samples:
+        table[f'PSMs: {sample}'] = sites[sample].astype('int64')
+    table['Covering peptides'] = [int(coverage[p - 1]) if p <= len(coverage) else 0 for p in positions]
+    return table[get_site_table_columns(dataset.samples_in_file)]
+
+
+def iter_site_tables(dataset:Dataset, nterm:bool=True):
+    """Yields the site table of every protein in the dataset, one protein at a time."""
+    for accession in dataset.accession_numbers:
+        yield get_protein_site_table(dataset, accession, nterm=nterm)
+
+
+def export_site_table(dataset:Dataset, path, file_format=None, nterm:bool=True, row_group_size=50000):
+    """
+    Streams the site table of the whole dataset to a Parquet or CSV file, protein by protein, so the full
+    table is never held in memory. Parquet row groups are flushed every row_group_size rows.
+
+    Parameters:
+    - dataset (Dataset): The loaded dataset.
+    - path (str): Path of the file to write.
+    - file_format (str): 'parquet' or 'csv'. Inferred from the file extension if None.
+    - nterm (bool): Whether N-terminal modifications are included.
+    - row_group_size (int): Number of rows buffered before a Parquet row group is written.
+
+    Returns:
+    - int: The number of site rows written.
+
+    Example:
+    >>> export_site_table(dataset, 'exports/sites.parquet')
+    2190
+    """
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith('.csv') else 'parquet'
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f'Export format must be one of {EXPORT_FORMATS}, not {file_format}')
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    rows_written = 0
+    if file_format == 'csv':
+        pd.DataFrame(columns=get_site_table_columns(dataset.samples_in_file)).to_csv(path, index=False)
+        for table in iter_site_tables(dataset, nterm=nterm):
+            table.to_csv(path, mode='a', header=False, index=False)
+            rows_written += len(table)
+        return rows_written
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError('Parquet export requires pyarrow, install it or export to CSV instead') from error
+
+    sample_columns = [f'PSMs: {sample}' for sample in [ALL_SAMPLES] + list(dataset.samples_in_file)]
+    schema = pa.schema(
+        [('Accession', pa.string()), ('Residue', pa.string()), ('Position', pa.int64()),
+         ('Position (M1 removed)', pa.int64()), ('Modification', pa.string())]
+        + [(column, pa.int64()) for column in sample_columns]
+        + [('Covering peptides', pa.int64())]
+    )
+    buffered = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for table in iter_site_tables(dataset, nterm=nterm):
+            buffered.append(table)
+            if sum(len(t) for t in buffered) >= row_group_size:
+                writer.write_table(pa.Table.from_pandas(pd.concat(buffered, ignore_index=True), schema=schema, preserve_index=False))
+                rows_written += sum(len(t) for t in buffered)
+                buffered = []
+        if buffered:
+            writer.write_table(pa.Table.from_pandas(pd.concat(buffered, ignore_index=True), schema=schema, preserve_index=False))
+            rows_written += sum(len(t) for t in buffered)
+    return rows_written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the modification-site table of a Proteome Discoverer workbook.')
+    parser.add_argument('workbook', help='Path to the workbook (.xlsx)')
+    parser.add_argument('-o', '--output', default='sites.parquet', help='Output file (.parquet or .csv)')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default=None, help='Output format, inferred from the extension by default')
+    parser.add_argument('--no-nterm', action='store_true', help='Leave out N-terminal modifications')
+    args = parser.parse_args(argv)
+
+    dataset = load_dataset(args.workbook)
+    rows = export_site_table(dataset, args.output, file_format=args.format, nterm=not args.no_nterm)
+    print(f'Wrote {rows} sites to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
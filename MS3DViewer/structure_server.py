@@ -0,0 +1,109 @@
+# Standard library imports
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+
+# Third-party library imports
+from flask import Response, abort, request
+
+STRUCTURE_ROUTE = '/structures'
+REGISTRY_FOLDER = 'structure_registry'
+MAX_AGE = 24 * 60 * 60 # seconds a browser may use its copy of a model before revalidating it
+
+# Only files registered through get_structure_url are served, by file name. The registry is kept on disk, one file
+# holding the path per name, so the worker process serving a model need not be the one that rendered its page; this
+# dict holds the names registered by this process
+_structure_files = {}
+# file name -> (modification time, raw bytes, gzip-compressed bytes, etag)
+_structure_cache = {}
+_lock = threading.Lock()
+
+
+def get_structure_url(file_path):
+    """
+    Registers a structure file for serving and returns the URL the viewer loads it from.
+
+    Example:
+    >>> get_structure_url('AF-P68431-F1-model_v4.pdb')
+    '/structures/AF-P68431-F1-model_v4.pdb'
+    """
+    name = os.path.basename(file_path)
+    path = os.path.abspath(file_path)
+    with _lock:
+        registered = _structure_files.get(name) == path
+        _structure_files[name] = path
+    if not registered:
+        os.makedirs(REGISTRY_FOLDER, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=REGISTRY_FOLDER, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(path)
+        os.replace(temp_path, _get_registry_path(name))
+    return f'{STRUCTURE_ROUTE}/{name}'
+
+
+def _get_registry_path(name):
+    return os.path.join(REGISTRY_FOLDER, f'{name}.path')
+
+
+def get_structure_path(name):
+    """Returns the path of a structure file registered by any worker process, or None if the name is not registered."""
+    with _lock:
+        path = _structure_files.get(name)
+    if path is not None:
+        return path
+    registry_path = _get_registry_path(name)
+    if name != os.path.basename(name) or not os.path.exists(registry_path):
+        return None
+    with open(registry_path) as f:
+        return f.read()
+
+
+def load_structure(name):
+    """
+    Returns (raw bytes, gzip-compressed bytes, etag) of a registered structure file. The file is read and
+    compressed once and kept in memory until it changes on disk.
+    """
+    path = get_structure_path(name)
+    if path is None or not os.path.exists(path):
+        raise KeyError(f'Structure {name} is not registered')
+
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _structure_cache.get(name)
+    if cached is not None and cached[0] == mtime:
+        return cached[1:]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    entry = (mtime, data, gzip.compress(data, compresslevel=6), hashlib.sha1(data).hexdigest())
+    with _lock:
+        _structure_cache[name] = entry
+    return entry[1:]
+
+
+def serve_structure(name):
+    """
+    Flask view returning a structure file, gzip-compressed when the browser accepts it, with an ETag and
+    Cache-Control headers so every browser downloads each model only once.
+    """
+    try:
+        data, compressed, etag = load_structure(name)
+    except KeyError:
+        abort(404)
+
+    gzipped = 'gzip' in request.accept_encodings
+    response = Response(compressed if gzipped else data, mimetype='chemical/x-pdb')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    return response.make_conditional(request)
+
+
+def register_structure_route(server):
+    """Adds the structure route to the Flask server of the Dash app."""
+    server.add_url_rule(f'{STRUCTURE_ROUTE}/<path:name>', 'serve_structure', serve_structure)
@@ -0,0 +1,238 @@
+# Standard library imports
+import functools
+import math
+import os
+import random
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Third-party library imports
+import openpyxl
+
+AMINO_ACIDS = {
+    'A': 'ALA', 'R': 'ARG', 'N': 'ASN', 'D': 'ASP', 'C': 'CYS', 'Q': 'GLN', 'E': 'GLU', 'G': 'GLY', 'H': 'HIS', 'I': 'ILE',
+    'L': 'LEU', 'K': 'LYS', 'M': 'MET', 'F': 'PHE', 'P': 'PRO', 'S': 'SER', 'T': 'THR', 'W': 'TRP', 'Y': 'TYR', 'V': 'VAL',
+}
+
+# Modification types with the residues they are found on, as in the workbooks of the lab
+MODIFICATIONS = {
+    'Methyl': 'KR',
+    'Dimethyl': 'KR',
+    'Acetyl': 'K',
+    'Pyridylacetyl': 'K',
+    'Carbamidomethyl': 'C',
+    'Phospho': 'STY',
+    'Oxidation': 'M',
+}
+NTERM_MODIFICATIONS = ['Pyridylacetyl', 'Acetyl']
+CONDITIONS = ['DTT', 'IAA', 'Micro']
+
+PROTEIN_COLUMNS = ['Checked', 'Master', 'Accession', 'Description', 'Coverage [%]', '# Peptides', '# PSMs',
+                   '# Unique Peptides', '# AAs', 'MW [kDa]', 'calc. pI']
+PEPTIDE_COLUMNS = ['', 'Checked', 'Confidence', 'Identifying Node', 'PSM Ambiguity', 'Annotated Sequence', 'Modifications',
+                   '# Proteins', 'Master Protein Accessions', 'Protein Accessions', '# Missed Cleavages', 'Charge',
+                   'Spectrum File', 'File ID', 'Ions Score', 'Sequence in Protein', 'Positions in Proteins']
+
+
+def get_accession(index):
+    """
+    Returns the accession of the synthetic protein with the given index.
+
+    Example:
+    >>> get_accession(7)
+    'SYN00007'
+    """
+    return f'SYN{index:05d}'
+
+
+def get_sample_names(n_samples):
+    """
+    Returns the sample names of a synthetic workbook, in the form Proteome Discoverer writes them.
+
+    Example:
+    >>> get_sample_names(2)
+    ['[S1] F1: Sample, DTT', '[S2] F2: Sample, IAA']
+    """
+    return [f'[S{k}] F{k}: Sample, {CONDITIONS[(k - 1) % len(CONDITIONS)]}' for k in range(1, n_samples + 1)]
+
+
+def get_protein_sequence(accession, length):
+    """Returns the sequence of a synthetic protein. It only depends on the accession and length, and starts with M."""
+    rnd = random.Random(f'{accession}-{length}')
+    return 'M' + ''.join(rnd.choice(list(AMINO_ACIDS)) for _ in range(length - 1))
+
+
+def get_protein_length(accession, min_length=150, max_length=800):
+    return random.Random(accession).randint(min_length, max_length)
+
+
+def create_peptidoform(rnd, sequence, mod_density, min_length=6, max_length=30):
+    """
+    Draws a peptide of the protein sequence with random modifications.
+
+    Parameters:
+    - rnd (random.Random): The random generator.
+    - sequence (str): The protein sequence.
+    - mod_density (float): Probability that a residue is modified, for residues a modification type is found on.
+
+    Returns:
+    - tuple: The start and end position (from 1), the annotated sequence with modified residues in lowercase and the
+      modification text, e.g. (4, 9, 'TkQTAR', 'K2(Methyl)').
+    """
+    length = rnd.randint(min_length, min(max_length, len(sequence) - 1))
+    start = rnd.randint(1, len(sequence) - length + 1)
+    end = start + length - 1
+    residues = list(sequence[start - 1:end])
+    modifications = []
+    if rnd.random() < mod_density:
+        modifications.append(f'N-Term({rnd.choice(NTERM_MODIFICATIONS)})')
+        residues[0] = residues[0].lower()
+    for i, residue in enumerate(sequence[start - 1:end]):
+        candidates = [mod for mod, targets in MODIFICATIONS.items() if residue in targets]
+        if candidates and rnd.random() < mod_density:
+            modifications.append(f'{residue}{i + 1}({rnd.choice(candidates)})')
+            residues[i] = residue.lower()
+    return start, end, ''.join(residues), '; '.join(modifications)
+
+
+def create_workbook(path, n_proteins=5, peptides_per_protein=200, n_samples=6, mod_density=0.1, seed=0, min_length=150, max_length=800):
+    """
+    Writes a synthetic workbook in the layout of a Proteome Discoverer PSM export: a 'Proteins' sheet with one row per
+    protein, each followed by a peptide header row and one row per PSM. Every distinct peptide is found in about
+    three PSMs, spread over the samples.
+
+    Parameters:
+    - path (str): Path of the workbook (.xlsx) to write.
+    - n_proteins (int): Number of proteins.
+    - peptides_per_protein (int): Number of PSM rows per protein.
+    - n_samples (int): Number of samples.
+    - mod_density (float): Probability that a residue is modified, for residues a modification type is found on.
+    - seed (int): Seed of the random generator, so the same arguments write the same workbook.
+    - min_length, max_length (int): Range of the protein lengths.
+
+    Returns:
+    - list: The accessions of the proteins, see create_structure_files.
+
+    Example:
+    >>> create_workbook('synthetic.xlsx', n_proteins=50, peptides_per_protein=500)
+    ['SYN00000', 'SYN00001', ...]
+    """
+    rnd = random.Random(seed)
+    samples = get_sample_names(n_samples)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Proteins')
+    sheet.append(PROTEIN_COLUMNS + [f'Found in Sample: {sample}' for sample in samples] + ['# Protein Groups'])
+
+    accessions = []
+    for index in range(n_proteins):
+        accession = get_accession(index)
+        accessions.append(accession)
+        length = get_protein_length(accession, min_length, max_length)
+        sequence = get_protein_sequence(accession, length)
+        peptidoforms = [create_peptidoform(rnd, sequence, mod_density) for _ in range(max(1, peptides_per_protein // 3))]
+        psms = [(rnd.choice(peptidoforms), rnd.randint(1, n_samples)) for _ in range(peptides_per_protein)]
+        covered = set()
+        for (start, end, _, _), _ in psms:
+            covered.update(range(start, end + 1))
+        found = {sample for _, sample in psms}
+
+        sheet.append([True, 'Master Protein', accession, f'Synthetic protein {index} OS=Synthetic', round(100 * len(covered) / length),
+                      len(peptidoforms), len(psms), len(peptidoforms), length, round(0.11 * length, 1), 7.0]
+                     + ['High' if k in found else 'Not Found' for k in range(1, n_samples + 1)] + [1])
+        sheet.append(PEPTIDE_COLUMNS)
+        for (start, end, annotated, modifications), sample in psms:
+            before = sequence[start - 2] if start > 1 else '-'
+            after = sequence[end] if end < length else '-'
+            # openpyxl does not write empty strings, and the workbook parser expects text in every Modifications cell
+            sheet.append([None, True, 'High', 'Mascot (A5)', 'Unambiguous', f'[{before}].{annotated}.[{after}]', modifications or ' ',
+                          1, accession, accession, 0, 2, f'synthetic_F{sample}.raw', f'F{sample}', round(rnd.uniform(20, 80)),
+                          f'{before}.{sequence[start - 1:end]}.{after}', f'[{start}-{end}]'])
+    workbook.save(path)
+    return accessions
+
+
+def get_structure_filename(accession):
+    """Returns the file name AlphaFold gives the model of a protein, see url_processing.create_url."""
+    return f'AF-{accession}-F1-model_v4.pdb'
+
+
+def create_structure(accession, sequence):
+    """
+    Returns an AlphaFold-like PDB model of a synthetic protein: a single chain with N, CA, C and O backbone atoms on
+    an alpha helix, and a per-residue confidence (pLDDT) in the B-factor column.
+    """
+    lines = ['HEADER    SYNTHETIC MODEL',
+             f'TITLE     SYNTHETIC ALPHAFOLD-LIKE MODEL FOR {accession}']
+    rnd = random.Random(accession)
+    serial = 1
+    for i, residue in enumerate(sequence):
+        # Consecutive CA atoms 3.8 A apart; N and C sit on the CA-CA lines, so the peptide bonds are about 1.3 A long
+        angle = math.radians(100 * i)
+        ca = (2.3 * math.cos(angle), 2.3 * math.sin(angle), 1.5 * i)
+        previous = (2.3 * math.cos(angle - math.radians(100)), 2.3 * math.sin(angle - math.radians(100)), 1.5 * (i - 1))
+        following = (2.3 * math.cos(angle + math.radians(100)), 2.3 * math.sin(angle + math.radians(100)), 1.5 * (i + 1))
+        n = tuple(a + 0.33 * (b - a) for a, b in zip(ca, previous))
+        c = tuple(a + 0.33 * (b - a) for a, b in zip(ca, following))
+        o = (c[0] * 1.5, c[1] * 1.5, c[2])
+        plddt = max(20.0, min(98.0, rnd.gauss(80, 12)))
+        for name, element, (x, y, z) in ((' N  ', 'N', n), (' CA ', 'C', ca), (' C  ', 'C', c), (' O  ', 'O', o)):
+            lines.append(f'ATOM  {serial:5d} {name} {AMINO_ACIDS[residue]} A{i + 1:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00{plddt:6.2f}           {element}')
+            serial += 1
+    lines.append(f'TER   {serial:5d}      {AMINO_ACIDS[sequence[-1]]} A{len(sequence):4d}')
+    # Padded like the AlphaFold files, Biopython does not recognise a bare END record
+    lines.append(f'{"END":<80}')
+    return '\n'.join(lines) + '\n'
+
+
+def create_structure_files(accessions, folder, min_length=150, max_length=800):
+    """
+    Writes the AlphaFold-like model of every synthetic protein to folder, under the AlphaFold file name. The
+    sequences match the ones used by create_workbook with the same lengths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for accession in accessions:
+        sequence = get_protein_sequence(accession, get_protein_length(accession, min_length, max_length))
+        with open(os.path.join(folder, get_structure_filename(accession)), 'w') as f:
+            f.write(create_structure(accession, sequence))
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class StructureServer:
+    """
+    Local stand-in for the AlphaFold file server, serving the files of a folder over HTTP on a free port of
+    127.0.0.1. Point url_processing.ALPHAFOLD_URL at url to load structures from it.
+
+    Example:
+    >>> with StructureServer('structures') as server:
+    ...     url_processing.ALPHAFOLD_URL = server.url
+    """
+
+    def __init__(self, folder):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=os.path.abspath(folder)))
+        self._thread = None
+
+    def __repr__(self) -> str:
+        return f"StructureServer(url={self.url})"
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
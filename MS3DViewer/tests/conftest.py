@@ -0,0 +1,6 @@
+# Standard library imports
+import os
+import sys
+
+# The modules of the app import each other by name, as when it is run from its own folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+# Third-party library imports
+import numpy as np
+import pytest
+
+# Custom module imports
+import get_colors
+import info
+import url_processing
+from dataset import load_dataset
+from proteome_index import ALL_SAMPLES, ProteomeIndex
+from synthetic_data import StructureServer, create_structure_files, create_workbook
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    """A small synthetic workbook loaded with structures from a local server, as in benchmark.py."""
+    folder = tmp_path_factory.mktemp('proteome_index')
+    accessions = create_workbook(str(folder / 'synthetic.xlsx'), n_proteins=3, peptides_per_protein=60, n_samples=3, mod_density=0.2)
+    create_structure_files(accessions, str(folder / 'structures'))
+    with pytest.MonkeyPatch.context() as monkeypatch, StructureServer(str(folder / 'structures')) as server:
+        monkeypatch.chdir(folder)
+        monkeypatch.setattr(url_processing, 'ALPHAFOLD_URL', server.url)
+        yield load_dataset(str(folder / 'synthetic.xlsx'))
+
+
+@pytest.fixture(scope='module')
+def loaded_index(dataset, tmp_path_factory):
+    """The index of the dataset after a save and a memory-mapped load."""
+    folder = tmp_path_factory.mktemp('saved_index')
+    dataset.proteome_index.save(str(folder))
+    return ProteomeIndex.load(str(folder), mmap_mode='r')
+
+
+def _get_peptides(protein, sample):
+    return protein.peptides if sample == ALL_SAMPLES else protein.get_peptides_by_file_id(sample)
+
+
+def _check_against_peptides(index, dataset):
+    for protein in dataset.protein_list:
+        for sample in index.samples:
+            peptides = _get_peptides(protein, sample)
+            assert list(index.residue_coverage(protein.accession, sample)) == get_colors.get_position_frequency(protein, peptides)
+            for nterm in [False, True]:
+                modifications = index.modification_types(nterm)
+                expected = dict(info.get_peptide_modification_dict(peptides, modifications, nterm))
+                assert index.site_counts(protein.accession, sample, modifications, nterm) == expected
+
+
+def test_index_matches_peptides(dataset):
+    index = dataset.proteome_index
+    assert index.accessions == dataset.accession_numbers
+    assert len(index.samples) == len(dataset.samples_in_file) + 1
+    assert index.modification_types()
+    _check_against_peptides(index, dataset)
+
+
+def test_loaded_index_matches_peptides(dataset, loaded_index):
+    assert loaded_index.memory_mapped
+    assert isinstance(loaded_index.lengths, np.memmap)
+    _check_against_peptides(loaded_index, dataset)
+
+
+def test_coverage_fraction(dataset, loaded_index):
+    index = dataset.proteome_index
+    for accession in index.accessions:
+        coverage = index.residue_coverage(accession)
+        assert index.coverage_fraction()[accession] == pytest.approx((coverage > 0).mean())
+    assert list(loaded_index.coverage_fraction()) == pytest.approx(list(index.coverage_fraction()))
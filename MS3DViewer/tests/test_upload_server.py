@@ -0,0 +1,58 @@
+# Standard library imports
+import hashlib
+import io
+import os
+
+# Third-party library imports
+import pytest
+
+# Custom module imports
+import upload_server
+from upload_server import complete_upload, get_part_path, get_upload_path, write_chunk
+
+SESSION_ID = '3f2a'
+UPLOAD_ID = '9c41e0'
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    """Random upload bytes, with the upload folder in a temporary working folder."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(upload_server, '_hashes', {})
+    return os.urandom(3017)
+
+
+def test_stale_offset_is_rejected(data):
+    assert write_chunk(SESSION_ID, UPLOAD_ID, 0, io.BytesIO(data[:1000])) == 1000
+    for offset in [0, 500, 2000]:
+        with pytest.raises(ValueError):
+            write_chunk(SESSION_ID, UPLOAD_ID, offset, io.BytesIO(data[offset:offset + 1000]))
+    assert os.path.getsize(get_part_path(SESSION_ID, UPLOAD_ID)) == 1000
+
+
+def test_resumed_upload_has_same_hash(data):
+    write_chunk(SESSION_ID, UPLOAD_ID, 0, io.BytesIO(data))
+    _, single_digest = complete_upload(SESSION_ID, UPLOAD_ID, 'single.xlsx', len(data))
+
+    resumed_id = 'b7'
+    write_chunk(SESSION_ID, resumed_id, 0, io.BytesIO(data[:1000]))
+    # The rest arrives at a worker process that did not receive the first chunk, so has no hash of it
+    upload_server._hashes.clear()
+    write_chunk(SESSION_ID, resumed_id, 1000, io.BytesIO(data[1000:2000]))
+    upload_server._hashes.clear()
+    write_chunk(SESSION_ID, resumed_id, 2000, io.BytesIO(data[2000:]))
+    file_path, resumed_digest = complete_upload(SESSION_ID, resumed_id, 'resumed.xlsx', len(data))
+
+    assert resumed_digest == single_digest == hashlib.sha256(data).hexdigest()
+    with open(file_path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_upload_path_stays_in_session_folder(data):
+    with pytest.raises(ValueError):
+        get_upload_path(SESSION_ID, UPLOAD_ID)
+    write_chunk(SESSION_ID, UPLOAD_ID, 0, io.BytesIO(data))
+    file_path, _ = complete_upload(SESSION_ID, UPLOAD_ID, '../../workbook.xlsx', len(data))
+    assert get_upload_path(SESSION_ID, UPLOAD_ID) == file_path == os.path.join('uploaded_files', SESSION_ID, 'workbook.xlsx')
+    with pytest.raises(ValueError):
+        get_upload_path('../' + SESSION_ID, UPLOAD_ID)
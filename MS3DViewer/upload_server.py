@@ -0,0 +1,215 @@
+# Standard library imports
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the app runs in one process and the thread lock is enough
+    fcntl = None
+
+# Third-party library imports
+from flask import abort, jsonify, request
+from werkzeug.utils import secure_filename
+
+UPLOAD_ROUTE = '/uploads'
+UPLOAD_FOLDER = 'uploaded_files'
+CHUNK_SIZE = 8 * 1024 * 1024 # bytes the browser sends per request
+BUFFER_SIZE = 1024 * 1024 # bytes read from the request at a time while writing a chunk to disk
+
+_ID_PATTERN = re.compile(r'[0-9a-f]{1,64}')
+
+# (session id, upload id) -> (inode of the part file, bytes hashed, sha256 of the bytes hashed), for the uploads in
+# progress. The part file on disk is the only record of the bytes received, since the chunks of an upload can reach
+# any worker process; part files only grow, so the hash of this process is caught up with the bytes other processes
+# appended since.
+_hashes = {}
+_lock = threading.Lock()
+
+
+def get_part_path(session_id, upload_id, upload_folder=UPLOAD_FOLDER):
+    """
+    Returns the path an upload is written to while it is in progress. Every session gets its own folder,
+    so two users uploading files with the same name do not collide.
+
+    Example:
+    >>> get_part_path('3f2a', '9c41e0')
+    'uploaded_files/3f2a/9c41e0.part'
+    """
+    if not _ID_PATTERN.fullmatch(session_id) or not _ID_PATTERN.fullmatch(upload_id):
+        raise ValueError('Session and upload ids must be hexadecimal')
+    return os.path.join(upload_folder, session_id, f'{upload_id}.part')
+
+
+def _get_lock_path(part_path):
+    return f'{os.path.splitext(part_path)[0]}.lock'
+
+
+def _get_record_path(part_path):
+    return f'{os.path.splitext(part_path)[0]}.done'
+
+
+@contextmanager
+def _upload_lock(part_path):
+    """
+    Holds an exclusive lock on an upload, taken with flock on a lock file next to the part file, so it is shared by
+    the threads and the worker processes serving the app.
+    """
+    if fcntl is None:
+        with _lock:
+            yield
+        return
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    with open(_get_lock_path(part_path), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _get_size(part_path):
+    """Returns the number of bytes of an upload received so far, by any worker process."""
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+
+def _get_hash(session_id, upload_id, part_path):
+    """
+    Returns the sha256 of the part file of an upload, hashing only the bytes appended since this process last hashed
+    it. Must be called holding the upload lock.
+    """
+    inode = os.stat(part_path).st_ino if os.path.exists(part_path) else None
+    cached_inode, hashed, sha256 = _hashes.get((session_id, upload_id), (None, 0, None))
+    if sha256 is None or cached_inode != inode or hashed > _get_size(part_path):
+        hashed, sha256 = 0, hashlib.sha256()
+    if inode is not None:
+        with open(part_path, 'rb') as f:
+            f.seek(hashed)
+            for block in iter(lambda: f.read(BUFFER_SIZE), b''):
+                sha256.update(block)
+                hashed += len(block)
+    _hashes[(session_id, upload_id)] = (inode, hashed, sha256)
+    return sha256
+
+
+def write_chunk(session_id, upload_id, offset, stream):
+    """
+    Appends a chunk of an upload to its part file, hashing it while it is written, and returns the number of bytes
+    written so far. The chunk is read from stream in small blocks, so it is never held in memory as a whole. The
+    offset is checked against the size of the part file under the upload lock, so a chunk sent to a worker process
+    that did not receive the previous ones is still written at the right place.
+
+    Raises:
+    - ValueError: If offset is not the number of bytes written so far. The browser then resumes from that number.
+    """
+    part_path = get_part_path(session_id, upload_id)
+    with _upload_lock(part_path):
+        size = _get_size(part_path)
+        if offset != size:
+            raise ValueError(f'Upload {upload_id} has {size} bytes, not {offset}')
+        sha256 = _get_hash(session_id, upload_id, part_path) if size > 0 else hashlib.sha256()
+        try:
+            with open(part_path, 'ab') as f:
+                for block in iter(lambda: stream.read(BUFFER_SIZE), b''):
+                    f.write(block)
+                    sha256.update(block)
+                    size += len(block)
+        except Exception:
+            # A broken connection leaves part of the chunk on disk, so the file is hashed again next time
+            _hashes.pop((session_id, upload_id), None)
+            raise
+        _hashes[(session_id, upload_id)] = (os.stat(part_path).st_ino, size, sha256)
+    return size
+
+
+def complete_upload(session_id, upload_id, filename, size):
+    """
+    Moves a finished upload to its file name in the session's upload folder, and records that name next to it so
+    get_upload_path finds the file from the upload id alone. The browser is only ever given the upload id, never
+    a path on the server.
+
+    Returns:
+    - tuple: The path of the uploaded file and its SHA-256 hex digest.
+
+    Raises:
+    - ValueError: If the upload does not have the expected size.
+    """
+    part_path = get_part_path(session_id, upload_id)
+    with _upload_lock(part_path):
+        written = _get_size(part_path)
+        if written != size:
+            raise ValueError(f'Upload {upload_id} has {written} bytes, not {size}')
+        digest = _get_hash(session_id, upload_id, part_path).hexdigest()
+        file_path = os.path.join(os.path.dirname(part_path), secure_filename(filename) or f'{upload_id}.xlsx')
+        os.replace(part_path, file_path)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(part_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.path.basename(file_path))
+        os.replace(temp_path, _get_record_path(part_path))
+        _hashes.pop((session_id, upload_id), None)
+        if fcntl is not None:
+            os.remove(_get_lock_path(part_path))
+    return file_path, digest
+
+
+def get_upload_path(session_id, upload_id, upload_folder=UPLOAD_FOLDER):
+    """
+    Returns the path of a finished upload of a session, from the record complete_upload left for it.
+
+    Raises:
+    - ValueError: If the ids are not hexadecimal, the upload is not finished, or its file is not in the session's
+      upload folder.
+
+    Example:
+    >>> get_upload_path('3f2a', '9c41e0')
+    'uploaded_files/3f2a/workbook.xlsx'
+    """
+    part_path = get_part_path(session_id, upload_id, upload_folder)
+    try:
+        with open(_get_record_path(part_path)) as f:
+            filename = f.read()
+    except FileNotFoundError:
+        raise ValueError(f'Upload {upload_id} is not finished') from None
+    session_folder = os.path.realpath(os.path.dirname(part_path))
+    file_path = os.path.join(os.path.dirname(part_path), filename)
+    if os.path.dirname(os.path.realpath(file_path)) != session_folder or not os.path.isfile(file_path):
+        raise ValueError(f'Upload {upload_id} is not in the upload folder of its session')
+    return file_path
+
+
+def serve_upload(session_id, upload_id):
+    """
+    Flask view of the chunked upload. GET returns the number of bytes received so far, PUT appends the request body
+    at the 'offset' query argument and answers 409 with the received size when the offset does not match.
+    """
+    if not _ID_PATTERN.fullmatch(session_id) or not _ID_PATTERN.fullmatch(upload_id):
+        abort(404)
+    if request.method == 'PUT':
+        try:
+            return jsonify(offset=write_chunk(session_id, upload_id, request.args.get('offset', 0, type=int), request.stream))
+        except ValueError as error:
+            status, message = 409, str(error)
+    else:
+        status, message = 200, None
+    return jsonify(offset=_get_size(get_part_path(session_id, upload_id)), error=message), status
+
+
+def serve_upload_complete(session_id, upload_id):
+    """Flask view finishing a chunked upload. Returns the file name and SHA-256 digest of the uploaded file."""
+    if not _ID_PATTERN.fullmatch(session_id) or not _ID_PATTERN.fullmatch(upload_id):
+        abort(404)
+    try:
+        file_path, digest = complete_upload(session_id, upload_id, request.args.get('name', ''), request.args.get('size', -1, type=int))
+    except ValueError as error:
+        return jsonify(error=str(error)), 409
+    return jsonify(name=os.path.basename(file_path), sha256=digest)
+
+
+def register_upload_route(server):
+    """Adds the chunked upload routes to the Flask server of the Dash app."""
+    server.add_url_rule(f'{UPLOAD_ROUTE}/<session_id>/<upload_id>', 'serve_upload', serve_upload, methods=['GET', 'PUT'])
+    server.add_url_rule(f'{UPLOAD_ROUTE}/<session_id>/<upload_id>/complete', 'serve_upload_complete', serve_upload_complete, methods=['POST'])
@@ -1,6 +1,9 @@
 import os
 import requests
 
+# Base URL of the AlphaFold model files, e.g. replaced by a local server in benchmark.py
+ALPHAFOLD_URL = 'https://alphafold.ebi.ac.uk/files'
+
 
 def create_url(accession_number,type='pdb',source='alphafold'):
     """
@@ -9,8 +12,8 @@ def create_url(accession_number,type='pdb',source='alphafold'):
     """
     uniprot_xml_url = f"https://www.uniprot.org/uniprotkb/{accession_number}.xml"
     uniprot_fasta_url = f"https://www.uniprot.org/uniprotkb/{accession_number}.fasta"
-    alphafold_pdb_url = f"https://alphafold.ebi.ac.uk/files/AF-{accession_number}-F1-model_v4.pdb"
-    alphafold_cif_url = f'https://alphafold.ebi.ac.uk/files/AF-{accession_number}-F1-model_v4.cif'
+    alphafold_pdb_url = f"{ALPHAFOLD_URL}/AF-{accession_number}-F1-model_v4.pdb"
+    alphafold_cif_url = f'{ALPHAFOLD_URL}/AF-{accession_number}-F1-model_v4.cif'
 
     if type == 'xml':
         if source == 'uniprot':
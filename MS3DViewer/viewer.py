@@ -1,24 +1,205 @@
+import json
+
 import py3Dmol
 
-from get_colors import get_peptide_abundance_color,set_peptide_abundance_color,get_mod_freq_colors
+from get_colors import get_peptide_abundance_color,set_peptide_abundance_color,get_peptide_abundance_selections,get_mod_freq_colors
 import info
 from classes import Protein
 from remove_first_met import remove_first_met
+from structure_server import get_structure_url
+from viewer_assets import get_viewer_script_url
+
+
+def add_model_from_url(viewer, url, model_format='pdb'):
+    """
+    Makes the viewer fetch its model from url instead of embedding the model in the page. The commands added to the
+    viewer afterwards run once the model has been loaded.
+    """
+    viewer.startjs += f'fetch({json.dumps(url)}).then(response => response.text()).then(function(data) {{\n'
+    viewer.startjs += f'viewer_UNIQUEID.addModel(data, {json.dumps(model_format)});\n'
+    viewer.endjs = 'viewer_UNIQUEID.render();\n});\n' + viewer.endjs
+    return viewer
+
+
+# Message API of the viewer page. The Dash app posts scenes (colors, styles, labels and zoom) to the page, which applies
+# them to the loaded model in place, so visual changes do not reload the model or reset the camera.
+VIEWER_PAGE_JS = '''
+var SURFACE_STYLE = {opacity: 0.5, color: 'white'};
+var ms3dScene = {
+    viewer: null,
+    model: null,
+    zoom: undefined,
+    attach: function(viewer, model) {
+        this.viewer = viewer;
+        this.model = model;
+        window.addEventListener('message', (event) => {
+            if (event.data && event.data.type === 'ms3d-scene') {
+                this.apply(event.data.scene);
+            }
+        });
+        // Scenes posted while the model was loading are kept by the app
+        if (window.parent && window.parent.ms3dViewerScene) {
+            this.apply(window.parent.ms3dViewerScene);
+        }
+    },
+    apply: function(scene) {
+        if (this.viewer === null || scene.model !== this.model) {
+            return;
+        }
+        var v = this.viewer;
+        var style = scene.style.toLowerCase();
+        var residueStyle = scene.residue_style.toLowerCase();
+        var backbone = {};
+        if (scene.color === 'Rainbow') {
+            backbone[style] = {colorscheme: {prop: 'resi', gradient: 'roygb', min: 50, max: 90}, radius: scene.size};
+        } else if (scene.color === 'By peptide abundance') {
+            backbone[style] = {colorscheme: {prop: 'resi', min: 50, max: 90}, radius: scene.size};
+        } else {
+            backbone[style] = {colorscheme: 'gray', radius: scene.size};
+        }
+        v.setStyle({}, backbone);
+        scene.segments.forEach(([resi, color]) => {
+            var segment = {};
+            segment[style] = {color: color, radius: scene.size};
+            v.setStyle({resi: resi}, segment);
+        });
+        v.removeAllLabels();
+        var labeled = [];
+        scene.sites.forEach(([color, residues]) => {
+            var site = {};
+            site[residueStyle] = {color: color, radius: scene.residue_size};
+            v.addStyle({chain: 'A', resi: residues}, site);
+            labeled = labeled.concat(residues);
+        });
+        if (scene.labels === 'On' && labeled.length > 0) {
+            v.addResLabels({chain: 'A', resi: labeled}, {backgroundColor: 'lightgray', fontColor: 'black', backgroundOpacity: 0.1});
+        }
+        // Only a new zoom selection moves the camera
+        var zoom = JSON.stringify(scene.zoom);
+        if (zoom !== this.zoom) {
+            if (scene.zoom) {
+                this.showSurface(zoom, scene.zoom);
+                v.zoomTo({resi: scene.zoom});
+            } else {
+                this.showSurface(null, null);
+                v.zoomTo();
+            }
+            this.zoom = zoom;
+        }
+        v.render();
+    },
+    // The surface of a zoom selection is computed once, then hidden and shown again when the selection changes.
+    // The least recently shown surfaces are removed when there are more than maxSurfaces.
+    surfaces: {},
+    surfaceOrder: [],
+    maxSurfaces: 8,
+    showSurface: function(key, residues) {
+        var v = this.viewer;
+        for (var other in this.surfaces) {
+            if (other !== key) {
+                this.surfaces[other].then((id) => { v.setSurfaceMaterialStyle(id, {opacity: 0}); v.render(); });
+            }
+        }
+        if (key === null) {
+            return;
+        }
+        if (key in this.surfaces) {
+            this.surfaceOrder.splice(this.surfaceOrder.indexOf(key), 1);
+            this.surfaces[key].then((id) => { v.setSurfaceMaterialStyle(id, SURFACE_STYLE); v.render(); });
+        } else {
+            // addSurface returns the surface id, or a promise of it in recent 3Dmol.js versions
+            this.surfaces[key] = Promise.resolve(v.addSurface($3Dmol.SurfaceType.SAS, SURFACE_STYLE, {resi: residues}));
+        }
+        this.surfaceOrder.push(key);
+        if (this.surfaceOrder.length > this.maxSurfaces) {
+            var evicted = this.surfaceOrder.shift();
+            this.surfaces[evicted].then((id) => v.removeSurface(id));
+            delete this.surfaces[evicted];
+        }
+    }
+};
+'''
+
+
+def get_model_file(protein:Protein, remove_m1=False):
+    """Returns the structure file shown for a protein, without the leader MET if remove_m1 is set."""
+    if remove_m1:
+        return remove_first_met(protein.pdb_file,f'Removed_first_MET-{protein.accession}.pdb')
+    return protein.pdb_file
+
+
+def get_modification_site_colors(peptide_list, modifications, nterm, max_psm, remove_m1=False, mod_freq_color='YlOrRd'):
+    """
+    Returns a list of (residue, color) pairs for the modified residues, colored by their PSM count on a scale up to
+    max_psm (or the highest count found, if that is higher).
+    """
+    if modifications == [] or modifications == None:
+        return []
+    mpd = info.get_peptide_modification_dict(peptide_list,modifications,nterm)
+    if len(mpd.items())==0:
+        return []
+    max_val = max(max_psm, max(mpd.values()))
+    colors = get_mod_freq_colors(freq_vals=mpd, max_val=max_val,c_color=mod_freq_color)
+    shift = 1 if remove_m1 else 0
+    return [(mod_position - shift, colors[mod_count]) for mod_position, mod_count in mpd.items()]
+
+
+def group_sites_by_color(site_colors):
+    """
+    Groups (residue, color) pairs by color.
+
+    Example:
+    >>> group_sites_by_color([(12, '#FEE793'), (40, '#BD0026'), (57, '#FEE793')])
+    [['#FEE793', [12, 57]], ['#BD0026', [40]]]
+    """
+    groups = {}
+    for resi, site_color in site_colors:
+        groups.setdefault(site_color, []).append(int(resi))
+    return [[site_color, sorted(residues)] for site_color, residues in groups.items()]
 
-def create_viewer(protein:Protein,peptide_list,nterm, max_pepfreq_val, max_psm, color='By peptide abundance',peptide_coverage_color ='cool',modifications=None,labels='Off',remove_m1=False,residue_style='stick',residue_size = 0.8, visstyle = 'cartoon',vis_size = 0.8,zoomto=None, viewer_height = 800,viewer_width = 1800,mod_freq_color = 'YlOrRd'):
+
+def get_viewer_scene(protein:Protein, peptide_list, nterm, max_pepfreq_val, max_psm, color='By peptide abundance', peptide_coverage_color='cool', modifications=None, remove_m1=False, mod_freq_color='YlOrRd'):
+    """
+    Returns the data-dependent part of a viewer scene: the model URL, the backbone color segments and the modified
+    residues grouped by color. The app adds the styles, labels and zoom on the client and posts the scene to the
+    viewer page built by create_viewer_page.
+    """
+    scene = {'model': get_structure_url(get_model_file(protein, remove_m1)), 'color': color, 'segments': [], 'sites': []}
+    if color == 'By peptide abundance':
+        peptide_colors,freqpos_list, freq_list = get_peptide_abundance_color(protein,peptide_list,max_pepfreq_val,peptide_coverage_color)
+        selections = get_peptide_abundance_selections(freqpos_list, remove_m1=remove_m1)
+        scene['segments'] = [[selection, peptide_colors[freq]] for selection, freq in zip(selections, freq_list)]
+    scene['sites'] = group_sites_by_color(get_modification_site_colors(peptide_list, modifications, nterm, max_psm, remove_m1, mod_freq_color))
+    return scene
+
+
+def create_viewer_page(protein:Protein, remove_m1=False, viewer_height = 800, viewer_width = 1800):
+    """
+    Builds a viewer that loads the structure of a protein by URL and then waits for scenes posted by the app.
+    The page only depends on the structure, so it is reloaded only when the protein or the leader MET setting changes.
+    """
+    model_url = get_structure_url(get_model_file(protein, remove_m1))
+    viewer = py3Dmol.view(width=viewer_width, height=viewer_height, js=get_viewer_script_url())
+    add_model_from_url(viewer, model_url)
+    viewer.startjs += VIEWER_PAGE_JS
+    viewer.startjs += f'ms3dScene.attach(viewer_UNIQUEID, {json.dumps(model_url)});\n'
+    return viewer
+
+def create_viewer(protein:Protein,peptide_list,nterm, max_pepfreq_val, max_psm, color='By peptide abundance',peptide_coverage_color ='cool',modifications=None,labels='Off',remove_m1=False,residue_style='stick',residue_size = 0.8, visstyle = 'cartoon',vis_size = 0.8,zoomto=None, viewer_height = 800,viewer_width = 1800,mod_freq_color = 'YlOrRd',model_by_url=False,viewer_script_url=None):
     
     
-    if remove_m1:
-        file_path = remove_first_met(protein.pdb_file,f'Removed_first_MET-{protein.accession}.pdb')
-    else:
-        file_path= protein.pdb_file
+    file_path = get_model_file(protein, remove_m1)
     
 
-    with open(file_path, 'r') as f:
-        pdb_data = f.read()
-
-    viewer = py3Dmol.view(width=viewer_width, height=viewer_height)
-    viewer.addModel(pdb_data, 'pdb')
+    # Pages saved outside the app pass their own 3Dmol.js location, since the app's asset route is not available there
+    viewer = py3Dmol.view(width=viewer_width, height=viewer_height, js=viewer_script_url or get_viewer_script_url())
+    if model_by_url:
+        # The browser fetches the model from the structure route and keeps it in its cache
+        add_model_from_url(viewer, get_structure_url(file_path))
+    else:
+        with open(file_path, 'r') as f:
+            pdb_data = f.read()
+        viewer.addModel(pdb_data, 'pdb')
     viewer.setStyle({visstyle: {'colorscheme': {'prop':'resi','min':50,'max':90},'radius':vis_size}})
 
     if color == 'By peptide abundance':
@@ -35,45 +216,14 @@ def create_viewer(protein:Protein,peptide_list,nterm, max_pepfreq_val, max_psm,
     else:
         viewer.setStyle({visstyle: {'colorscheme': 'gray','radius':vis_size}})
  
-    if not modifications==[] and not modifications==None:
-        if remove_m1:
-            
-            mpd =info.get_peptide_modification_dict(peptide_list,modifications,nterm)
-            if len(mpd.items())==0:
-                pass
-            else:
-                if max_psm>max(mpd.values()):
-                    max_val=max_psm
-                else:
-                    max_val=max(mpd.values())
-
-                colors = get_mod_freq_colors(freq_vals=mpd, max_val=max_val,c_color=mod_freq_color)
-
-                for mod_position,mod_count in mpd.items():
-                    viewer.addStyle({"chain": 'A', "resi": mod_position-1},
-                                            {residue_style: {"color": colors[mod_count], "radius": residue_size}})
-                    if labels=='On':
-                        viewer.addResLabels({"chain": 'A',"resi": mod_position-1},{"backgroundColor": "lightgray","fontColor": "black","backgroundOpacity": 0.1})
-
-        else:
-            mpd =info.get_peptide_modification_dict(peptide_list,modifications,nterm)
-
-            if len(mpd.items())==0:
-                pass
-            else:
-            
-                if max_psm>max(mpd.values()):
-                    max_val=max_psm
-                else:
-                    max_val=max(mpd.values())
-                
-                colors = get_mod_freq_colors(freq_vals=mpd,max_val=max_val,c_color=mod_freq_color)
-                
-                for mod_position,mod_count in mpd.items():
-                    viewer.addStyle({"chain": 'A', "resi": mod_position},
-                                            {residue_style: {"color": colors[mod_count], "radius": residue_size}})
-                    if labels=='On':
-                        viewer.addResLabels({"chain": 'A',"resi": mod_position},{"backgroundColor": "lightgray","fontColor": "black","backgroundOpacity": 0.1})
+    # One style call per color and one label call for all sites, so the page size grows with the number of colors
+    site_groups = group_sites_by_color(get_modification_site_colors(peptide_list, modifications, nterm, max_psm, remove_m1, mod_freq_color))
+    for site_color, residues in site_groups:
+        viewer.addStyle({"chain": 'A', "resi": residues},
+                                {residue_style: {"color": site_color, "radius": residue_size}})
+    if labels=='On' and site_groups:
+        labeled = sorted(resi for site_color, residues in site_groups for resi in residues)
+        viewer.addResLabels({"chain": 'A',"resi": labeled},{"backgroundColor": "lightgray","fontColor": "black","backgroundOpacity": 0.1})
     
     #viewer.addSurface(py3Dmol.SAS,{'opacity':0.5,'color':'blue'})  
     if zoomto == None:
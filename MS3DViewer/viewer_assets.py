@@ -0,0 +1,83 @@
+# Standard library imports
+import os
+import sys
+
+# Third-party library imports
+import requests
+from flask import abort, send_from_directory
+
+ASSETS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Assets')
+ASSET_ROUTE = '/viewer-assets'
+MAX_AGE = 365 * 24 * 60 * 60 # asset URLs carry the file's modification time, so browsers may keep them for a year
+DOWNLOAD_TIMEOUT = 60 # seconds
+
+# 3Dmol.js build matching the py3Dmol version in requirements.txt, and where download_viewer_assets fetches it from
+VIEWER_SCRIPT = '3Dmol-min.js'
+VIEWER_SCRIPT_URL = 'https://cdn.jsdelivr.net/npm/3dmol@2.5.5/build/3Dmol-min.js'
+
+
+def get_asset_url(name):
+    """
+    Returns the URL of a file in the Assets folder, versioned by its modification time, or None if it is missing.
+
+    Example:
+    >>> get_asset_url('3Dmol-min.js')
+    '/viewer-assets/3Dmol-min.js?v=1717171717'
+    """
+    path = os.path.join(ASSETS_FOLDER, name)
+    if not os.path.exists(path):
+        return None
+    return f'{ASSET_ROUTE}/{name}?v={int(os.path.getmtime(path))}'
+
+
+def check_viewer_assets():
+    """
+    Checks that 3Dmol.js is in the Assets folder. A missing copy is reported on stderr rather than raised, so the app
+    and the batch report still start; the viewers then stay blank until the file is put back, and the script is
+    never fetched from the CDN instead.
+
+    Returns:
+    - str: The path of the file, or None if it is missing.
+    """
+    path = os.path.join(ASSETS_FOLDER, VIEWER_SCRIPT)
+    if not os.path.exists(path):
+        print(f'ERROR: {path} is missing, the 3D viewers will stay blank. Restore it from the repository, or run '
+              f'"python viewer_assets.py" to download it from {VIEWER_SCRIPT_URL}.', file=sys.stderr)
+        return None
+    return path
+
+
+def get_viewer_script_url():
+    """Returns the URL the viewer pages load 3Dmol.js from, the copy in the Assets folder served by the app."""
+    return get_asset_url(VIEWER_SCRIPT) or f'{ASSET_ROUTE}/{VIEWER_SCRIPT}'
+
+
+def serve_asset(name):
+    """Flask view returning a file from the Assets folder with long-lived cache headers."""
+    if not os.path.exists(os.path.join(ASSETS_FOLDER, name)):
+        abort(404)
+    return send_from_directory(ASSETS_FOLDER, name, max_age=MAX_AGE)
+
+
+def register_asset_route(server):
+    """Adds the viewer asset route to the Flask server of the Dash app, reporting a missing 3Dmol.js at startup."""
+    check_viewer_assets()
+    server.add_url_rule(f'{ASSET_ROUTE}/<path:name>', 'serve_asset', serve_asset)
+
+
+def download_viewer_assets():
+    """
+    Replaces the copy of 3Dmol.js in the Assets folder with the build at VIEWER_SCRIPT_URL. The repository ships
+    the file, so this is only needed after changing the pinned version along with py3Dmol in requirements.txt.
+    """
+    response = requests.get(VIEWER_SCRIPT_URL, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    os.makedirs(ASSETS_FOLDER, exist_ok=True)
+    path = os.path.join(ASSETS_FOLDER, VIEWER_SCRIPT)
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    print(f'Downloaded {path}')
+
+
+if __name__ == '__main__':
+    download_viewer_assets()
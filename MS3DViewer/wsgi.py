@@ -0,0 +1,11 @@
+# Production entry point, for serving the app with several worker processes:
+#     gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8051 wsgi:server
+# Every uploaded workbook is loaded once, by the worker receiving the upload, and saved to the shared_datasets folder
+# as memory-mapped columns. The other workers open it read-only from there instead of loading their own copy.
+
+# Custom module imports
+import MS3Dviewer
+
+MS3Dviewer.enable_shared_datasets()
+app = MS3Dviewer.app
+server = app.server